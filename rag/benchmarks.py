@@ -0,0 +1,105 @@
+"""Benchmarks del RAG contra un controller en marcha (usar una base de prueba: DB_NAME aparte).
+
+Uso:
+    python -m rag.benchmarks seed --tickers 1000 --words 6000 --dim 768
+    python -m rag.benchmarks init BM0001 BM0500 --runs 10
+
+`init` mide la parte de CompanyRAG.__init__ que trae datos del controller:
+    corpus   -> todo /all-docs (NDJSON) + todos los vectores, filtrando por ticker en Python (como antes)
+    ticker   -> CompanyRAG._load_inputs: /document/{ticker} + /embeddings.npy?symbol=
+"""
+import argparse
+import hashlib
+import random
+import statistics
+import time
+
+import numpy as np
+import requests
+
+from rag.controller_client import CONTROLLER_URL, fetch_documents, fetch_embeddings, save_embeddings, stream_rows
+
+EMB_MODEL = "ohsuz/k-finance-sentence-transformer"
+VOCAB = ("revenue", "margin", "growth", "liquidity", "inflation", "supply", "chain", "guidance",
+         "segment", "operating", "income", "cash", "debt", "capital", "fiscal", "quarter")
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<10} median={statistics.median(samples):9.1f}ms  p95={p95:9.1f}ms")
+    return statistics.median(samples)
+
+
+# -------- Corpus sintético --------
+def seed(tickers=1000, words=6000, dim=768, chunk_words=450, prefix="BM"):
+    rng = random.Random(0)
+    created = 0
+    for i in range(1, tickers + 1):
+        sym = f"{prefix}{i:04d}"
+        text = " ".join(rng.choice(VOCAB) for _ in range(words))
+        resp = requests.post(f"{CONTROLLER_URL}/document/", json={
+            "_id": sym, "trend_summary": f"{sym} trend", "table_summary": f"{sym} table",
+            "sec_text_full_clean": text,
+        })
+        if resp.status_code == 400:
+            continue  # ya existe
+        resp.raise_for_status()
+        n = max(1, words // chunk_words)
+        hashes = [hashlib.sha256(f"{sym}:{k}".encode()).hexdigest()[:32] for k in range(n)]
+        vectors = np.random.default_rng(i).standard_normal((n, dim), dtype=np.float32)
+        save_embeddings(sym, EMB_MODEL, hashes, vectors)
+        created += 1
+    print(f"{created} tickers creados ({tickers - created} ya existían)")
+
+
+# -------- CompanyRAG.__init__ (fetch) --------
+def _load_corpus(ticker):
+    docs = [d for d in stream_rows("/all-docs") if d.get("_id") == ticker]
+    ids, matrix = fetch_embeddings(model=EMB_MODEL, ids="chunk_hash")
+    return docs, ids, matrix
+
+
+def _load_ticker(ticker):
+    docs = fetch_documents(ticker)
+    ids, matrix = fetch_embeddings(symbol=ticker, model=EMB_MODEL, ids="chunk_hash")
+    return docs, ids, matrix
+
+
+def bench_init(tickers, runs=10):
+    for ticker in tickers:
+        print(f"--- {ticker} ---")
+        medians = {}
+        for label, fn in (("corpus", _load_corpus), ("ticker", _load_ticker)):
+            fn(ticker)  # warm-up
+            samples = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                fn(ticker)
+                samples.append((time.perf_counter() - t0) * 1000.0)
+            medians[label] = _report(label, samples)
+        print(f"{'speedup':<10} x{medians['corpus'] / max(medians['ticker'], 1e-9):.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("seed", help="corpus sintético de N tickers (documento + vectores)")
+    s.add_argument("--tickers", type=int, default=1000)
+    s.add_argument("--words", type=int, default=6000)
+    s.add_argument("--dim", type=int, default=768)
+
+    i = sub.add_parser("init", help="fetch de CompanyRAG: corpus completo vs un ticker")
+    i.add_argument("tickers", nargs="+")
+    i.add_argument("--runs", type=int, default=10)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "seed":
+        seed(args.tickers, args.words, args.dim)
+    else:
+        bench_init([t.upper() for t in args.tickers], runs=args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import hashlib
+
+# Chunking y llaves de los vectores, sin dependencias pesadas: lo usan summary_company
+# (que carga el modelo) y vector_index build (que solo lee vectores ya guardados).
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMB_MODEL = "ohsuz/k-finance-sentence-transformer"
+
+
+def chunk_text(text):
+    words = text.split()
+    chunks = []
+    step = max(1, CHUNK_SIZE - CHUNK_OVERLAP)
+    for i in range(0, len(words), step):
+        chunks.append(" ".join(words[i:i+CHUNK_SIZE]))
+    return chunks
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def doc_hash(text):
+    # Mismo cálculo que services.repository.doc_hash (el controller lo compara al servir el summary)
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:32]
+
+
+__all__ = ["chunk_text", "chunk_hash", "doc_hash", "CHUNK_SIZE", "CHUNK_OVERLAP", "EMB_MODEL"]
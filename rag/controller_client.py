@@ -0,0 +1,90 @@
+import os
+import io
+import json
+import base64
+
+import numpy as np
+import requests
+
+# Acceso del RAG al controller: documentos y vectores de UN ticker por request.
+CONTROLLER_URL = os.getenv("CONTROLLER_URL", "http://controller:8100")
+HTTP_TIMEOUT = float(os.getenv("CONTROLLER_TIMEOUT", "60"))
+
+_session = requests.Session()
+
+
+def _get(path, **kwargs):
+    return _session.get(f"{CONTROLLER_URL}{path}", timeout=HTTP_TIMEOUT, **kwargs)
+
+
+def stream_rows(path, **params):
+    # NDJSON de /all-docs o /all-embeddings: una fila a la vez
+    params = {"format": "ndjson", **params}
+    with _get(path, params=params, stream=True) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"Error al obtener {path}: {resp.status_code} {resp.text}")
+        for line in resp.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def fetch_documents(ticker):
+    # Lectura por _id en el controller: el costo no depende del tamaño del corpus
+    resp = _get(f"/document/{ticker}")
+    if resp.status_code != 200:
+        raise RuntimeError(f"Error al obtener documento: {resp.status_code} {resp.text}")
+    data = resp.json()
+    return [data["document"]] if data.get("exists") else []
+
+
+def fetch_embeddings(**params):
+    # .npy float32 paginado: cada página es una vista sobre el cuerpo HTTP (np.frombuffer, sin copia)
+    ids, pages = [], []
+    while True:
+        resp = _get("/embeddings.npy", params=params)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Error al obtener embeddings: {resp.status_code} {resp.text}")
+        buf = io.BytesIO(resp.content)
+        np.lib.format.read_magic(buf)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(buf)
+        pages.append(np.frombuffer(resp.content, dtype=dtype, offset=buf.tell()).reshape(shape))
+        ids.extend(json.loads(resp.headers.get("X-Embedding-Ids", "[]")))
+        params["after"] = resp.headers.get("X-Next-After")
+        if not params["after"]:
+            break
+    # Solo se copia si hubo más de una página (la última puede venir vacía)
+    return ids, pages[0] if len(pages) == 1 else np.concatenate([p for p in pages if p.size])
+
+
+def save_embeddings(ticker, model, hashes, vectors):
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    resp = _session.post(f"{CONTROLLER_URL}/embeddings/{ticker}", timeout=HTTP_TIMEOUT, json={
+        "model": model,
+        "hashes": hashes,
+        "dim": int(vectors.shape[1]),
+        "vectors": base64.b64encode(vectors.tobytes()).decode("ascii"),
+    })
+    if resp.status_code != 200:
+        raise RuntimeError(f"{resp.status_code} {resp.text}")
+
+
+def fetch_summary(ticker, prompt_version, model):
+    # {"summary", "fresh", ...}: fresh = mismo doc_hash, prompt_version y model
+    resp = _get(f"/analysis/{ticker}/summary", params={"prompt_version": prompt_version, "model": model})
+    if resp.status_code != 200:
+        raise RuntimeError(f"Error al obtener summary: {resp.status_code} {resp.text}")
+    return resp.json()
+
+
+def save_summary(ticker, summary, doc_hash, prompt_version, model):
+    resp = _session.put(f"{CONTROLLER_URL}/analysis/{ticker}/summary", timeout=HTTP_TIMEOUT, json={
+        "summary": summary, "doc_hash": doc_hash, "prompt_version": prompt_version, "model": model,
+    })
+    if resp.status_code != 200:
+        raise RuntimeError(f"{resp.status_code} {resp.text}")
+
+
+__all__ = [
+    "CONTROLLER_URL", "stream_rows", "fetch_documents", "fetch_embeddings", "save_embeddings",
+    "fetch_summary", "save_summary",
+]
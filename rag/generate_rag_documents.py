@@ -107,17 +107,36 @@ class CompanyRAGDocument:
     def load_dashboard_data(self):
         try:
             url = self.url
-            resp = requests.get(url)
+            resp = requests.get(url, params={"format": "raw"})
             if resp.status_code != 200:
                 raise ValueError(f"Error fetching data from API: {resp.status_code}")
             data = resp.json()
             self.overview_data = data.get('overview', {})
-            self.income_data = data.get('income', {})
-            self.margins_data = data.get('margins', {})
-            self.ratios_data = data.get('ratios', {})
+            self.income_data = self._rows_by_year(data.get('income'))
+            self.margins_data = self._rows_by_year(data.get('margins'))
+            self.ratios_data = self._rows_by_year(data.get('ratios'))
         except Exception as e:
             raise ValueError(f"Error fetching dashboard data: {e}")
 
+    @staticmethod
+    def _rows_by_year(table):
+        # Tabla raw {"years": [...], "series": {...}} -> {año: {métrica: número}}
+        if not isinstance(table, dict) or not table.get("years"):
+            return {}
+        series = table.get("series") or {}
+        return {
+            year: {name: col[i] for name, col in series.items()}
+            for i, year in enumerate(table["years"])
+        }
+
+    @staticmethod
+    def _money(v):
+        return f"${(v or 0):,.0f}"
+
+    @staticmethod
+    def _pct(v):
+        return f"{(v or 0):.2f} %"
+
     def generate_trend_summarys(self):
         if not self.income_data:
             return
@@ -131,14 +150,16 @@ class CompanyRAGDocument:
         summary += "Financial trends:\n\n"
 
         for year in years:
-            rev = income[year]['Annual Revenue']
-            rev_growth = float(income[year]['Annual Revenue Growth (%)'].replace('%',''))
-            net = income[year]['Net Income']
-            net_growth = float(income[year]['Net Income Growth (%)'].replace('%',''))
-            gross = float(margins[year]['Gross Margin (%)'].replace('%',''))
-            oper = float(margins[year]['Operating Margin (%)'].replace('%',''))
-            roe = float(ratios[year]['ROE (%)'].replace('%',''))
-            roa = float(ratios[year]['ROA (%)'].replace('%',''))
+            m = margins.get(year, {})
+            r = ratios.get(year, {})
+            rev = self._money(income[year]['Annual Revenue'])
+            rev_growth = income[year]['Annual Revenue Growth (%)'] or 0.0
+            net = self._money(income[year]['Net Income'])
+            net_growth = income[year]['Net Income Growth (%)'] or 0.0
+            gross = m.get('Gross Margin (%)') or 0.0
+            oper = m.get('Operating Margin (%)') or 0.0
+            roe = r.get('ROE (%)') or 0.0
+            roa = r.get('ROA (%)') or 0.0
 
             if rev_growth > 10 and net_growth > 10:
                 growth_comment = "Strong growth in both revenue and net income."
@@ -166,12 +187,15 @@ class CompanyRAGDocument:
 
         summary = f"{overview.get('Name', self.symbol)} ({overview.get('Ticket','')})\n\n"
         for year in years:
+            i = income[year]
+            m = margins.get(year, {})
+            r = ratios.get(year, {})
             summary += (f"{year}:\n"
-                        f"  Revenue: {income[year]['Annual Revenue']} ({income[year]['Annual Revenue Growth (%)']})\n"
-                        f"  Net Income: {income[year]['Net Income']} ({income[year]['Net Income Growth (%)']})\n"
-                        f"  Gross Margin: {margins[year]['Gross Margin (%)']}\n"
-                        f"  Operating Margin: {margins[year]['Operating Margin (%)']}\n"
-                        f"  ROE: {ratios[year]['ROE (%)']}, ROA: {ratios[year]['ROA (%)']}\n\n")
+                        f"  Revenue: {self._money(i['Annual Revenue'])} ({self._pct(i['Annual Revenue Growth (%)'])})\n"
+                        f"  Net Income: {self._money(i['Net Income'])} ({self._pct(i['Net Income Growth (%)'])})\n"
+                        f"  Gross Margin: {self._pct(m.get('Gross Margin (%)'))}\n"
+                        f"  Operating Margin: {self._pct(m.get('Operating Margin (%)'))}\n"
+                        f"  ROE: {self._pct(r.get('ROE (%)'))}, ROA: {self._pct(r.get('ROA (%)'))}\n\n")
         self.table_summary = summary
 
     # ---------- Helpers SEC ----------
@@ -280,6 +304,13 @@ class CompanyRAGDocument:
 
         if response.status_code == 200:
             print(f"Document saved in MongoDB for {self.symbol}")
+            # Embeddings + índice del corpus al guardar: /search lo encuentra sin esperar un summary
+            try:
+                from .summary_company import index_document
+                n = index_document(self.symbol, self.sec_text_full_clean)
+                print(f"Indexed {n} chunks for {self.symbol}")
+            except Exception as e:
+                print(f"Failed to index document for {self.symbol}: {e}")
         else:
             print(f"Failed to save document for {self.symbol}. Status code: {response.status_code}")
             try:
@@ -3,18 +3,20 @@ import os
 import time
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from .summary_company import CompanyRAG
+from .summary_company import embedding_service, generate_summary, stored_summary
+from .vector_index import corpus_index
 from .generate_rag_documents import CompanyRAGDocument
 from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 start_time = time.time()
 print(f"[{time.strftime('%X')}] Starting initialization of models and data...")
 
 ticker = "AAPL"
 doc = CompanyRAGDocument(ticker)
-rag = CompanyRAG(ticker)
+if not stored_summary(ticker):
+    generate_summary(ticker)
 
 end_time = time.time()
 elapsed = end_time - start_time
@@ -26,26 +28,61 @@ app = FastAPI(title="Company RAG API")
 class RAGSummaryResponse(BaseModel):
     ticker: str
     summary: str
+    cached: bool = False
+
+class SearchHit(BaseModel):
+    ticker: str
+    chunk_hash: str
+    score: float
+    text: str
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit]
     
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/embedding/stats")
+def embedding_stats():
+    return embedding_service.stats()
+
+@app.get("/search", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=2, description="Consulta libre, p.ej. supply-chain inflation"),
+    k: int = Query(10, ge=1, le=100),
+    tickers: Optional[str] = Query(None, description="Filtro opcional, separados por coma"),
+):
+    query_emb = embedding_service.encode([q])
+    allowed = [t.strip() for t in tickers.split(",") if t.strip()] if tickers else None
+    hits = corpus_index.search(query_emb, k=k, tickers=allowed)[0]
+    return {"query": q, "hits": hits}
+
 @app.get("/company_rag", response_model=RAGSummaryResponse)
-def get_company_rag_summary(ticker: str = Query(..., description="Ticker de la compañía, p.ej. AAPL")):
+def get_company_rag_summary(
+    ticker: str = Query(..., description="Ticker de la compañía, p.ej. AAPL"),
+    refresh: bool = Query(False, description="Ignora el summary guardado y lo regenera"),
+):
 
     ticker = ticker.upper()
 
+    # Se sirve desde analysis si (documento, prompt, modelo) no cambiaron
+    if not refresh:
+        summary = stored_summary(ticker)
+        if summary:
+            return {"ticker": ticker, "summary": summary, "cached": True}
+
     try:
         doc = CompanyRAGDocument(ticker)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
     try:
-        rag = CompanyRAG(ticker)
         return {
             "ticker": ticker,
-            "summary": rag.summary
+            "summary": generate_summary(ticker),
+            "cached": False,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
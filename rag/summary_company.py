@@ -1,21 +1,30 @@
 import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import faiss
 import torch
 from tqdm import tqdm
 from openai import OpenAI
-import requests
-from services.db import *
+from .chunking import EMB_MODEL, chunk_hash, chunk_text, doc_hash
+from .controller_client import fetch_documents, fetch_embeddings, fetch_summary, save_embeddings, save_summary
+from .vector_index import corpus_index
 
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 # ===================== Config =====================
 BATCH_SIZE = 16
-CHUNK_SIZE = 500
-CHUNK_OVERLAP = 50
-EMB_MODEL = "ohsuz/k-finance-sentence-transformer"
+LLM_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+# Subir al cambiar el prompt, el chunking o el retrieval: invalida los summaries guardados
+PROMPT_VERSION = os.getenv("RAG_PROMPT_VERSION", "1")
+# Micro-batching: las llamadas concurrentes a encode se juntan durante EMB_BATCH_WINDOW_MS
+EMB_BATCH_WINDOW_MS = float(os.getenv("EMB_BATCH_WINDOW_MS", "10"))
+EMB_MAX_BATCH = int(os.getenv("EMB_MAX_BATCH", "256"))            # textos por pasada del modelo
+EMB_ENCODE_BATCH_SIZE = int(os.getenv("EMB_ENCODE_BATCH_SIZE", "64"))
 
 HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 if HUGGINGFACE_TOKEN:
@@ -31,21 +40,198 @@ embed_model = SentenceTransformer(
     use_auth_token=HUGGINGFACE_TOKEN
 )
 
+
+def _percentile_ms(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] * 1000.0
+
+
+class _EncodeRequest:
+    __slots__ = ("texts", "future", "enqueued", "offset", "parts", "encoded")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.offset = 0        # próximo texto sin tomar por un lote
+        self.parts = {}        # inicio del slice -> vectores
+        self.encoded = 0
+
+    def pending(self):
+        return len(self.texts) - self.offset
+
+
+class EmbeddingService:
+    """Un solo hilo usa el modelo: junta los pedidos pendientes (chunks y queries) en lotes grandes.
+
+    submit() devuelve un Future con float32 [len(texts), dim] normalizado. Un pedido con más de
+    max_batch textos se codifica en slices y vuelve al final de la cola entre uno y otro, así una
+    query no espera a que termine un documento entero.
+    """
+
+    def __init__(self, model, window_ms=EMB_BATCH_WINDOW_MS, max_batch=EMB_MAX_BATCH,
+                 encode_batch_size=EMB_ENCODE_BATCH_SIZE):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.encode_batch_size = encode_batch_size
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        # Métricas
+        self._started = time.time()
+        self.requests = self.texts = self.batches = 0
+        self.busy = 0.0
+        self._waits = deque(maxlen=1000)
+
+    def submit(self, texts):
+        req = _EncodeRequest(list(texts))
+        if not req.texts:
+            req.future.set_result(np.empty((0, self.model.get_sentence_embedding_dimension()), dtype="float32"))
+            return req.future
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                self._thread.start()
+            self._queue.append(req)
+            self._cond.notify()
+        return req.future
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Espera la ventana desde el pedido más viejo, salvo que ya se llenó el lote
+            deadline = self._queue[0].enqueued + self.window
+            while sum(r.pending() for r in self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # (pedido, inicio, fin): a lo sumo max_batch textos; el pedido que no entra completo
+            # aporta un slice y pasa al final de la cola (round-robin con los demás)
+            batch, size = [], 0
+            while self._queue and size < self.max_batch:
+                req = self._queue.popleft()
+                if req.future.done():   # falló un slice anterior
+                    continue
+                start = req.offset
+                end = start + min(req.pending(), self.max_batch - size)
+                req.offset = end
+                batch.append((req, start, end))
+                size += end - start
+                if req.pending():
+                    self._queue.append(req)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            t0 = time.perf_counter()
+            texts = [t for req, start, end in batch for t in req.texts[start:end]]
+            if not texts:
+                continue
+            try:
+                vectors = self.model.encode(
+                    texts, batch_size=self.encode_batch_size, convert_to_numpy=True, normalize_embeddings=True
+                ).astype("float32", copy=False)
+            except Exception as e:
+                for req, _, _ in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - t0
+            offset, completed = 0, 0
+            for req, start, end in batch:
+                req.parts[start] = vectors[offset:offset + end - start]
+                req.encoded += end - start
+                offset += end - start
+                if req.encoded == len(req.texts) and not req.future.done():
+                    # Un solo slice: vista sobre el lote, sin copia
+                    parts = [req.parts[k] for k in sorted(req.parts)]
+                    req.future.set_result(parts[0] if len(parts) == 1 else np.concatenate(parts))
+                    req.parts = {}
+                    completed += 1
+            with self._cond:
+                self.requests += completed
+                self.texts += len(texts)
+                self.batches += 1
+                self.busy += elapsed
+                self._waits.extend(t0 - req.enqueued for req, start, _ in batch if start == 0)
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            pending = sum(r.pending() for r in self._queue)
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "avg_batch": self.texts / self.batches if self.batches else 0.0,
+                "texts_per_s_busy": self.texts / self.busy if self.busy else 0.0,
+                "texts_per_s_wall": self.texts / max(time.time() - self._started, 1e-9),
+                "utilization": self.busy / max(time.time() - self._started, 1e-9),
+                "queue_wait_ms_p50": _percentile_ms(waits, 0.5),
+                "queue_wait_ms_p95": _percentile_ms(waits, 0.95),
+                "pending_texts": pending,
+            }
+
+
+embedding_service = EmbeddingService(embed_model)
+
+
+def embed_chunks(ticker, batch_texts, emb_ids, emb_matrix, *, verbose=False):
+    """Vectores de los chunks en orden. Solo codifica los que no están en emb_col, los guarda
+    en el controller y agrega al índice del corpus los que aún no están."""
+    hashes = [chunk_hash(t) for t in batch_texts]
+    stored = {h: i for i, h in enumerate(emb_ids)}
+    # Solo se codifican los chunks que no están en emb_col (una vez por hash)
+    missing = list(dict.fromkeys(h for h in hashes if h not in stored))
+    fresh = {}
+    if missing:
+        text_by_hash = dict(zip(hashes, batch_texts))
+        vectors = embedding_service.encode([text_by_hash[h] for h in missing])
+        fresh = dict(zip(missing, vectors))
+        try:
+            save_embeddings(ticker, EMB_MODEL, missing, vectors)
+        except Exception as e:
+            print(f"[RAG] No se guardaron los embeddings de {ticker}: {e}")
+    if verbose:
+        print(f"[RAG] {len(hashes) - len(missing)} chunks reutilizados, {len(missing)} codificados")
+
+    embeddings = np.stack([
+        fresh[h] if h in fresh else emb_matrix[stored[h]] for h in hashes
+    ]).astype("float32", copy=False)
+
+    # Índice de todo el corpus (/search): solo entran los chunks que aún no están
+    try:
+        corpus_index.add(ticker, hashes, embeddings, batch_texts)
+    except Exception as e:
+        print(f"[RAG] No se actualizó el índice del corpus para {ticker}: {e}")
+    return embeddings
+
+
+def index_document(ticker, text):
+    # Al guardar un documento nuevo: vectores en emb_col + índice del corpus, sin esperar un summary
+    chunks = chunk_text(text or "")
+    if not chunks:
+        return 0
+    emb_ids, emb_matrix = fetch_embeddings(symbol=ticker.upper(), model=EMB_MODEL, ids="chunk_hash")
+    embed_chunks(ticker.upper(), chunks, emb_ids, emb_matrix)
+    return len(chunks)
+
+
 class CompanyRAG:
     def __init__(self, ticker: str, *, verbose: bool = False):
         
         self.ticker = ticker.upper()
         self.verbose = verbose 
-        self.docs_api = requests.get("http://controller:8100/all-docs")
-        self.emb_api = requests.get("http://controller:8100/all-embeddings")
-
-        if self.docs_api.status_code != 200:
-            raise RuntimeError(f"Error al obtener documentos: {self.docs_api.status_code} {self.docs_api.text}")
-        if self.emb_api.status_code != 200:
-            raise RuntimeError(f"Error al obtener embeddings: {self.emb_api.status_code} {self.emb_api.text}")
-
-        self.docs_col = self.docs_api.json().get("documents", [])
-        self.emb_col = self.emb_api.json().get("embeddings", [])
+        self._load_inputs()
 
         self.embed_model = embed_model
         self.texts = []
@@ -54,14 +240,17 @@ class CompanyRAG:
 
         self.summary = self._run_pipeline()
 
+    # ------- datos del ticker -------
+    def _load_inputs(self):
+        # Solo el documento y los vectores de este ticker (antes: todo el corpus por HTTP)
+        self.docs_col = fetch_documents(self.ticker)
+        self.doc_hash = doc_hash(self.docs_col[0].get("sec_text_full_clean", "")) if self.docs_col else None
+        # Vectores ya guardados para (ticker, modelo), indexados por hash de chunk
+        self.emb_ids, self.emb_matrix = fetch_embeddings(symbol=self.ticker, model=EMB_MODEL, ids="chunk_hash")
+
     # ------- utils -------
     def chunk_text(self, text):
-        words = text.split()
-        chunks = []
-        step = max(1, CHUNK_SIZE - CHUNK_OVERLAP)
-        for i in range(0, len(words), step):
-            chunks.append(" ".join(words[i:i+CHUNK_SIZE]))
-        return chunks
+        return chunk_text(text)
 
     # ------- emb + index -------
     def process_embeddings_in_memory(self):
@@ -78,11 +267,13 @@ class CompanyRAG:
             chunks = self.chunk_text(text)
             batch_texts.extend(chunks)
 
-        if batch_texts:
-            self.embeddings = self.embed_model.encode(
-                batch_texts, convert_to_numpy=True, normalize_embeddings=True
-            ).astype("float32")
-            self.texts = batch_texts
+        if not batch_texts:
+            return
+
+        self.embeddings = embed_chunks(
+            self.ticker, batch_texts, self.emb_ids, self.emb_matrix, verbose=self.verbose,
+        )
+        self.texts = batch_texts
 
     def build_faiss_in_memory(self):
         if self.embeddings is None or len(self.embeddings) == 0:
@@ -96,12 +287,12 @@ class CompanyRAG:
     def retrieve(self, query, top_k=5):
         if self.index is None:
             raise ValueError("El índice FAISS no está construido")
-        query_emb = self.embed_model.encode([query], convert_to_numpy=True, normalize_embeddings=True).astype("float32")
+        query_emb = embedding_service.encode([query])
         distances, indices = self.index.search(query_emb, top_k)
         return [self.texts[i] for i in indices[0]]
 
     # ------- LLM -------
-    def summarize_with_deepseek(self, prompt, model="deepseek-chat"):
+    def summarize_with_deepseek(self, prompt, model=LLM_MODEL):
         if not DEEPSEEK_API_KEY:
             raise RuntimeError("DEEPSEEK_API_KEY no configurada")
         messages = [
@@ -130,11 +321,24 @@ class CompanyRAG:
         return self.rag_summary(query)
 
 # ============= Helper público para el dashboard =============
+def stored_summary(symbol: str):
+    """Summary de analysis si su llave (doc_hash, PROMPT_VERSION, LLM_MODEL) sigue vigente; si no, None."""
+    try:
+        rec = fetch_summary(symbol.upper(), PROMPT_VERSION, LLM_MODEL)
+    except Exception as e:
+        print(f"[RAG] No se pudo leer el summary guardado de {symbol}: {e}")
+        return None
+    return rec["summary"] if rec.get("fresh") and rec.get("summary") else None
+
+
 def generate_summary(symbol: str, *, persist: bool = True, verbose: bool = False) -> str:
-    summary = CompanyRAG(symbol, verbose=verbose).summary
-    if persist:
-        db["analysis"].update_one({"symbol": symbol.upper()}, {"$set": {"summary": summary}}, upsert=True)
-    return summary
+    rag = CompanyRAG(symbol, verbose=verbose)
+    if persist and rag.doc_hash:
+        try:
+            save_summary(rag.ticker, rag.summary, rag.doc_hash, PROMPT_VERSION, LLM_MODEL)
+        except Exception as e:
+            print(f"[RAG] No se guardó el summary de {rag.ticker}: {e}")
+    return rag.summary
 
 
 if __name__ == "__main__":
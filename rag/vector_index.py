@@ -0,0 +1,336 @@
+"""Índice vectorial de todo el corpus (HNSW + IDMap2) persistido en disco.
+
+Uso:
+    python -m rag.vector_index build    # (re)carga todos los tickers guardados en el controller
+    python -m rag.vector_index merge    # pasa el delta pendiente al HNSW
+    python -m rag.vector_index stats
+
+Los vectores están normalizados: producto interno = coseno. Cada chunk tiene un id
+int64 derivado de (ticker, hash): el mismo párrafo (p.ej. boilerplate de la SEC) en dos
+compañías son dos entradas. ticker / hash / texto viven en un SQLite al lado del índice
+para filtrar por ticker (IDSelectorBatch) y devolver el texto en /search.
+
+add() solo escribe en el SQLite: los vectores nuevos quedan en un delta (merged = 0) que
+search() recorre por fuerza bruta junto al HNSW. merge() los pasa al HNSW en lote (una
+reescritura del archivo por merge, no por add): por CLI, al final de build, o en un hilo
+de fondo al superar INDEX_DELTA_MAX (el request que agrega no espera la inserción en el HNSW).
+"""
+import os
+import sys
+import fcntl
+import hashlib
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import faiss
+
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(__file__), "index"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "128"))
+INDEX_DELTA_MAX = int(os.getenv("RAG_INDEX_DELTA_MAX", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id         INTEGER PRIMARY KEY,
+    ticker     TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    text       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_ticker ON chunks (ticker);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO state (key, value) VALUES ('delta_version', 0);
+"""
+# Delta: vector float32 mientras no esté en el HNSW. Las filas anteriores a estas columnas ya están indexadas.
+_DELTA_COLUMNS = ("vector BLOB", "merged INTEGER NOT NULL DEFAULT 1")
+_DELTA_INDEX = "CREATE INDEX IF NOT EXISTS chunks_delta ON chunks (id) WHERE merged = 0"
+
+# mmap de los vectores (IndexFlatCodes) si la versión de faiss lo soporta; si no, lectura normal
+_MMAP_FLAGS = [
+    f for f in (getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if f is not None
+]
+
+
+def chunk_id(ticker, chunk_hash):
+    # 60 bits de sha256(ticker:hash): int64 positivo, estable entre procesos
+    return int(hashlib.sha256(f"{ticker.upper()}:{chunk_hash}".encode("utf-8")).hexdigest()[:15], 16)
+
+
+def _matrix(blobs):
+    return np.frombuffer(b"".join(blobs), dtype="<f4").reshape(len(blobs), -1)
+
+
+class CorpusIndex:
+    def __init__(self, directory=INDEX_DIR):
+        self.directory = directory
+        # v2: ids por (ticker, hash); los archivos v1 (id solo por hash) se ignoran, reconstruir con build
+        self.index_path = os.path.join(directory, "corpus_v2.faiss")
+        self.meta_path = os.path.join(directory, "corpus_meta_v2.sqlite3")
+        self.lock_path = os.path.join(directory, ".lock")
+        self._index = None
+        self._mtime = None
+        self._delta = None   # (delta_version, ids, tickers, vectores)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._merging = threading.Event()
+
+    # ------- almacenamiento -------
+    def _meta(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.meta_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            for column in _DELTA_COLUMNS:
+                try:
+                    # Archivos creados antes del delta
+                    conn.execute(f"ALTER TABLE chunks ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass
+            conn.execute(_DELTA_INDEX)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        meta = self._meta()
+        meta.execute("BEGIN IMMEDIATE")
+        try:
+            yield meta
+        except BaseException:
+            meta.execute("ROLLBACK")
+            raise
+        meta.execute("COMMIT")
+
+    @contextmanager
+    def _file_lock(self):
+        # Un merge a la vez entre procesos (workers de uvicorn, CLI build/merge)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read(self, writable=False):
+        if not writable:
+            for flags in _MMAP_FLAGS:
+                try:
+                    return faiss.read_index(self.index_path, flags)
+                except RuntimeError:
+                    continue
+        return faiss.read_index(self.index_path)
+
+    def _current(self):
+        # Recarga si otro proceso reemplazó el archivo (os.replace cambia el mtime)
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._index is None or mtime != self._mtime:
+                self._index, self._mtime = self._read(), mtime
+            return self._index
+
+    def _current_delta(self):
+        # Se relee entero solo si cambió delta_version (add o merge de cualquier proceso)
+        meta = self._meta()
+        version = meta.execute("SELECT value FROM state WHERE key = 'delta_version'").fetchone()[0]
+        with self._lock:
+            if self._delta is not None and self._delta[0] == version:
+                return self._delta[1:]
+        rows = meta.execute("SELECT id, ticker, vector FROM chunks WHERE merged = 0").fetchall()
+        delta = (
+            version,
+            np.fromiter((r[0] for r in rows), dtype="int64", count=len(rows)),
+            np.array([r[1] for r in rows], dtype=object),
+            _matrix([r[2] for r in rows]) if rows else None,
+        )
+        with self._lock:
+            self._delta = delta
+        return delta[1:]
+
+    def _new_index(self, dim):
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    # ------- escritura -------
+    def add(self, ticker, hashes, vectors, texts):
+        """Agrega al delta los chunks que aún no están; devuelve cuántos se agregaron.
+
+        Metadatos y vector entran en la misma transacción: el HNSW nunca tiene un id sin su fila.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        ticker = ticker.upper()
+        rows = [
+            (chunk_id(ticker, h), ticker, h, t, vectors[i].tobytes())
+            for i, (h, t) in enumerate(zip(hashes, texts))
+        ]
+        with self._transaction() as meta:
+            before = meta.total_changes
+            meta.executemany(
+                "INSERT OR IGNORE INTO chunks (id, ticker, chunk_hash, text, vector, merged) VALUES (?, ?, ?, ?, ?, 0)",
+                rows,
+            )
+            added = meta.total_changes - before
+            if added:
+                meta.execute("UPDATE state SET value = value + 1 WHERE key = 'delta_version'")
+        if added and self.delta_size() >= INDEX_DELTA_MAX and not self._merging.is_set():
+            self._merging.set()
+            threading.Thread(target=self._background_merge, name="corpus-merge", daemon=True).start()
+        return added
+
+    def _background_merge(self):
+        try:
+            self.merge()
+        except Exception as e:
+            print(f"[RAG] merge del índice del corpus falló: {e}")
+        finally:
+            self._merging.clear()
+
+    def delta_size(self):
+        return self._meta().execute("SELECT COUNT(*) FROM chunks WHERE merged = 0").fetchone()[0]
+
+    def merge(self):
+        """Pasa el delta al HNSW (una lectura + escritura del archivo); devuelve cuántos vectores entraron."""
+        with self._file_lock():
+            meta = self._meta()
+            rows = meta.execute("SELECT id, vector FROM chunks WHERE merged = 0").fetchall()
+            if not rows:
+                return 0
+            ids = np.fromiter((r[0] for r in rows), dtype="int64", count=len(rows))
+            vectors = _matrix([r[1] for r in rows])
+
+            index = self._read(writable=True) if os.path.exists(self.index_path) else self._new_index(vectors.shape[1])
+            if index.d != vectors.shape[1]:
+                raise ValueError(f"dimensión {vectors.shape[1]} != {index.d} del índice")
+            # Reconciliación: un merge cortado entre os.replace y el UPDATE dejó ids ya indexados con merged = 0
+            new = ~np.isin(ids, faiss.vector_to_array(index.id_map)) if index.ntotal else np.ones(len(ids), bool)
+            if new.any():
+                index.add_with_ids(vectors[new], ids[new])
+                # Escritura atómica: los lectores con el archivo anterior mapeado no se ven afectados
+                tmp = f"{self.index_path}.tmp{os.getpid()}"
+                faiss.write_index(index, tmp)
+                os.replace(tmp, self.index_path)
+
+            with self._transaction() as meta:
+                meta.executemany(
+                    "UPDATE chunks SET merged = 1, vector = NULL WHERE id = ?", [(int(i),) for i in ids],
+                )
+                meta.execute("UPDATE state SET value = value + 1 WHERE key = 'delta_version'")
+        return int(new.sum())
+
+    # ------- lectura -------
+    def search(self, query_vectors, k=10, tickers=None, ef_search=HNSW_EF_SEARCH):
+        """Una lista de hits por consulta: {ticker, chunk_hash, score, text}."""
+        queries = np.ascontiguousarray(np.atleast_2d(query_vectors), dtype="float32")
+        if tickers:
+            tickers = [t.upper() for t in tickers]
+        best = [{} for _ in queries]   # id -> score por consulta (HNSW y delta pueden repetir un id)
+
+        index = self._current()
+        if index is not None and index.ntotal:
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = max(ef_search, k)
+            selector = None
+            allowed = None
+            if tickers:
+                allowed = [r[0] for r in self._meta().execute(
+                    f"SELECT id FROM chunks WHERE merged = 1 AND ticker IN ({','.join('?' * len(tickers))})",
+                    tickers)]
+                if allowed:
+                    # El selector debe vivir mientras dure search()
+                    selector = faiss.IDSelectorBatch(np.asarray(allowed, dtype="int64"))
+                    params.sel = selector
+            if not tickers or allowed:
+                scores, ids = index.search(queries, k, params=params)
+                for q, (row_scores, row_ids) in enumerate(zip(scores, ids)):
+                    best[q].update((int(i), float(s)) for s, i in zip(row_scores, row_ids) if i >= 0)
+
+        delta_ids, delta_tickers, delta_vectors = self._current_delta()
+        if delta_vectors is not None:
+            if tickers:
+                keep = np.isin(delta_tickers, tickers)
+                delta_ids, delta_vectors = delta_ids[keep], delta_vectors[keep]
+            if len(delta_ids):
+                sims = queries @ delta_vectors.T
+                top = np.argpartition(-sims, min(k, len(delta_ids)) - 1, axis=1)[:, :k]
+                for q in range(len(queries)):
+                    for j in top[q]:
+                        cid, score = int(delta_ids[j]), float(sims[q, j])
+                        if score > best[q].get(cid, -np.inf):
+                            best[q][cid] = score
+
+        ranked = [sorted(b.items(), key=lambda item: -item[1])[:k] for b in best]
+        found = list({cid for hits in ranked for cid, _ in hits})
+        meta = {}
+        for i in range(0, len(found), 500):
+            batch = found[i:i + 500]
+            meta.update((r[0], r[1:]) for r in self._meta().execute(
+                f"SELECT id, ticker, chunk_hash, text FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                batch))
+        results = []
+        for hits in ranked:
+            results.append([
+                {"ticker": meta[cid][0], "chunk_hash": meta[cid][1], "score": score, "text": meta[cid][2]}
+                for cid, score in hits if cid in meta
+            ])
+        return results
+
+    def stats(self):
+        index = self._current()
+        tickers = self._meta().execute("SELECT COUNT(DISTINCT ticker) FROM chunks").fetchone()[0]
+        delta = self.delta_size()
+        return {"vectors": (index.ntotal if index is not None else 0) + delta, "delta": delta, "tickers": tickers}
+
+
+corpus_index = CorpusIndex()
+
+
+# ------- CLI -------
+def build():
+    # No codifica: solo indexa los vectores ya guardados en el controller (los textos salen del chunking)
+    from .controller_client import fetch_documents, fetch_embeddings, stream_rows
+    from .chunking import EMB_MODEL, chunk_hash, chunk_text
+
+    added = 0
+    for row in stream_rows("/all-docs", fields="ids"):
+        ticker = row["_id"]
+        texts = {}
+        for doc in fetch_documents(ticker):
+            for chunk in chunk_text(doc.get("sec_text_full_clean", "")):
+                texts[chunk_hash(chunk)] = chunk
+        ids, matrix = fetch_embeddings(symbol=ticker, model=EMB_MODEL, ids="chunk_hash")
+        rows = [i for i, h in enumerate(ids) if h in texts]
+        if rows:
+            n = corpus_index.add(ticker, [ids[i] for i in rows], matrix[rows], [texts[ids[i]] for i in rows])
+            added += n
+            print(f"{ticker:<8} +{n}")
+    print(f"total +{added}, merged {corpus_index.merge()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cmd", choices=["build", "merge", "stats"])
+    args = parser.parse_args(argv)
+    if args.cmd == "build":
+        build()
+    elif args.cmd == "merge":
+        print(f"merged {corpus_index.merge()}")
+    else:
+        print(corpus_index.stats())
+    return 0
+
+
+__all__ = ["corpus_index", "CorpusIndex", "chunk_id"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .db import DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+from .metrics import mongo_listener
+
+# Pool propio para los handlers async; el cliente sync de db.py sigue atendiendo hilos de fondo
+ASYNC_MONGO_MAX_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MAX_POOL_SIZE", str(MONGO_MAX_POOL_SIZE)))
+ASYNC_MONGO_MIN_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MIN_POOL_SIZE", str(MONGO_MIN_POOL_SIZE)))
+
+async_client = AsyncIOMotorClient(
+    os.getenv("MONGODB_URI"),
+    maxPoolSize=ASYNC_MONGO_MAX_POOL_SIZE,
+    minPoolSize=ASYNC_MONGO_MIN_POOL_SIZE,
+    event_listeners=[mongo_listener],
+)
+adb = async_client[DB_NAME]
+
+DOCS_COLLECTION = os.getenv("DOCS_COLLECTION")
+adocs_col = adb[DOCS_COLLECTION]
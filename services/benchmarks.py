@@ -0,0 +1,216 @@
+"""Micro-benchmarks del controller contra un mongod local.
+
+Uso:
+    python -m services.benchmarks profile AAPL MSFT --runs 50
+    python -m services.benchmarks throughput http://localhost:8100 AAPL MSFT --requests 500 --concurrency 500
+    python -m services.benchmarks l2 --workers 1 4 8
+    python -m services.benchmarks serialize http://localhost:8100 AAPL MSFT NVDA --docs 200
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import requests
+
+from services.company_data import CompanyData
+
+
+def _timeit(fn: Callable[[], object], runs: int) -> List[float]:
+    fn()  # warm-up (conexiones del pool, plan cache)
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def _report(label: str, samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    stats = {"median_ms": statistics.median(samples), "p95_ms": p95, "mean_ms": statistics.fmean(samples)}
+    print(f"{label:<28} median={stats['median_ms']:8.2f}ms  p95={p95:8.2f}ms  mean={stats['mean_ms']:8.2f}ms")
+    return stats
+
+
+# -------- CompanyData.get_full_profile --------
+def bench_profile(symbols: List[str], runs: int = 50, years_back: int = 6) -> None:
+    def legacy(sym: str):
+        cd = CompanyData(sym)
+        if not cd.symbol_exists():
+            return None
+        cd.get_overview()
+        cd.get_income_sheets(years_back)
+        cd.get_balance_sheets(years_back)
+        cd.get_margins()
+        cd.get_financial_ratios()
+        cd.get_logo_url()
+        return cd
+
+    def aggregated(sym: str):
+        return CompanyData(sym).get_full_profile(years_back)
+
+    for sym in symbols:
+        print(f"--- {sym} ---")
+        before = _report("sequential find_one", _timeit(lambda: legacy(sym), runs))
+        after = _report("single aggregation", _timeit(lambda: aggregated(sym), runs))
+        print(f"{'speedup (median)':<28} x{before['median_ms'] / max(after['median_ms'], 1e-9):.2f}")
+
+
+# -------- Throughput HTTP de /api/dashboard/{symbol} --------
+def bench_throughput(base_url: str, symbols: List[str], total: int = 500, concurrency: int = 500,
+                     path: str = "/api/dashboard/{symbol}") -> None:
+    # Correr contra el despliegue anterior (handlers sync) y el actual (async) con los mismos argumentos
+    urls = [base_url.rstrip("/") + path.format(symbol=symbols[i % len(symbols)]) for i in range(total)]
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    def one(url: str):
+        t0 = time.perf_counter()
+        try:
+            ok = session.get(url, timeout=60).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, (time.perf_counter() - t0) * 1000.0
+
+    one(urls[0])  # warm-up
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, urls))
+    elapsed = time.perf_counter() - t0
+
+    errors = sum(1 for ok, _ in results if not ok)
+    print(f"{total} requests, concurrency={concurrency}, errors={errors}")
+    _report("latency", [ms for _, ms in results])
+    print(f"{'throughput':<28} {total / elapsed:8.1f} req/s")
+
+
+# -------- Hit ratio L1/L2 con N workers --------
+def _l2_worker(args) -> Dict[str, int]:
+    from services.fast_cache import SWRCache
+    from services.l2_cache import SQLiteL2Cache, TieredCache
+
+    seed, path, requests_per_worker, keys, l1_entries, skew = args
+    rng = random.Random(seed)
+    weights = [1.0 / (k + 1) ** skew for k in range(keys)]
+    l1 = SWRCache(max_entries=l1_entries, stripes=1)
+    cache = TieredCache(l1, SQLiteL2Cache(path) if path else None)
+
+    out = {"requests": 0, "l1": 0, "l2": 0, "origin": 0}
+    for k in rng.choices(range(keys), weights=weights, k=requests_per_worker):
+        key = f"dashboard:SYM{k}"
+        out["requests"] += 1
+        if l1.get_if_exists(key) is not None:
+            out["l1"] += 1
+            continue
+        if cache.get(key)[0] is not None:
+            out["l2"] += 1
+            continue
+        out["origin"] += 1  # lectura a Mongo + build
+        cache.set(key, {"symbol": key, "years": list(range(6))}, ttl=3600)
+    return out
+
+
+def bench_l2(workers: List[int], total: int = 40000, keys: int = 2000, l1_entries: int = 2000,
+             skew: float = 1.0) -> None:
+    # Simula el balanceo de uvicorn: `total` requests repartidos entre N procesos con L1 propio
+    for n in workers:
+        for use_l2 in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "l2.sqlite3") if use_l2 else None
+                jobs = [(i, path, total // n, keys, l1_entries, skew) for i in range(n)]
+                with multiprocessing.Pool(n) as pool:
+                    parts = pool.map(_l2_worker, jobs)
+            agg = {k: sum(p[k] for p in parts) for k in parts[0]}
+            req = max(agg["requests"], 1)
+            print(f"workers={n:<2} L2={'on ' if use_l2 else 'off'}  "
+                  f"L1={agg['l1'] / req:6.1%}  L2={agg['l2'] / req:6.1%}  "
+                  f"hit={(agg['l1'] + agg['l2']) / req:6.1%}  origin={agg['origin']}")
+
+
+# -------- Serialización y bytes en el cable --------
+def bench_serialize(base_url: str, symbols: List[str], docs: int = 200, runs: int = 20) -> None:
+    from fastapi.encoders import jsonable_encoder
+    from services.http_cache import serialize
+
+    base_url = base_url.rstrip("/")
+    endpoints = {
+        "dashboards (batch, formatted)": ("/api/dashboard", {"symbols": ",".join(symbols)}),
+        "dashboards (batch, raw)": ("/api/dashboard", {"symbols": ",".join(symbols), "format": "raw"}),
+        f"all-docs (limit={docs})": ("/all-docs", {"limit": docs}),
+    }
+    session = requests.Session()
+    for label, (path, params) in endpoints.items():
+        payload = session.get(base_url + path, params=params, timeout=120).json()
+        print(f"--- {label} ---")
+        # Antes: jsonable_encoder + json.dumps (camino por defecto de FastAPI)
+        before = _report("jsonable_encoder+json", _timeit(
+            lambda: json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            runs))
+        after = _report("orjson", _timeit(lambda: serialize(payload), runs))
+        print(f"{'speedup (median)':<28} x{before['median_ms'] / max(after['median_ms'], 1e-9):.2f}")
+
+        body = serialize(payload)
+        zipped = _timeit(lambda: gzip.compress(body, compresslevel=5), runs)
+        print(f"{'bytes identity / gzip':<28} {len(body):>10,} / {len(gzip.compress(body, compresslevel=5)):>10,}"
+              f"  (gzip median {statistics.median(zipped):.2f}ms)")
+        # Lo que realmente viaja según Accept-Encoding (GZipMiddleware del controller)
+        for enc in ("identity", "gzip"):
+            resp = session.get(base_url + path, params=params, headers={"Accept-Encoding": enc}, stream=True, timeout=120)
+            wire = len(resp.raw.read(decode_content=False))
+            print(f"{'wire ' + enc:<28} {wire:>10,} bytes  content-encoding={resp.headers.get('content-encoding', '-')}")
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("profile", help="get_full_profile: find_one secuenciales vs una agregación")
+    p.add_argument("symbols", nargs="+")
+    p.add_argument("--runs", type=int, default=50)
+    p.add_argument("--years-back", type=int, default=6)
+
+    t = sub.add_parser("throughput", help="requests concurrentes contra un controller en marcha")
+    t.add_argument("base_url")
+    t.add_argument("symbols", nargs="+")
+    t.add_argument("--requests", type=int, default=500)
+    t.add_argument("--concurrency", type=int, default=500)
+    t.add_argument("--path", default="/api/dashboard/{symbol}")
+
+    c = sub.add_parser("l2", help="hit ratio L1/L2 simulado con N procesos")
+    c.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    c.add_argument("--requests", type=int, default=40000)
+    c.add_argument("--keys", type=int, default=2000)
+    c.add_argument("--l1-entries", type=int, default=2000)
+    c.add_argument("--skew", type=float, default=1.0)
+
+    z = sub.add_parser("serialize", help="json vs orjson y bytes con/sin gzip para dashboards y docs")
+    z.add_argument("base_url")
+    z.add_argument("symbols", nargs="+")
+    z.add_argument("--docs", type=int, default=200)
+    z.add_argument("--runs", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "profile":
+        bench_profile([s.upper() for s in args.symbols], runs=args.runs, years_back=args.years_back)
+    elif args.cmd == "throughput":
+        bench_throughput(args.base_url, [s.upper() for s in args.symbols], total=args.requests,
+                         concurrency=args.concurrency, path=args.path)
+    elif args.cmd == "l2":
+        bench_l2(args.workers, total=args.requests, keys=args.keys, l1_entries=args.l1_entries, skew=args.skew)
+    elif args.cmd == "serialize":
+        bench_serialize(args.base_url, [s.upper() for s in args.symbols], docs=args.docs, runs=args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.collection import Collection
+
+from services.embeddings import VECTOR_FIELD, vector_to_list
+from services.http_cache import serialize
+
+# Lectura por páginas de colecciones grandes (docs / embeddings): orden por _id,
+# cursor `after` = último _id entregado, y filas escritas desde el cursor de Mongo
+# a medida que llegan (la memoria del controller no crece con la colección).
+EXPORT_DEFAULT_LIMIT = int(os.getenv("EXPORT_DEFAULT_LIMIT", "200"))
+EXPORT_MAX_LIMIT = int(os.getenv("EXPORT_MAX_LIMIT", "5000"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Campos pesados por colección: texto completo y vectores
+HEAVY_FIELDS = ("sec_text_full_clean", "embedding", "embeddings", "vector")
+
+PRESETS: Dict[str, Optional[Dict[str, int]]] = {
+    "all": None,
+    "ids": {"_id": 1},
+    "no_text": {f: 0 for f in HEAVY_FIELDS},
+}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """`fields`: preset (all | ids | no_text) o lista separada por comas; `-campo` excluye."""
+    fields = (fields or "all").strip()
+    if fields in PRESETS:
+        return PRESETS[fields]
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    excluded = [f[1:] for f in names if f.startswith("-")]
+    included = [f for f in names if not f.startswith("-")]
+    if excluded and included:
+        raise ValueError("fields: no se pueden mezclar inclusiones y exclusiones")
+    if "_id" in excluded:
+        # El orden y el cursor `after` son por _id: cada fila lo necesita
+        raise ValueError("fields: _id no se puede excluir")
+    if excluded:
+        return {f: 0 for f in excluded}
+    return {"_id": 1, **{f: 1 for f in included}}
+
+
+def decode_cursor(after: Optional[str]) -> Any:
+    # Los docs usan el ticker como _id; otras colecciones pueden usar ObjectId
+    if not after:
+        return None
+    return ObjectId(after) if ObjectId.is_valid(after) else after
+
+
+def clamp_limit(limit: Optional[int], *, streaming: bool = False) -> int:
+    # En streaming 0 = sin límite (la colección completa, fila por fila)
+    if limit is None:
+        return 0 if streaming else EXPORT_DEFAULT_LIMIT
+    if limit <= 0:
+        return 0 if streaming else EXPORT_DEFAULT_LIMIT
+    return limit if streaming else min(limit, EXPORT_MAX_LIMIT)
+
+
+def _cursor(col: Collection, after: Any, limit: int, projection: Optional[Dict[str, int]]):
+    query = {"_id": {"$gt": after}} if after is not None else {}
+    cur = col.find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    return cur.limit(limit) if limit else cur
+
+
+def _jsonable(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc["_id"] = str(doc["_id"])
+    if VECTOR_FIELD in doc:
+        doc[VECTOR_FIELD] = vector_to_list(doc[VECTOR_FIELD])
+    return doc
+
+
+def read_page(col: Collection, *, after: Optional[str] = None, limit: int = EXPORT_DEFAULT_LIMIT,
+              projection: Optional[Dict[str, int]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Una página acotada y el cursor para la siguiente (None si no hay más)."""
+    rows = [_jsonable(d) for d in _cursor(col, decode_cursor(after), limit, projection)]
+    next_after = rows[-1]["_id"] if len(rows) == limit else None
+    return rows, next_after
+
+
+def iter_ndjson(col: Collection, *, after: Optional[str] = None, limit: int = 0,
+                projection: Optional[Dict[str, int]] = None) -> Iterator[bytes]:
+    # Generador síncrono: StreamingResponse lo consume en el threadpool, un lote de Mongo a la vez
+    cur = _cursor(col, decode_cursor(after), limit, projection)
+    try:
+        for doc in cur:
+            yield serialize(_jsonable(doc)) + b"\n"
+    finally:
+        cur.close()
+
+
+__all__ = [
+    "read_page", "iter_ndjson", "parse_fields", "clamp_limit", "decode_cursor",
+    "NDJSON_MEDIA_TYPE", "PRESETS",
+]
@@ -1,236 +1,288 @@
-from urllib.parse import urlparse
 from .db import *
-import requests
+from . import logo_cache
+
+_OVERVIEW_FIELDS = ("Name", "Description", "Exchange", "Currency", "Country",
+                    "Sector", "Industry", "OfficialSite")
+_MARGIN_FIELDS = ("GrossProfitTTM", "RevenueTTM", "OperatingMarginTTM", "ProfitMargin")
+_RATIO_FIELDS = ("ReturnOnAssetsTTM", "ReturnOnEquityTTM")
+
+INCOME_FIELDS = {
+    "Annual Revenue": "totalRevenue",
+    "Gross Profit": "grossProfit",
+    "Operating Income": "operatingIncome",
+    "Net Income": "netIncome",
+}
+BALANCE_FIELDS = {
+    "Cash": "cashAndCashEquivalentsAtCarryingValue",
+    "Total Debt": "shortLongTermDebtTotal",
+    "Current Assets": "totalCurrentAssets",
+    "Current Liabilities": "totalCurrentLiabilities",
+    "Total Assets": "totalAssets",
+    "Total Liabilities": "totalLiabilities",
+    "Equity": "totalShareholderEquity",
+}
+CASH_FLOW_FIELDS = {
+    "Operating CF": "operatingCashflow",
+    "Capex": "capitalExpenditures",
+    "Free Cash Flow": "freeCashFlow",
+}
+
+
+def _fiscal_year(fiscal_date_ending: str) -> int:
+    fiscal_year_str, fiscal_month_str, _ = fiscal_date_ending.split("-")
+    fiscal_year = int(fiscal_year_str)
+    fiscal_month = int(fiscal_month_str)
+
+    if fiscal_month != 12:
+        fiscal_year -= 1
+    return fiscal_year
+
+
+def _reports_by_year(reports: list, years_back: int, field_map: dict) -> dict:
+    result = {}
+    for report in reports[:min(years_back, len(reports))]:
+        fiscal_year = _fiscal_year(report.get("fiscalDateEnding", "Unknown Date"))
+        result[fiscal_year] = {name: report.get(field, "N/A") for name, field in field_map.items()}
+    return result
+
+
+def _statement_lookup(collection: str, symbol: str, years_back: int) -> dict:
+    # Sub-pipeline sin correlación: se ejecuta una sola vez y $slice limita los reportes en el servidor
+    return {
+        "$lookup": {
+            "from": collection,
+            "pipeline": [
+                {"$match": {"symbol": symbol}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "annualReports": {"$slice": ["$annualReports", years_back]}}},
+            ],
+            "as": collection,
+        }
+    }
+
+
+def profile_pipeline(symbol: str, years_back: int) -> list:
+    # Overview, márgenes, ratios, estados financieros y logo en un solo round trip
+    return [
+        {"$match": {"symbol": symbol}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, **{f: 1 for f in _OVERVIEW_FIELDS + _MARGIN_FIELDS + _RATIO_FIELDS}}},
+        _statement_lookup("income_statements", symbol, years_back),
+        _statement_lookup("balance_sheets", symbol, years_back),
+        _statement_lookup("cash_flows", symbol, years_back),
+        {"$lookup": {
+            "from": logo_cache.COLLECTION,
+            "pipeline": [{"$match": {"symbol": symbol}}, {"$limit": 1}, {"$project": {"_id": 0}}],
+            "as": "logo",
+        }},
+    ]
+
+
+def load_profiles(symbols: list[str], years_back: int = 5) -> dict:
+    # Una consulta $in por colección para todos los símbolos; mismo dict que get_full_profile
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+
+    overview_fields = {f: 1 for f in _OVERVIEW_FIELDS + _MARGIN_FIELDS + _RATIO_FIELDS}
+    docs = {
+        d["symbol"]: d
+        for d in db["overview"].find({"symbol": {"$in": symbols}}, {"_id": 0, "symbol": 1, **overview_fields})
+    }
+
+    statements = {}
+    for collection in ("income_statements", "balance_sheets", "cash_flows"):
+        cursor = db[collection].find(
+            {"symbol": {"$in": symbols}},
+            {"_id": 0, "symbol": 1, "annualReports": {"$slice": years_back}},
+        )
+        statements[collection] = {d["symbol"]: d for d in cursor}
+    logos = {
+        d["symbol"]: d
+        for d in db[logo_cache.COLLECTION].find({"symbol": {"$in": symbols}}, {"_id": 0})
+    }
+
+    profiles = {}
+    for sym in symbols:
+        doc = docs.get(sym)
+        if doc is None:
+            continue
+        doc = dict(doc)
+        for collection, by_symbol in statements.items():
+            doc[collection] = [by_symbol[sym]] if sym in by_symbol else []
+        doc["logo"] = [logos[sym]] if sym in logos else []
+        profiles[sym] = CompanyData(sym)._profile_from_docs(doc, years_back)
+    return profiles
+
 
 class CompanyData():
     def __init__(self, symbol: str):
         self.symbol = symbol
 
     def symbol_exists(self):
-        query = {"Symbol": self.symbol}
+        query = {"symbol": self.symbol}
         return db["overview"].count_documents(query) > 0
 
     def get_overview(self):
-        query = {"Symbol": self.symbol}
-        projection = {"Name": 1, "Description": 1, "Exchange": 1, "Currency": 1, "Country": 1, 
-                      "Sector": 1, "Industry": 1, "OfficialSite": 1} 
-        
-        company = db["overview"].find_one(query, projection)
-        
-        if company:
-            name = company.get("Name", "Name Not Available")
-            description = company.get("Description", "Description Not Available")
-            exchange = company.get("Exchange", "Exchange Not Available")
-            currency = company.get("Currency", "Currency Not Available")
-            country = company.get("Country", "Coutry Not Available")
-            sector = company.get("Sector", "Sector Not Available")
-            industry = company.get("Industry", "Industry Not Available")
-            official_site = company.get("OfficialSite", "OfficialSite Not Available")
-
-            return {"Name": name, "Description": description, "Exchange": exchange, 
-                    "Currency": currency, "Country": country, "Sector": sector, 
-                    "Industry": industry, "OfficialSite": official_site}
-        else:
-             return {
-            "Name": "N/A",
-            "Description": "No information found",
-            "Exchange": "N/A",
-            "Currency": "N/A",
-            "Country": "N/A",
-            "Sector": "N/A",
-            "Industry": "N/A",
-            "OfficialSite": "N/A"
-        }
+        query = {"symbol": self.symbol}
+        projection = {f: 1 for f in _OVERVIEW_FIELDS}
+
+        return self._overview_from_doc(db["overview"].find_one(query, projection))
 
     def get_income_sheets(self, years_back: int = 5):
         try:
             years_back = int(years_back)
         except ValueError:
             return "Error: 'years_back' must be an integer value."
-        
+
         query = {"symbol": self.symbol}
         projection = {"annualReports": 1}
 
         company = db["income_statements"].find_one(query, projection)
+        return self._income_from_doc(company, years_back)
 
-        if not company or "annualReports" not in company:
-            return f"No income statement data found for symbol {self.symbol}"
+    def get_balance_sheets(self, years_back: int = 5):
+        try:
+            years_back = int(years_back)
+        except ValueError:
+            return "Error: 'years_back' must be an integer value."
 
-        reports = company["annualReports"]
+        query = {"symbol": self.symbol}
+        projection = {"annualReports": 1}
 
-        available_years = len(reports)
+        company = db["balance_sheets"].find_one(query, projection)
+        return self._balance_from_doc(company, years_back)
 
-        if available_years == 0:
-            return f"No data available for the last {years_back} years."
-        
-        recent_reports = reports[:min(years_back, available_years)]
-
-        result = {}
-        for report in recent_reports:
-            fiscal_date_ending = report.get("fiscalDateEnding", "Unknown Date")
-            
-            
-            fiscal_year_str, fiscal_month_str, _ = fiscal_date_ending.split("-")  
-            fiscal_year = int(fiscal_year_str)
-            fiscal_month = int(fiscal_month_str)
-
-            if fiscal_month != 12:
-                fiscal_year -= 1
-
-            result[fiscal_year] = {
-                "Annual Revenue": report.get("totalRevenue", "N/A"),
-                "Gross Profit": report.get("grossProfit", "N/A"),
-                "Operating Income": report.get("operatingIncome", "N/A"),
-                "Net Income": report.get("netIncome", "N/A"),
-            }
+    def get_margins(self):
+        query = {"symbol": self.symbol}
+        projection = {f: 1 for f in _MARGIN_FIELDS}
 
-        return result
+        return self._margins_from_doc(db["overview"].find_one(query, projection))
 
-    
-    def get_balance_sheets(self, years_back: int = 5):
+    def get_financial_ratios(self):
+        query = {"symbol": self.symbol}
+        projection = {f: 1 for f in _RATIO_FIELDS}
+
+        return self._ratios_from_doc(db["overview"].find_one(query, projection))
+
+    def get_logo_url(self):
+
+        query = {"symbol": self.symbol}
+        projection = {"OfficialSite": 1}
+
+        company = db["overview"].find_one(query, projection) or {}
+
+        return logo_cache.get_logo(self.symbol, company.get("OfficialSite"), logo_cache.find_cached(self.symbol))
+
+    def get_full_profile(self, years_back: int = 5):
         try:
             years_back = int(years_back)
         except ValueError:
-            return "Error: 'years_back' must be an integer value."
+            return {"error": "'years_back' must be an integer value."}
 
-        query = {"symbol": self.symbol}
-        projection = {"annualReports": 1}
+        docs = list(db["overview"].aggregate(profile_pipeline(self.symbol, years_back)))
+        if not docs:
+            return {"error": f"Symbol '{self.symbol}' not found in database."}
 
-        company = db["balance_sheet"].find_one(query, projection)
+        return self._profile_from_docs(docs[0], years_back)
 
-        if not company or "annualReports" not in company:
-            return f"No balance sheet data found for symbol {self.symbol}"
+    def _profile_from_docs(self, doc: dict, years_back: int):
+        def first(key):
+            found = doc.get(key) or []
+            return found[0] if found else None
 
-        reports = company["annualReports"]
+        cash_flows = self._cash_flows_from_doc(first("cash_flows"), years_back)
 
-        available_years = len(reports)
+        profile = {
+            "symbol": self.symbol,
+            "overview": self._overview_from_doc(doc),
+            "income_statement": self._income_from_doc(first("income_statements"), years_back),
+            "balance_sheet": self._balance_from_doc(first("balance_sheets"), years_back),
+            "cash_flows": cash_flows if isinstance(cash_flows, dict) else {},
+            "margins": self._margins_from_doc(doc),
+            "financial_ratios": self._ratios_from_doc(doc),
+            "logo": logo_cache.get_logo(self.symbol, doc.get("OfficialSite"), first("logo")),
+        }
 
-        if available_years == 0:
-            return f"No data available for the last {years_back} years."
+        return profile
 
-        recent_reports = reports[:min(years_back, available_years)]
-
-        result = {}
-        for report in recent_reports:
-            fiscal_date_ending = report.get("fiscalDateEnding", "Unknown Date")
-            
-           
-            fiscal_year_str, fiscal_month_str, _ = fiscal_date_ending.split("-")  
-            fiscal_year = int(fiscal_year_str)
-            fiscal_month = int(fiscal_month_str)
-
-            if fiscal_month != 12:
-                fiscal_year -= 1
-
-            result[fiscal_year] = {
-                "Cash": report.get("cashAndCashEquivalentsAtCarryingValue", "N/A"),
-                "Total Debt": report.get("shortLongTermDebtTotal", "N/A"),
-                "Current Assets": report.get("totalCurrentAssets", "N/A"),
-                "Current Liabilities": report.get("totalCurrentLiabilities", "N/A"),
-                "Total Assets": report.get("totalAssets", "N/A"),
-                "Total Liabilities": report.get("totalLiabilities", "N/A"),
-                "Equity": report.get("totalShareholderEquity", "N/A"),
+    # ----------------- Shaping -----------------
+    def _overview_from_doc(self, company):
+        if company:
+            return {
+                "Name": company.get("Name", "Name Not Available"),
+                "Description": company.get("Description", "Description Not Available"),
+                "Exchange": company.get("Exchange", "Exchange Not Available"),
+                "Currency": company.get("Currency", "Currency Not Available"),
+                "Country": company.get("Country", "Coutry Not Available"),
+                "Sector": company.get("Sector", "Sector Not Available"),
+                "Industry": company.get("Industry", "Industry Not Available"),
+                "OfficialSite": company.get("OfficialSite", "OfficialSite Not Available"),
+            }
+        else:
+            return {
+                "Name": "N/A",
+                "Description": "No information found",
+                "Exchange": "N/A",
+                "Currency": "N/A",
+                "Country": "N/A",
+                "Sector": "N/A",
+                "Industry": "N/A",
+                "OfficialSite": "N/A"
             }
 
-        return result
+    def _statement_from_doc(self, company, years_back: int, field_map: dict, missing_msg: str):
+        if not company or company.get("annualReports") is None:
+            return missing_msg
 
-    def get_margins(self):
-        query = {"Symbol": self.symbol}
-        projection = {"GrossProfitTTM": 1, "RevenueTTM": 1, 
-                      "OperatingMarginTTM": 1, "ProfitMargin": 1}
-        
-        company = db["overview"].find_one(query, projection)
-        
+        reports = company["annualReports"]
+
+        if len(reports) == 0:
+            return f"No data available for the last {years_back} years."
+
+        return _reports_by_year(reports, years_back, field_map)
+
+    def _income_from_doc(self, company, years_back: int):
+        return self._statement_from_doc(
+            company, years_back, INCOME_FIELDS,
+            f"No income statement data found for symbol {self.symbol}",
+        )
+
+    def _balance_from_doc(self, company, years_back: int):
+        return self._statement_from_doc(
+            company, years_back, BALANCE_FIELDS,
+            f"No balance sheet data found for symbol {self.symbol}",
+        )
+
+    def _cash_flows_from_doc(self, company, years_back: int):
+        return self._statement_from_doc(
+            company, years_back, CASH_FLOW_FIELDS,
+            f"No cash flow data found for symbol {self.symbol}",
+        )
+
+    def _margins_from_doc(self, company):
         if company:
             gross_profit = company.get("GrossProfitTTM", "GrossProfitTTM Not Available")
             revenue_ttm = company.get("RevenueTTM", "RevenueTTM Not Available")
             operating_margin_ttm = company.get("OperatingMarginTTM", "OperatingMarginTTM Not Available")
             profit_margin = company.get("ProfitMargin", "ProfitMargin Not Available")
 
-            return {"Gross Profit": gross_profit, 
-                    "Revenue TTM": revenue_ttm, 
-                    "Operating Margin": operating_margin_ttm, 
+            return {"Gross Profit": gross_profit,
+                    "Revenue TTM": revenue_ttm,
+                    "Operating Margin": operating_margin_ttm,
                     "Net Margin": profit_margin}
         else:
-            return f"No information found for symbol {self.symbol}" 
+            return f"No information found for symbol {self.symbol}"
 
-
-    def get_financial_ratios(self):
-        query = {"Symbol": self.symbol}
-        projection = {"ReturnOnAssetsTTM": 1, "ReturnOnEquityTTM": 1}
-        
-        company = db["overview"].find_one(query, projection)
-        
+    def _ratios_from_doc(self, company):
         if company:
             return_assets = company.get("ReturnOnAssetsTTM", "ReturnOnAssetsTTM Not Available")
             return_equity = company.get("ReturnOnEquityTTM", "ReturnOnEquityTTM Not Available")
 
-            return {"Return on Assets (ROA)": return_assets, 
+            return {"Return on Assets (ROA)": return_assets,
                     "Return on Equity (ROE)": return_equity}
         else:
-            return f"No information found for symbol {self.symbol}"    
-
-    def get_logo_url(self):
-    
-        query = {"Symbol": self.symbol}
-        projection = {"OfficialSite": 1}
-        
-        company = db["overview"].find_one(query, projection)
-        
-        if not company or not company.get("OfficialSite"):
-            return "Logo not available"  
-        
-        official_site = company["OfficialSite"]
-        
-        
-        if not self._is_valid_url(official_site):
-            return "Invalid URL"  
-        
-        
-        parsed_url = urlparse(official_site)
-        domain = parsed_url.netloc.replace("www.", "") 
-        
-        
-        logo_url = f"https://logo.clearbit.com/{domain}"
-
-        
-        try:
-            response = requests.get(logo_url)
-            if response.status_code == 200:
-                return logo_url
-            else:
-                return "Logo not found"  
-        except requests.exceptions.RequestException as e:
-            return f"Error fetching logo: {e}" 
-
-    def get_full_profile(self, years_back: int = 5):
-        if not self.symbol_exists():
-             return {"error": f"Symbol '{self.symbol}' not found in database."}
-        
-        # Overview
-        overview = self.get_overview()
-        # Income Statement
-        income = self.get_income_sheets(years_back)
-        # Balance Sheet
-        balance = self.get_balance_sheets(years_back)
-        # Margins
-        margins = self.get_margins()
-        # Financial Ratios
-        financial_ratios = self.get_financial_ratios()
-        # Logo
-        logo = self.get_logo_url()
-
-        profile = {
-            "symbol": self.symbol,
-            "overview": overview,
-            "income_statement": income,
-            "balance_sheet": balance,
-            "margins": margins, 
-            "financial_ratios": financial_ratios,
-            "logo": logo,
-        }
-
-        return profile
+            return f"No information found for symbol {self.symbol}"
 
     def _is_valid_url(self, url: str):
         return url.startswith("http://") or url.startswith("https://")
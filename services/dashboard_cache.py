@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from services.db import db
+from services.l2_cache import tiered_cache
+from services.company_data import CompanyData, load_profiles
+from services.dashboard_data_builder import DashboardData, PROFILE_YEARS
+from services import logo_cache
+from services import peer_index
+from services import repository
+from services.revalidation import async_single_flight, revalidator, single_flight
+from services.metrics import build_seconds, cache_requests, cold_builds, record_failure, revalidate_seconds
+
+COLLECTION = "dashboard_cache"
+# Subir cuando cambie la forma del payload para invalidar lo materializado
+SCHEMA_VERSION = 4
+# TTL de los dashboards (SWR, dashboard_cache); lo usan los endpoints y el pre-warmer
+DASHBOARD_TTL = int(os.getenv("DASHBOARD_TTL", "3600"))
+# Colecciones fuente del perfil -> campo que su escritor actualiza al reescribirlas
+SOURCE_STAMP_FIELDS = {
+    "overview": "updated_at",
+    "income_statements": "updated_at",
+    "balance_sheets": "updated_at",
+    "cash_flows": "updated_at",
+    logo_cache.COLLECTION: "ts",
+}
+
+
+def _stringify_keys(data: Any) -> Any:
+    # Los años del perfil vienen como int; el hash se calcula sobre llaves str
+    if isinstance(data, dict):
+        return {str(k): _stringify_keys(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_stringify_keys(v) for v in data]
+    return data
+
+
+def source_hash(profile: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"v": SCHEMA_VERSION, "profile": _stringify_keys(profile)},
+        sort_keys=True, default=str, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _stamp_value(v: Any) -> Optional[float]:
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=v.tzinfo or timezone.utc).timestamp()
+    if isinstance(v, (int, float)):
+        return float(v)
+    return None
+
+
+def source_stamps(symbols: List[str]) -> Dict[str, Optional[str]]:
+    # max(updated_at) de las fuentes por símbolo, proyectando solo ese campo (sin annualReports).
+    # None si algún documento fuente no lo trae: ahí solo sirve comparar source_hash.
+    latest: Dict[str, Optional[float]] = {sym: 0.0 for sym in symbols}
+    for collection, field in SOURCE_STAMP_FIELDS.items():
+        for d in db[collection].find({"symbol": {"$in": symbols}}, {"_id": 0, "symbol": 1, field: 1}):
+            sym = d.get("symbol")
+            if sym not in latest or latest[sym] is None:
+                continue
+            v = _stamp_value(d.get(field))
+            latest[sym] = None if v is None else max(latest[sym], v)
+    return {sym: None if v is None else f"{SCHEMA_VERSION}:{v!r}" for sym, v in latest.items()}
+
+
+def _load_profile(sym: str) -> Dict[str, Any]:
+    profile = CompanyData(sym).get_full_profile(years_back=PROFILE_YEARS)
+    if "error" in profile:
+        raise ValueError(f"No se pudo cargar el perfil para {sym}: {profile['error']}")
+    return profile
+
+
+def _build(sym: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+    # Se materializa la versión numérica; el formato se aplica en el borde (services.presentation)
+    with build_seconds.time("dashboard"):
+        return DashboardData(sym, profile=profile).get_raw_data()
+
+
+# -------- SWR + dashboard_cache --------
+def cache_key(sym: str) -> str:
+    return f"dashboard:{sym}"
+
+
+def _persist_get(sym: str) -> Optional[Dict[str, Any]]:
+    return db[COLLECTION].find_one({"_id": sym}, {"_id": 0, "data": 1, "hash": 1, "ts": 1})
+
+
+def _persist_set(sym: str, data: Dict[str, Any], content_hash: str) -> None:
+    db[COLLECTION].update_one(
+        {"_id": sym}, {"$set": {"data": data, "hash": content_hash, "ts": time()}}, upsert=True
+    )
+
+
+def _unchanged(sym: str, stored: Optional[Dict[str, Any]], stamp: Optional[str], ttl: int) -> Optional[UpdateOne]:
+    # Mismo sello de fuentes que el del último build: se renueva el TTL sin cargar el perfil
+    if stamp is None or not stored or stored.get("src") != stamp or stored.get("data") is None:
+        return None
+    tiered_cache.set(cache_key(sym), stored["data"], ttl=ttl)
+    return UpdateOne({"_id": sym}, {"$set": {"ts": time()}})
+
+
+def _refresh_op(sym: str, profile: Dict[str, Any], stored: Optional[Dict[str, Any]], stamp: Optional[str], ttl: int) -> UpdateOne:
+    content_hash = source_hash(profile)
+    if stored and stored.get("hash") == content_hash and stored.get("data") is not None:
+        # Fuentes sin cambios: solo se renueva el TTL
+        tiered_cache.set(cache_key(sym), stored["data"], ttl=ttl)
+        return UpdateOne({"_id": sym}, {"$set": {"src": stamp, "ts": time()}})
+    data = _build(sym, profile)
+    tiered_cache.set(cache_key(sym), data, ttl=ttl)
+    if stored:
+        # Cambiaron las fuentes: se actualiza solo esta compañía en el índice de pares
+        peer_index.refresh_symbol(sym)
+    return UpdateOne(
+        {"_id": sym}, {"$set": {"data": data, "hash": content_hash, "src": stamp, "ts": time()}}, upsert=True
+    )
+
+
+def revalidate(sym: str, ttl: int = DASHBOARD_TTL) -> None:
+    try:
+        with revalidate_seconds.time("dashboard"):
+            stamp = source_stamps([sym])[sym]
+            stored = db[COLLECTION].find_one({"_id": sym}, {"_id": 0, "hash": 1, "src": 1, "data": 1})
+            op = _unchanged(sym, stored, stamp, ttl) or _refresh_op(sym, _load_profile(sym), stored, stamp, ttl)
+            db[COLLECTION].bulk_write([op])
+    except Exception:
+        record_failure("dashboard_revalidate")
+
+
+def revalidate_many(symbols: List[str], ttl: int = DASHBOARD_TTL) -> None:
+    try:
+        with revalidate_seconds.time("dashboard_batch"):
+            stamps = source_stamps(symbols)
+            stored = {
+                d["_id"]: d
+                for d in db[COLLECTION].find({"_id": {"$in": symbols}}, {"hash": 1, "src": 1, "data": 1})
+            }
+            ops, changed = [], []
+            for sym in symbols:
+                op = _unchanged(sym, stored.get(sym), stamps.get(sym), ttl)
+                if op is None:
+                    changed.append(sym)
+                else:
+                    ops.append(op)
+            # Solo se cargan los perfiles de los símbolos cuyas fuentes cambiaron (o sin sello)
+            if changed:
+                profiles = load_profiles(changed, years_back=PROFILE_YEARS)
+                ops += [
+                    _refresh_op(sym, profile, stored.get(sym), stamps.get(sym), ttl)
+                    for sym, profile in profiles.items()
+                ]
+            if ops:
+                db[COLLECTION].bulk_write(ops, ordered=False)
+    except Exception:
+        record_failure("dashboard_revalidate")
+
+
+def _schedule_revalidate(sym: str, ttl: int) -> None:
+    revalidator.submit(cache_key(sym), revalidate, sym, ttl)
+
+
+def _cold_build(sym: str, ttl: int) -> Dict[str, Any]:
+    cold_builds.inc("dashboard")
+    profile = _load_profile(sym)
+    data = _build(sym, profile)
+    tiered_cache.set(cache_key(sym), data, ttl=ttl)
+    _persist_set(sym, data, source_hash(profile))
+    return data
+
+
+async def _cold_build_async(sym: str, ttl: int) -> Dict[str, Any]:
+    cold_builds.inc("dashboard")
+    profile = await repository.load_profile(sym, PROFILE_YEARS)
+    # El build es CPU (NumPy): fuera del event loop
+    data = await asyncio.to_thread(_build, sym, profile)
+    await tiered_cache.aset(cache_key(sym), data, ttl=ttl)
+    await repository.save_dashboard(sym, data, source_hash(profile))
+    return data
+
+
+def compute_dashboard_ultra(symbol: str, allow_stale: bool = True, ttl: int = DASHBOARD_TTL) -> Tuple[Dict[str, Any], bool]:
+    sym = (symbol or "").upper()
+    key = cache_key(sym)
+
+    # memoria
+    val, fresh = tiered_cache.get(key)
+    if val is not None:
+        if not fresh and allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return val, fresh
+
+    # persistente
+    persisted = _persist_get(sym)
+    if persisted is not None and persisted.get("data") is not None:
+        cache_requests.inc("dashboard", "mongo", "stale")
+        tiered_cache.set(key, persisted["data"], ttl=ttl)
+        if allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return persisted["data"], False
+
+    # cold miss: los llamadores concurrentes esperan el mismo build
+    return single_flight.do(key, lambda: _cold_build(sym, ttl)), True
+
+
+async def compute_dashboard_async(symbol: str, allow_stale: bool = True, ttl: int = DASHBOARD_TTL) -> Tuple[Dict[str, Any], bool]:
+    # Misma cascada que compute_dashboard_ultra, con I/O sobre Motor
+    sym = (symbol or "").upper()
+    key = cache_key(sym)
+
+    val, fresh = await tiered_cache.aget(key)
+    if val is not None:
+        if not fresh and allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return val, fresh
+
+    persisted = await repository.find_dashboard(sym)
+    if persisted is not None and persisted.get("data") is not None:
+        cache_requests.inc("dashboard", "mongo", "stale")
+        await tiered_cache.aset(key, persisted["data"], ttl=ttl)
+        if allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return persisted["data"], False
+
+    return await async_single_flight.do(key, lambda: _cold_build_async(sym, ttl)), True
+
+def compute_dashboards_batch(symbols: List[str], allow_stale: bool = True, ttl: int = DASHBOARD_TTL) -> Dict[str, Any]:
+    syms = list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+    out: Dict[str, Any] = {}
+    stale: List[str] = []
+
+    # memoria
+    pending = []
+    for sym in syms:
+        val, fresh = tiered_cache.get(cache_key(sym))
+        if val is None:
+            pending.append(sym)
+            continue
+        out[sym] = val
+        if not fresh:
+            stale.append(sym)
+
+    # persistente: un solo $in
+    if pending:
+        for doc in db[COLLECTION].find({"_id": {"$in": pending}}, {"data": 1}):
+            if doc.get("data") is None:
+                continue
+            out[doc["_id"]] = doc["data"]
+            tiered_cache.set(cache_key(doc["_id"]), doc["data"], ttl=ttl)
+            stale.append(doc["_id"])
+        pending = [sym for sym in pending if sym not in out]
+
+    # misses: un $in por colección fuente
+    if pending:
+        profiles = load_profiles(pending, years_back=PROFILE_YEARS)
+        ops = []
+        for sym, profile in profiles.items():
+            try:
+                data = _build(sym, profile)
+            except Exception:
+                record_failure("dashboard_build")
+                continue
+            out[sym] = data
+            tiered_cache.set(cache_key(sym), data, ttl=ttl)
+            ops.append(UpdateOne(
+                {"_id": sym}, {"$set": {"data": data, "hash": source_hash(profile), "ts": time()}}, upsert=True
+            ))
+        if ops:
+            db[COLLECTION].bulk_write(ops, ordered=False)
+
+    if stale and allow_stale:
+        revalidator.submit_many({cache_key(sym): sym for sym in stale}, revalidate_many, ttl)
+
+    return {
+        "dashboards": {sym: out[sym] for sym in syms if sym in out},
+        "not_found": [sym for sym in syms if sym not in out],
+    }
+
+__all__ = [
+    "compute_dashboard_ultra", "compute_dashboard_async", "compute_dashboards_batch",
+    "revalidate", "revalidate_many", "cache_key", "source_hash", "source_stamps", "DASHBOARD_TTL",
+]
@@ -1,48 +1,41 @@
-from .company_data import CompanyData
-
-
-def calculate_growth(current_value, previous_value):
-    if previous_value == 0 or previous_value is None:
-        return 0
-    return ((current_value - previous_value) / abs(previous_value)) * 100
-
-
-def safe_int(value):
-    try:
-        if value in (None, "", "None"):
-            return 0
-        
-        s = str(value).replace("$", "").replace(",", "").strip()
-        return int(float(s))
-    except (ValueError, TypeError):
-        return 0
-
-
-def _try_float(value):
-    try:
-        if value in (None, "", "None"):
-            return None
-        s = str(value).replace("$", "").replace(",", "").replace("%", "").strip()
-        return float(s)
-    except Exception:
-        return None
-
+import numpy as np
 
-def format_money(value):
-    return f"${value:,.0f}"
-
-
-def format_percent(value):
-    return f"{value:.2f} %"
-
-
-def _strip_pct_to_float(s):
-    if s is None:
-        return None
-    try:
-        return float(str(s).replace("%", "").strip())
-    except Exception:
-        return None
+from .company_data import CompanyData
+from .statements import StatementPanel, coerce_year_key, growth_pct, ratio, shift_prev, to_float, to_table
+from . import presentation
+
+PROFILE_YEARS = 6
+
+INCOME_METRICS = ["Annual Revenue", "Gross Profit", "Operating Income", "Net Income"]
+BALANCE_METRICS = [
+    "Cash",
+    "Total Debt",
+    "Current Assets",
+    "Current Liabilities",
+    "Total Assets",
+    "Total Liabilities",
+    "Equity",
+]
+CASH_FLOW_METRICS = ["Operating CF", "Capex", "Free Cash Flow"]
+
+_BALANCE_ALIASES = {
+    "Cash": ["cashAndCashEquivalentsAtCarryingValue", "cashAndShortTermInvestments", "cashAndCashEquivalents"],
+    "Total Debt": ["shortLongTermDebtTotal", "totalDebt"],
+    "Current Assets": ["totalCurrentAssets"],
+    "Current Liabilities": ["totalCurrentLiabilities"],
+    "Total Assets": ["totalAssets"],
+    "Total Liabilities": ["totalLiabilities"],
+    "Equity": ["totalShareholderEquity", "totalStockholdersEquity"],
+}
+_CASH_FLOW_ALIASES = {
+    "Operating CF": ["Operating CF", "operatingCashflow"],
+    "Capex": ["Capex", "capitalExpenditures"],
+    "Free Cash Flow": ["Free Cash Flow"],
+}
+_RAW_CASH_FLOW_ALIASES = {
+    "Operating CF": ["operatingCashflow", "netCashProvidedByOperatingActivities"],
+    "Capex": ["capitalExpenditures"],
+}
 
 
 def _pick(d: dict, aliases: list[str], default=None):
@@ -56,14 +49,6 @@ def _pick(d: dict, aliases: list[str], default=None):
     return default
 
 
-def _coerce_year_key(y):
-    
-    try:
-        return int(str(y)[:4])
-    except Exception:
-        return y
-
-
 def _year_dict_from_annual_reports(raw: dict, field_map: dict[str, list[str]]):
     
     if not isinstance(raw, dict):
@@ -71,7 +56,7 @@ def _year_dict_from_annual_reports(raw: dict, field_map: dict[str, list[str]]):
     reports = raw.get("annualReports") or []
     out = {}
     for r in reports:
-        y = _coerce_year_key(r.get("fiscalDateEnding"))
+        y = coerce_year_key(r.get("fiscalDateEnding"))
         if not y:
             continue
         row = {}
@@ -81,19 +66,58 @@ def _year_dict_from_annual_reports(raw: dict, field_map: dict[str, list[str]]):
     return out
 
 
+def _scalar(v):
+    return float(v) if np.isfinite(v) else None
+
+
+def _safe_int(values):
+    # Semántica de safe_int en los cálculos: faltante -> 0, truncado a entero.
+    # Crecimiento y ratios con denominador 0 quedan NaN y se presentan como "0.00 %" / "—".
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), np.trunc(values), 0.0)
+
+
+_OVERVIEW_NUMERIC = ("MarketCapitalization", "EPS", "PERatio", "DividendYield")
 
 
 class DashboardData:
-    def __init__(self, symbol: str):
+    def __init__(self, symbol: str, profile: dict | None = None):
         self.symbol = symbol
         self.data = CompanyData(symbol)
-        self.profile = self.data.get_full_profile(years_back=6)
+        self.profile = profile if profile is not None else self.data.get_full_profile(years_back=PROFILE_YEARS)
 
         if not isinstance(self.profile, dict):
             raise ValueError("Formato inesperado del perfil recibido.")
         if "error" in self.profile:
             raise ValueError(f"No se pudo cargar el perfil para {symbol}: {self.profile['error']}")
 
+        # Los estados se parsean una sola vez; todo lo demás opera sobre los arreglos
+        self.income = StatementPanel.from_year_dict(self.profile.get("income_statement"), INCOME_METRICS)
+        self.balance = StatementPanel.from_year_dict(self._balance_source(), BALANCE_METRICS)
+        self.cash_flow = StatementPanel.from_year_dict(self._cash_flow_source(), CASH_FLOW_METRICS)
+
+    # ----------------- SOURCES -----------------
+    def _balance_source(self):
+        balance = self.profile.get("balance_sheet")
+        if isinstance(balance, dict) and balance:
+            return balance
+        raw_bal = (
+            self.profile.get("balance_sheets")
+            or self.profile.get("balance_sheet_raw")
+            or {}
+        )
+        return _year_dict_from_annual_reports(raw_bal, _BALANCE_ALIASES)
+
+    def _cash_flow_source(self):
+        cf = self.profile.get("cash_flows") or self.profile.get("cash_flow") or {}
+        if isinstance(cf, dict) and cf:
+            return {
+                y: {m: _pick(yd, aliases) for m, aliases in _CASH_FLOW_ALIASES.items()}
+                for y, yd in cf.items()
+            }
+        raw = self.profile.get("cash_flows_raw") or self.profile.get("cashFlow") or {}
+        return _year_dict_from_annual_reports(raw, _RAW_CASH_FLOW_ALIASES)
+
     # ----------------- OVERVIEW -----------------
     def get_overview_data(self):
         overview = self.profile.get("overview", {}) or {}
@@ -119,280 +143,139 @@ class DashboardData:
         }
 
     # ----------------- INCOME STATEMENT -----------------
-    def get_income_statement_data(self):
-        data = self.profile.get("income_statement", {}) or {}
-        metrics = ["Annual Revenue", "Gross Profit", "Operating Income", "Net Income"]
-        result = {}
-        years = sorted([_coerce_year_key(y) for y in data.keys()], reverse=True)
-        oldest_year = min(years, default=None)
-
-        for year in years:
-            if year == oldest_year or (year - 1) not in data:
-                continue
-
-            yd = data.get(year) or data.get(str(year)) or {}
-            year_data = {}
-            for metric in metrics:
-                current = safe_int(yd.get(metric))
-                prevd = data.get(year - 1) or data.get(str(year - 1)) or {}
-                previous = safe_int(prevd.get(metric))
-                growth = calculate_growth(current, previous)
-                year_data[metric] = format_money(current)
-                year_data[f"{metric} Growth (%)"] = format_percent(growth)
-
-            result[year] = year_data
-        return result
+    def income_table(self):
+        p = self.income
+        # Solo años cuyo año anterior existe (orden desc: la fila siguiente)
+        keep = np.zeros(len(p), dtype=bool)
+        keep[:-1] = (p.years[:-1] - 1) == p.years[1:]
+        values = _safe_int(p.values)
+        growth = growth_pct(values, shift_prev(values))
+
+        series = {}
+        for m in INCOME_METRICS:
+            j = p.index[m]
+            series[m] = p.values[keep, j]
+            series[f"{m} Growth (%)"] = growth[keep, j]
+        return to_table(p.years[keep], series, ints=INCOME_METRICS)
 
     # ----------------- MARGINS by year -----------------
-    def get_margins_data(self):
-        data = self.profile.get("income_statement", {}) or {}
-        margins_by_year = {}
-
-        for year in sorted([_coerce_year_key(y) for y in data.keys()], reverse=True):
-            yd = data.get(year) or data.get(str(year)) or {}
-            revenue = safe_int(yd.get("Annual Revenue"))
-            if revenue == 0:
-                continue
-
-            gross = safe_int(yd.get("Gross Profit"))
-            operating = safe_int(yd.get("Operating Income"))
-            net = safe_int(yd.get("Net Income"))
-
-            margins_by_year[year] = {
-                "Gross Margin (%)": format_percent((gross / revenue) * 100) if revenue else format_percent(0),
-                "Operating Margin (%)": format_percent((operating / revenue) * 100) if revenue else format_percent(0),
-                "Net Margin (%)": format_percent((net / revenue) * 100) if revenue else format_percent(0),
-            }
-
-        return margins_by_year
+    def margins_table(self):
+        p = self.income
+        revenue = _safe_int(p["Annual Revenue"])
+        keep = revenue != 0
+        cols = [p.index["Gross Profit"], p.index["Operating Income"], p.index["Net Income"]]
+        margins = ratio(_safe_int(p.values[:, cols]), revenue[:, None], 100.0)[keep]
+
+        return to_table(p.years[keep], {
+            "Gross Margin (%)": margins[:, 0],
+            "Operating Margin (%)": margins[:, 1],
+            "Net Margin (%)": margins[:, 2],
+        })
 
     # ----------------- BALANCE SHEET  -----------------
-    def get_balance_sheet_data(self):
+    def balance_table(self):
+        p = self.balance
+        keep = np.arange(len(p)) < len(p) - 1  # el año más antiguo solo sirve de base
+        equity = _safe_int(p["Equity"])
+        growth = growth_pct(equity, shift_prev(equity))
 
-        raw_data = self.profile.get("balance_sheet") or {}
-
-        if not raw_data:
-            raw_bal = (
-                self.profile.get("balance_sheets")
-                or self.profile.get("balance_sheet_raw")
-                or {}
-            )
-            field_map = {
-                "Cash": ["cashAndCashEquivalentsAtCarryingValue", "cashAndShortTermInvestments", "cashAndCashEquivalents"],
-                "Total Debt": ["shortLongTermDebtTotal", "totalDebt"],
-                "Current Assets": ["totalCurrentAssets"],
-                "Current Liabilities": ["totalCurrentLiabilities"],
-                "Total Assets": ["totalAssets"],
-                "Total Liabilities": ["totalLiabilities"],
-                "Equity": ["totalShareholderEquity", "totalStockholdersEquity"],
-            }
-            raw_data = _year_dict_from_annual_reports(raw_bal, field_map)
-
-        years = sorted([_coerce_year_key(y) for y in raw_data.keys()], reverse=True)
-        metrics = [
-            "Cash",
-            "Total Debt",
-            "Current Assets",
-            "Current Liabilities",
-            "Total Assets",
-            "Total Liabilities",
-            "Equity",
-        ]
-        if not years:
-            return {}
-
-        oldest_year = years[-1]
-        formatted_data = {}
-
-        for i, year in enumerate(years):
-            if year == oldest_year:
-                continue
-            yd = raw_data.get(year) or raw_data.get(str(year)) or {}
-            year_data = {m: format_money(safe_int(_pick(yd, [m]))) for m in metrics}
-            if (i + 1) >= len(years):
-                continue
-            prev = raw_data.get(years[i + 1]) or raw_data.get(str(years[i + 1])) or {}
-            growth = calculate_growth(
-                safe_int(_pick(yd, ["Equity"])),
-                safe_int(_pick(prev, ["Equity"])),
-            )
-            year_data["Equity Growth (%)"] = format_percent(growth)
-            formatted_data[year] = year_data
-
-        return formatted_data
+        series = {m: p[m][keep] for m in BALANCE_METRICS}
+        series["Equity Growth (%)"] = growth[keep]
+        return to_table(p.years[keep], series, ints=BALANCE_METRICS)
 
     # ----------------- RATIOS  -----------------
-    def get_financial_ratios_data(self):
-        balance = self.profile.get("balance_sheet", {}) or {}
-        income = self.profile.get("income_statement", {}) or {}
-        ratios_by_year = {}
-        years = sorted([_coerce_year_key(y) for y in balance.keys()], reverse=True)
-        oldest_year = min(years, default=None)
-
-        for year in years:
-            if year == oldest_year or year not in income and str(year) not in income:
-                continue
-
-            b = balance.get(year) or balance.get(str(year)) or {}
-            i = income.get(year) or income.get(str(year)) or {}
-
-            ca = safe_int(_pick(b, ["Current Assets"]))
-            cl = safe_int(_pick(b, ["Current Liabilities"]))
-            cash = safe_int(_pick(b, ["Cash"]))
-            ta = safe_int(_pick(b, ["Total Assets"]))
-            tl = safe_int(_pick(b, ["Total Liabilities"]))
-            eq = safe_int(_pick(b, ["Equity"]))
-            td = safe_int(_pick(b, ["Total Debt"]))
-            ni = safe_int(_pick(i, ["Net Income"]))
-
-            ratios = {
-                "Current Ratio": round(ca / cl, 2) if cl else None,
-                "Acid Test": round(cash / cl, 2) if cl else None,
-                "Assets to Liabilities": round(ta / tl, 2) if tl else None,
-                "Cash to Equity (%)": format_percent((cash / eq) * 100) if eq else None,
-                "Debt to Equity (%)": format_percent((td / eq) * 100) if eq else None,
-                "ROA (%)": format_percent((ni / ta) * 100) if ta else None,
-                "ROE (%)": format_percent((ni / eq) * 100) if eq else None,
-            }
-
-            ratios_by_year[year] = ratios
-
-        return ratios_by_year
+    def ratios_table(self):
+        keep = (np.arange(len(self.balance)) < len(self.balance) - 1) & np.isin(self.balance.years, self.income.years)
+        b = self.balance.take(keep)
+        b = StatementPanel(b.years, b.metrics, _safe_int(b.values))
+        ni = _safe_int(self.income.align(b.years)["Net Income"])
+
+        cash, cl, ta, eq = b["Cash"], b["Current Liabilities"], b["Total Assets"], b["Equity"]
+        return to_table(b.years, {
+            "Current Ratio": ratio(b["Current Assets"], cl),
+            "Acid Test": ratio(cash, cl),
+            "Assets to Liabilities": ratio(ta, b["Total Liabilities"]),
+            "Cash to Equity (%)": ratio(cash, eq, 100.0),
+            "Debt to Equity (%)": ratio(b["Total Debt"], eq, 100.0),
+            "ROA (%)": ratio(ni, ta, 100.0),
+            "ROE (%)": ratio(ni, eq, 100.0),
+        })
 
     # ----------------- CASH FLOW  -----------------
-    def get_cash_flow_data(self):
-    
-        cf = self.profile.get("cash_flows") or self.profile.get("cash_flow") or {}
-        if isinstance(cf, dict) and cf:
-            years = sorted([_coerce_year_key(y) for y in cf.keys()], reverse=True)
-            cols = ["Periodo", "Operating CF", "Capex", "Free Cash Flow", "FCF Growth (%)"]
-            rows = []
-            for i, y in enumerate(years):
-                yd = cf.get(y) or cf.get(str(y)) or {}
-                op = safe_int(_pick(yd, ["Operating CF", "operatingCashflow"]))
-                capex = safe_int(_pick(yd, ["Capex", "capitalExpenditures"]))
-                fcf = safe_int(_pick(yd, ["Free Cash Flow"]))
-                if fcf == 0:
-                    fcf = op + capex
-                prev_fcf = None
-                if i + 1 < len(years):
-                    pyd = cf.get(years[i + 1]) or cf.get(str(years[i + 1])) or {}
-                    p_op = safe_int(_pick(pyd, ["Operating CF", "operatingCashflow"]))
-                    p_capex = safe_int(_pick(pyd, ["Capex", "capitalExpenditures"]))
-                    p_fcf = safe_int(_pick(pyd, ["Free Cash Flow"])) or (p_op + p_capex)
-                    prev_fcf = p_fcf
-                growth = calculate_growth(fcf, prev_fcf) if prev_fcf is not None else 0
-                rows.append(
-                    [str(y), format_money(op), format_money(capex), format_money(fcf), format_percent(growth)]
-                )
-            return {"columns": cols, "rows": rows}
-
-        raw = self.profile.get("cash_flows_raw") or self.profile.get("cashFlow") or {}
-        by_year = _year_dict_from_annual_reports(
-            raw,
-            {
-                "Operating CF": ["operatingCashflow", "netCashProvidedByOperatingActivities"],
-                "Capex": ["capitalExpenditures"],
-            },
-        )
-        if not by_year:
-            return {}
-        years = sorted(by_year.keys(), reverse=True)
-        cols = ["Periodo", "Operating CF", "Capex", "Free Cash Flow", "FCF Growth (%)"]
-        rows = []
-        for i, y in enumerate(years):
-            op = safe_int(by_year[y].get("Operating CF"))
-            capex = safe_int(by_year[y].get("Capex"))
-            fcf = op + capex
-            prev_fcf = None
-            if i + 1 < len(years):
-                op_prev = safe_int(by_year[years[i + 1]].get("Operating CF"))
-                capex_prev = safe_int(by_year[years[i + 1]].get("Capex"))
-                prev_fcf = op_prev + capex_prev
-            growth = calculate_growth(fcf, prev_fcf) if prev_fcf is not None else 0
-            rows.append([str(y), format_money(op), format_money(capex), format_money(fcf), format_percent(growth)])
-        return {"columns": cols, "rows": rows}
+    def _free_cash_flow(self):
+        p = self.cash_flow
+        op, capex, reported = _safe_int(p["Operating CF"]), _safe_int(p["Capex"]), _safe_int(p["Free Cash Flow"])
+        # FCF reportado; si falta o es 0, Operating CF + Capex
+        return np.where(reported != 0, reported, op + capex)
+
+    def cash_flow_table(self):
+        p = self.cash_flow
+        fcf = self._free_cash_flow()
+        return to_table(p.years, {
+            "Operating CF": p["Operating CF"],
+            "Capex": p["Capex"],
+            "Free Cash Flow": fcf,
+            "FCF Growth (%)": growth_pct(fcf, shift_prev(fcf)),
+        }, ints=CASH_FLOW_METRICS)
 
     # ----------------- KPIs  -----------------
-    def get_structure_kpis(self):
-        
-        balance = self.profile.get("balance_sheet") or {}
-        if not balance:
-           
-            raw_bal = (
-                self.profile.get("balance_sheets")
-                or self.profile.get("balance_sheet_raw")
-                or {}
-            )
-            field_map = {
-                "Cash": ["cashAndCashEquivalentsAtCarryingValue", "cashAndShortTermInvestments", "cashAndCashEquivalents"],
-                "Total Debt": ["shortLongTermDebtTotal", "totalDebt"],
-                "Current Assets": ["totalCurrentAssets"],
-                "Current Liabilities": ["totalCurrentLiabilities"],
-                "Equity": ["totalShareholderEquity", "totalStockholdersEquity"],
-            }
-            balance = _year_dict_from_annual_reports(raw_bal, field_map)
-
-        if not balance:
-            return {
-                "cash": "—",
-                "debt": "—",
-                "net_cash": "—",
-                "fcf": "—",
-                "debt_to_equity": "—",
-                "current_ratio": "—",
-            }
+    def structure_kpis(self):
+        keys = ("cash", "debt", "net_cash", "fcf", "debt_to_equity", "current_ratio")
+        if not len(self.balance):
+            return dict.fromkeys(keys)
 
-        years = sorted([_coerce_year_key(y) for y in balance.keys()], reverse=True)
-        y = years[0]
-        b = balance.get(y) or balance.get(str(y)) or {}
-
-        cash = safe_int(_pick(b, ["Cash"]))
-        debt = safe_int(_pick(b, ["Total Debt"]))
-        current_assets = safe_int(_pick(b, ["Current Assets"]))
-        current_liab = safe_int(_pick(b, ["Current Liabilities"]))
-        equity = safe_int(_pick(b, ["Equity"]))
-
-        # current ratio
-        current_ratio = (current_assets / current_liab) if current_liab else None
-
-        # debt/equity %
-        dte_pct = (debt / equity * 100) if equity else None
-
-        # FCF 
-        fcf_val = None
-        cf_tbl = self.get_cash_flow_data()
-        if cf_tbl and cf_tbl.get("rows"):
-            try:
-                idx_fcf = cf_tbl["columns"].index("Free Cash Flow")
-                # fila 0 es más reciente
-                val = cf_tbl["rows"][0][idx_fcf]
-                fcf_val = safe_int(val)  # por si viene formateado
-            except Exception:
-                fcf_val = None
+        latest = _safe_int(self.balance.values[:1])
+        b = StatementPanel(self.balance.years[:1], self.balance.metrics, latest)
+        cash, debt = b["Cash"], b["Total Debt"]
+        fcf = self._free_cash_flow()
 
         return {
-            "cash": format_money(cash) if cash or cash == 0 else "—",
-            "debt": format_money(debt) if debt or debt == 0 else "—",
-            "net_cash": format_money(cash - debt) if (cash or cash == 0) and (debt or debt == 0) else "—",
-            "fcf": (format_money(fcf_val) if fcf_val is not None else "—"),
-            "debt_to_equity": (format_percent(dte_pct) if dte_pct is not None else "—"),
-            "current_ratio": (f"{current_ratio:.2f}x" if current_ratio is not None else "—"),
+            "cash": _scalar(cash[0]),
+            "debt": _scalar(debt[0]),
+            "net_cash": _scalar((cash - debt)[0]),
+            "fcf": _scalar(fcf[0]) if len(fcf) else None,
+            "debt_to_equity": _scalar(ratio(debt, b["Equity"], 100.0)[0]),
+            "current_ratio": _scalar(ratio(b["Current Assets"], b["Current Liabilities"])[0]),
         }
 
+    # ----------------- Formatted (vistas) -----------------
+    def get_income_statement_data(self):
+        return presentation.year_table(self.income_table())
+
+    def get_margins_data(self):
+        return presentation.year_table(self.margins_table())
+
+    def get_balance_sheet_data(self):
+        return presentation.year_table(self.balance_table())
+
+    def get_financial_ratios_data(self):
+        return presentation.year_table(self.ratios_table(), presentation.ratio_formatter)
+
+    def get_cash_flow_data(self):
+        return presentation.cash_flow_rows(self.cash_flow_table())
+
+    def get_structure_kpis(self):
+        return presentation.structure_kpis(self.structure_kpis())
+
     def stock_information(self):
         return None
 
     def get_summary(self):
         return "Análisis generado con IA sobre la empresa."
 
-    def get_full_data(self):
+    def get_raw_data(self):
+        overview = self.get_overview_data()
+        for key in _OVERVIEW_NUMERIC:
+            overview[key] = _scalar(to_float(overview.get(key)))
         return {
-            "overview": self.get_overview_data(),
-            "income": self.get_income_statement_data(),
-            "margins": self.get_margins_data(),
-            "balance": self.get_balance_sheet_data(),
-            "ratios": self.get_financial_ratios_data(),
-            "cash_flow": self.get_cash_flow_data(),
-            "structure_kpis": self.get_structure_kpis(),
+            "overview": overview,
+            "income": self.income_table(),
+            "margins": self.margins_table(),
+            "balance": self.balance_table(),
+            "ratios": self.ratios_table(),
+            "cash_flow": self.cash_flow_table(),
+            "structure_kpis": self.structure_kpis(),
         }
+
+    def get_full_data(self):
+        return presentation.present_dashboard(self.get_raw_data())
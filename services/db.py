@@ -2,10 +2,20 @@ from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 
+from .metrics import mongo_listener
+
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path=dotenv_path)
 
-client = MongoClient(os.getenv("MONGODB_URI"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+client = MongoClient(
+    os.getenv("MONGODB_URI"),
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[mongo_listener],
+)
 DB_NAME=os.getenv("DB_NAME")
 db = client[DB_NAME]  
 
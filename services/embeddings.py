@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo import UpdateOne
+
+from services.db import emb_col
+
+# Vectores en emb_col como BSON Binary subtipo 9 (vector float32, little-endian):
+# 2 bytes de cabecera (dtype, padding) + dim * 4 bytes. Un documento por chunk:
+#   {_id, symbol, model, chunk_hash, dim, vector: Binary}
+# (symbol, model, chunk_hash) identifica el vector: el RAG solo codifica chunks nuevos.
+# El endpoint .npy concatena los payloads tal cual: el cliente hace np.frombuffer sin copiar.
+VECTOR_FIELD = "vector"
+HASH_FIELD = "chunk_hash"
+LEGACY_VECTOR_FIELDS = ("embedding", "vector")
+DTYPE = np.dtype("<f4")
+
+EMB_NPY_DEFAULT_LIMIT = int(os.getenv("EMB_NPY_DEFAULT_LIMIT", "512"))
+EMB_NPY_MAX_LIMIT = int(os.getenv("EMB_NPY_MAX_LIMIT", "1024"))   # los ids viajan en un header (http.client corta líneas > 64 KB)
+NPY_MEDIA_TYPE = "application/x-npy"
+
+_HEADER = BinaryVectorDtype.FLOAT32.value + b"\x00"
+
+
+# -------- Codificación --------
+def pack_vector(values: Any) -> Binary:
+    arr = np.ascontiguousarray(values, dtype=DTYPE).reshape(-1)
+    return Binary(_HEADER + arr.tobytes(), 9)
+
+
+def unpack_vector(blob: bytes) -> np.ndarray:
+    # Vista de solo lectura sobre el buffer del documento (sin copia)
+    return np.frombuffer(blob, dtype=DTYPE, offset=len(_HEADER))
+
+
+def is_packed(value: Any) -> bool:
+    return isinstance(value, Binary) and value.subtype == 9 and bytes(value[:2]) == _HEADER
+
+
+def vector_to_list(value: Any) -> Any:
+    # Compatibilidad de /all-embeddings en JSON: el Binary vuelve a lista de floats
+    return unpack_vector(value).tolist() if is_packed(value) else value
+
+
+def npy_header(rows: int, dim: int) -> bytes:
+    # Formato .npy v1.0: magic + uint16 con el largo + dict alineado a 64 bytes y terminado en \n
+    header = repr({"descr": DTYPE.str, "fortran_order": False, "shape": (rows, dim)}).encode("latin1")
+    prefix = 10
+    pad = 64 - (prefix + len(header) + 1) % 64
+    header += b" " * (pad % 64) + b"\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header
+
+
+# -------- Lectura / escritura --------
+def decode_matrix(b64: str, rows: int, dim: int) -> np.ndarray:
+    # Cuerpo de POST /embeddings/{symbol}: float32 [rows, dim] contiguo en base64
+    raw = base64.b64decode(b64, validate=True)
+    if len(raw) != rows * dim * DTYPE.itemsize:
+        raise ValueError(f"se esperaban {rows}x{dim} float32, llegaron {len(raw)} bytes")
+    return np.frombuffer(raw, dtype=DTYPE).reshape(rows, dim)
+
+
+def save_vectors(symbol: str, model: str, hashes: List[str], vectors: np.ndarray) -> int:
+    """Upsert por (symbol, model, chunk_hash); un vector ya guardado no se reescribe."""
+    if len(hashes) != len(vectors):
+        raise ValueError("hashes y vectores de distinto largo")
+    sym = symbol.strip().upper()
+    ops = [
+        UpdateOne(
+            {"symbol": sym, "model": model, HASH_FIELD: h},
+            {"$setOnInsert": {"dim": int(vec.shape[-1]), VECTOR_FIELD: pack_vector(vec)}},
+            upsert=True,
+        )
+        for h, vec in zip(hashes, vectors)
+    ]
+    if not ops:
+        return 0
+    return emb_col.bulk_write(ops, ordered=False).upserted_count
+
+
+def npy_page(*, symbol: Optional[str] = None, model: Optional[str] = None, after: Optional[str] = None,
+             limit: int = EMB_NPY_DEFAULT_LIMIT, id_field: str = "_id") -> Tuple[bytes, List[str], Optional[str]]:
+    """(cuerpo .npy float32 [n, dim], ids (`_id` o `chunk_hash`) en el mismo orden, cursor siguiente)."""
+    limit = min(max(1, limit), EMB_NPY_MAX_LIMIT)
+    query: Dict[str, Any] = {VECTOR_FIELD: {"$type": "binData"}}
+    if symbol:
+        query["symbol"] = symbol.strip().upper()
+    if model:
+        query["model"] = model
+    if after:
+        query["_id"] = {"$gt": ObjectId(after) if ObjectId.is_valid(after) else after}
+
+    ids: List[str] = []
+    last_id, scanned = None, 0
+    chunks: List[bytes] = []
+    dim = None
+    for doc in emb_col.find(query, {VECTOR_FIELD: 1, id_field: 1}).sort("_id", 1).limit(limit):
+        last_id, scanned = str(doc["_id"]), scanned + 1
+        blob = doc[VECTOR_FIELD]
+        if not is_packed(blob):
+            continue
+        payload = bytes(blob)[len(_HEADER):]
+        d = len(payload) // DTYPE.itemsize
+        if dim is None:
+            dim = d
+        elif d != dim:
+            raise ValueError(f"dimensiones mezcladas ({dim} y {d}): filtra por model")
+        ids.append(str(doc.get(id_field)))
+        chunks.append(payload)
+
+    body = npy_header(len(ids), dim or 0) + b"".join(chunks)
+    # El cursor siempre es el _id, aunque los ids devueltos sean chunk_hash
+    return body, ids, (last_id if scanned == limit else None)
+
+
+def ids_header(ids: List[str]) -> str:
+    return json.dumps(ids, separators=(",", ":"))
+
+
+# -------- Migración de vectores guardados como listas JSON --------
+def pack_legacy_vectors(batch: int = 500) -> int:
+    packed = 0
+    ops: List[UpdateOne] = []
+    query = {"$or": [{f: {"$type": "array"}} for f in LEGACY_VECTOR_FIELDS]}
+    for doc in emb_col.find(query, {f: 1 for f in LEGACY_VECTOR_FIELDS}):
+        values = next(doc[f] for f in LEGACY_VECTOR_FIELDS if isinstance(doc.get(f), list))
+        update: Dict[str, Any] = {"$set": {VECTOR_FIELD: pack_vector(values), "dim": len(values)}}
+        if "embedding" in doc:
+            update["$unset"] = {"embedding": ""}
+        ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(ops) >= batch:
+            packed += emb_col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        packed += emb_col.bulk_write(ops, ordered=False).modified_count
+    return packed
+
+
+__all__ = [
+    "pack_vector", "unpack_vector", "vector_to_list", "is_packed", "npy_header",
+    "save_vectors", "decode_matrix", "npy_page", "ids_header", "pack_legacy_vectors",
+    "VECTOR_FIELD", "HASH_FIELD", "NPY_MEDIA_TYPE",
+]
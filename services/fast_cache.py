@@ -1,33 +1,217 @@
 
 from __future__ import annotations
+import os
+import sys
 import time
 import threading
-from typing import Any, Dict, Tuple, Optional
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, List, Tuple, Optional
+
+SWR_CACHE_MAX_ENTRIES = int(os.getenv("SWR_CACHE_MAX_ENTRIES", "10000"))
+SWR_CACHE_MAX_BYTES = int(os.getenv("SWR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SWR_CACHE_STRIPES = int(os.getenv("SWR_CACHE_STRIPES", "16"))
+SWR_CACHE_POLICY = os.getenv("SWR_CACHE_POLICY", "lru")          # lru | tinylfu
+# Pasado ttl + grace la entrada ya no se sirve ni como stale: se descarta al tocarla
+SWR_STALE_GRACE = int(os.getenv("SWR_STALE_GRACE", str(24 * 3600)))
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    # Estimación recursiva para payloads JSON-like (dict/list/str/números)
+    size = sys.getsizeof(value)
+    if _depth > 16:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += approx_size(v, _depth + 1)
+    return size
+
+
+# -------- Políticas de admisión --------
+class LRUPolicy:
+    """Admite todo; el desalojo es siempre la entrada menos usada recientemente."""
+
+    def record(self, key: str) -> None:
+        pass
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return True
+
+
+class TinyLFUPolicy:
+    """Filtro de admisión TinyLFU: count-min sketch de 4 filas con envejecimiento por mitades.
+
+    Una llave nueva solo desplaza a la víctima LRU si se ha pedido más veces que ella.
+    """
+
+    _SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+    # Tabla de traducción byte -> byte >> 1: envejece una fila entera en C con bytearray.translate
+    _HALVE = bytes(c >> 1 for c in range(256))
+
+    def __init__(self, capacity: int):
+        width = 1
+        while width < max(256, 4 * capacity):
+            width <<= 1
+        self._mask = width - 1
+        self._rows = [bytearray(width) for _ in self._SEEDS]
+        self._sample = max(10 * capacity, 64)
+        self._additions = 0
+
+    def _slots(self, key: str):
+        h = hash(key)
+        return [((h ^ seed) * 0x01000193 >> 7) & self._mask for seed in self._SEEDS]
+
+    def frequency(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._slots(key)))
+
+    def record(self, key: str) -> None:
+        for row, i in zip(self._rows, self._slots(key)):
+            if row[i] < 15:
+                row[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample:
+            self._additions //= 2
+            for row in self._rows:
+                row[:] = row.translate(self._HALVE)
+
+    def admit(self, candidate: str, victim: str) -> bool:
+        return self.frequency(candidate) > self.frequency(victim)
+
+
+# -------- Cache --------
+class _Stripe:
+    __slots__ = ("lock", "items", "bytes", "max_entries", "max_bytes", "policy",
+                 "hits", "misses", "evictions", "expired", "rejected")
+
+    def __init__(self, max_entries: int, max_bytes: int, policy):
+        self.lock = threading.Lock()
+        # key -> (ts, ttl, value, size); el orden del OrderedDict es el orden LRU
+        self.items: "OrderedDict[str, Tuple[float, int, Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.hits = self.misses = self.evictions = self.expired = self.rejected = 0
+
+    def drop(self, key: str) -> None:
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.bytes -= item[3]
+
 
 class SWRCache:
-    def __init__(self):
-        self._store: Dict[str, Tuple[float, int, Any]] = {}
-        self._lock = threading.Lock()
+    def __init__(
+        self,
+        max_entries: int = SWR_CACHE_MAX_ENTRIES,
+        max_bytes: int = SWR_CACHE_MAX_BYTES,
+        stripes: int = SWR_CACHE_STRIPES,
+        policy: str = SWR_CACHE_POLICY,
+        stale_grace: int = SWR_STALE_GRACE,
+    ):
+        stripes = max(1, stripes)
+        per_entries = max(1, max_entries // stripes)
+        per_bytes = max(1, max_bytes // stripes)
+
+        def make_policy():
+            return TinyLFUPolicy(per_entries) if policy == "tinylfu" else LRUPolicy()
+
+        self._stripes: List[_Stripe] = [_Stripe(per_entries, per_bytes, make_policy()) for _ in range(stripes)]
+        self._stale_grace = stale_grace
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def _dead(self, ts: float, ttl: int, now: float) -> bool:
+        return now - ts >= ttl + self._stale_grace
+
+    def _sweep_locked(self, s: _Stripe, now: float, budget: int = 4) -> None:
+        # Expiración perezosa: revisa unas pocas entradas del extremo LRU en cada set (sin copiar las llaves)
+        dead = [key for key, (ts, ttl, _, _) in islice(iter(s.items.items()), budget) if self._dead(ts, ttl, now)]
+        for key in dead:
+            s.drop(key)
+            s.expired += 1
 
     def set(self, key: str, value: Any, ttl: int = 900) -> None:
-        with self._lock:
-            self._store[key] = (time.time(), ttl, value)
+        size = approx_size(value)
+        now = time.time()
+        s = self._stripe(key)
+        with s.lock:
+            if size > s.max_bytes:
+                s.drop(key)
+                s.rejected += 1
+                return
+
+            # Una llave residente que se reemplaza (revalidación) ya fue admitida: no pasa por TinyLFU
+            resident = key in s.items
+            if resident:
+                s.drop(key)
+            else:
+                self._sweep_locked(s, now)
+
+            while s.items and (len(s.items) >= s.max_entries or s.bytes + size > s.max_bytes):
+                victim = next(iter(s.items))
+                if not resident and not s.policy.admit(key, victim):
+                    s.rejected += 1
+                    return
+                s.drop(victim)
+                s.evictions += 1
+
+            s.items[key] = (now, ttl, value, size)
+            s.bytes += size
 
     def get(self, key: str) -> Tuple[Optional[Any], bool]:
-        
-        with self._lock:
-            item = self._store.get(key)
+        s = self._stripe(key)
+        now = time.time()
+        with s.lock:
+            s.policy.record(key)
+            item = s.items.get(key)
             if not item:
+                s.misses += 1
                 return None, False
-            ts, ttl, val = item
-            fresh = (time.time() - ts) < ttl
+            ts, ttl, val, _ = item
+            if self._dead(ts, ttl, now):
+                s.drop(key)
+                s.expired += 1
+                s.misses += 1
+                return None, False
+            s.items.move_to_end(key)
+            s.hits += 1
+            fresh = (now - ts) < ttl
             return val, fresh
 
     def get_if_exists(self, key: str) -> Optional[Any]:
-        with self._lock:
-            item = self._store.get(key)
-            return None if not item else item[2]
+        s = self._stripe(key)
+        with s.lock:
+            item = s.items.get(key)
+            if not item or self._dead(item[0], item[1], time.time()):
+                return None
+            s.items.move_to_end(key)
+            return item[2]
+
+    def delete(self, key: str) -> None:
+        s = self._stripe(key)
+        with s.lock:
+            s.drop(key)
+
+    def __len__(self) -> int:
+        return sum(len(s.items) for s in self._stripes)
+
+    def stats(self) -> Dict[str, int]:
+        out = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expired": 0, "rejected": 0}
+        for s in self._stripes:
+            with s.lock:
+                out["entries"] += len(s.items)
+                out["bytes"] += s.bytes
+                out["hits"] += s.hits
+                out["misses"] += s.misses
+                out["evictions"] += s.evictions
+                out["expired"] += s.expired
+                out["rejected"] += s.rejected
+        return out
 
 swr_cache = SWRCache()
 
-__all__ = ["swr_cache"]
+__all__ = ["swr_cache", "SWRCache", "LRUPolicy", "TinyLFUPolicy", "approx_size"]
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+from bson import ObjectId
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+# ETags sobre el cuerpo JSON ya serializado: un solo dumps por respuesta,
+# el mismo bytes se hashea y se envía. Son débiles (W/): GZipMiddleware manda el
+# mismo ETag con el cuerpo gzip o identity, que no son idénticos byte a byte.
+CACHE_CONTROL = "private, no-cache"
+
+# orjson serializa datetime/numpy de forma nativa; NaN/Inf salen como null (JSON válido)
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def serialize(payload: Any) -> bytes:
+    return orjson.dumps(payload, default=_default, option=_ORJSON_OPTS)
+
+
+class ORJSONResponse(JSONResponse):
+    # Devolver la instancia desde el handler evita también el jsonable_encoder de FastAPI
+    def render(self, content: Any) -> bytes:
+        return serialize(content)
+
+
+def json_response(payload: Any, status_code: int = 200) -> ORJSONResponse:
+    return ORJSONResponse(payload, status_code=status_code)
+
+
+def etag_for(body: bytes) -> str:
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    # Comparación débil para If-None-Match (RFC 9110 §13.1.2)
+    return "*" in candidates or _opaque(etag) in {_opaque(c) for c in candidates}
+
+
+def conditional_json(request: Request, payload: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    # `headers` extra (p.ej. X-Cache-Fresh) van también en el 304: no forman parte del ETag
+    body = serialize(payload)
+    etag = etag_for(body)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+__all__ = ["conditional_json", "etag_for", "serialize", "json_response", "ORJSONResponse"]
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-import threading
+import os
 from typing import Dict, Any, Optional, Tuple, List
 from time import time
 
+from pymongo import UpdateOne
+
 from services.db import db
-from services.fast_cache import swr_cache
+from services.l2_cache import tiered_cache
+from services import repository
+from services.revalidation import async_single_flight, revalidator, single_flight
+from services.metrics import build_seconds, cache_requests, cold_builds, record_failure, revalidate_seconds
+
+# TTL de los shortcuts (SWR, kpi_cache); lo usan los endpoints y el pre-warmer
+KPI_TTL = int(os.getenv("KPI_TTL", "900"))
 
 def _safe_float(x) -> Optional[float]:
     if x is None:
@@ -44,7 +52,7 @@ def _growth_pct(curr: Optional[float], prev: Optional[float]) -> Optional[float]
 
 def _find_overview(sym: str) -> dict:
     return db["overview"].find_one(
-        {"$or": [{"Symbol": sym}, {"Ticket": sym}, {"symbol": sym}]},
+        {"symbol": sym},
         {
             "_id": 0,
             "RevenueTTM": 1, "GrossProfitTTM": 1,
@@ -54,11 +62,7 @@ def _find_overview(sym: str) -> dict:
         },
     ) or {}
 
-def _find_income_last_two(sym: str) -> tuple[Optional[float], Optional[float], Optional[float], Optional[float]]:
-    doc = db["income_statements"].find_one(
-        {"$or": [{"symbol": sym}, {"Symbol": sym}]},
-        {"_id": 0, "annualReports": 1}
-    )
+def income_last_two(doc: Optional[dict]) -> tuple[Optional[float], Optional[float], Optional[float], Optional[float]]:
     if not doc: return None, None, None, None
     ars = list(doc.get("annualReports") or [])
     ars.sort(key=lambda x: x.get("fiscalDateEnding") or "", reverse=True)
@@ -70,11 +74,7 @@ def _find_income_last_two(sym: str) -> tuple[Optional[float], Optional[float], O
     net_prev = _safe_float(prev.get("netIncome"))
     return rev_last, rev_prev, net_last, net_prev
 
-def _find_balance_latest(sym: str) -> dict:
-    doc = db["balance_sheets"].find_one(
-        {"$or": [{"symbol": sym}, {"Symbol": sym}]},
-        {"_id": 0, "annualReports": 1}
-    )
+def balance_latest(doc: Optional[dict]) -> dict:
     if not doc: return {}
     ars = list(doc.get("annualReports") or [])
     ars.sort(key=lambda x: x.get("fiscalDateEnding") or "", reverse=True)
@@ -87,16 +87,28 @@ def _find_balance_latest(sym: str) -> dict:
         "Equity": _safe_float(last.get("totalShareholderEquity")),
     }
 
-# -------- Bulder KPIs --------
-def _build_items(sym: str) -> Dict[str, Any]:
-    ov = _find_overview(sym)
+def _find_income_last_two(sym: str) -> tuple[Optional[float], Optional[float], Optional[float], Optional[float]]:
+    doc = db["income_statements"].find_one(
+        {"symbol": sym},
+        {"_id": 0, "annualReports": 1}
+    )
+    return income_last_two(doc)
+
+def _find_balance_latest(sym: str) -> dict:
+    doc = db["balance_sheets"].find_one(
+        {"symbol": sym},
+        {"_id": 0, "annualReports": 1}
+    )
+    return balance_latest(doc)
+
+# -------- KPIs numéricos --------
+def kpi_values(ov: dict, income: tuple, bal: dict) -> Dict[str, Optional[float]]:
     rev_ttm = _safe_float(ov.get("RevenueTTM"))
     gross_ttm = _safe_float(ov.get("GrossProfitTTM"))
     op_margin_ttm = _safe_float(ov.get("OperatingMarginTTM"))
     net_margin_ttm = _safe_float(ov.get("ProfitMargin"))
 
-    rev_last, rev_prev, net_last, net_prev = _find_income_last_two(sym)
-    bal = _find_balance_latest(sym)
+    rev_last, rev_prev, net_last, net_prev = income
 
     cash = bal.get("Cash")
     debt = bal.get("TotalDebt")
@@ -104,13 +116,30 @@ def _build_items(sym: str) -> Dict[str, Any]:
     curr_liab = bal.get("CurrentLiabilities")
     equity = bal.get("Equity")
 
-    net_cash = (cash - debt) if (cash is not None and debt is not None) else None
-    curr_ratio = (curr_assets / curr_liab) if (curr_assets and curr_liab and curr_liab != 0) else None
-    de_ratio = ((debt / equity) * 100.0) if (debt is not None and equity not in (None, 0)) else None
+    dy = _safe_float(ov.get("DividendYield"))
 
-    rev_yoy = _growth_pct(rev_last, rev_prev)
-    net_yoy = _growth_pct(net_last, net_prev)
+    return {
+        "revenue_ttm": rev_ttm,
+        "revenue_last": rev_last,
+        "revenue_yoy": _growth_pct(rev_last, rev_prev),
+        "net_income": net_last,
+        "net_income_yoy": _growth_pct(net_last, net_prev),
+        "cash": cash,
+        "debt": debt,
+        "net_cash": (cash - debt) if (cash is not None and debt is not None) else None,
+        "debt_to_equity": ((debt / equity) * 100.0) if (debt is not None and equity not in (None, 0)) else None,
+        "current_ratio": (curr_assets / curr_liab) if (curr_assets and curr_liab and curr_liab != 0) else None,
+        "gross_margin_ttm": (gross_ttm / rev_ttm) * 100.0 if (gross_ttm is not None and rev_ttm not in (None, 0)) else None,
+        "operating_margin_ttm": op_margin_ttm * 100.0 if op_margin_ttm is not None else None,
+        "net_margin_ttm": net_margin_ttm * 100.0 if net_margin_ttm is not None else None,
+        "market_cap": _safe_float(ov.get("MarketCapitalization")),
+        "eps": _safe_float(ov.get("EPS")),
+        "pe_ratio": _safe_float(ov.get("PERatio")),
+        "dividend_yield": dy * 100.0 if dy is not None else None,
+    }
 
+# -------- Bulder KPIs --------
+def _items_from_values(sym: str, v: Dict[str, Optional[float]]) -> Dict[str, Any]:
     items: List[Dict[str, Any]] = []
 
     def _add(title: str, value_str: str, delta: Optional[float] = None):
@@ -120,51 +149,53 @@ def _build_items(sym: str) -> Dict[str, Any]:
         items.append(d)
 
     # Earnings
-    if rev_ttm is not None:
-        _add("Ingresos TTM", _fmt_money(rev_ttm), rev_yoy)
-    elif rev_last is not None:
-        _add("Ingresos (últ. año)", _fmt_money(rev_last), rev_yoy)
+    if v["revenue_ttm"] is not None:
+        _add("Ingresos TTM", _fmt_money(v["revenue_ttm"]), v["revenue_yoy"])
+    elif v["revenue_last"] is not None:
+        _add("Ingresos (últ. año)", _fmt_money(v["revenue_last"]), v["revenue_yoy"])
 
     # Utilidad neta
-    if net_last is not None:
-        _add("Utilidad Neta", _fmt_money(net_last), net_yoy)
+    if v["net_income"] is not None:
+        _add("Utilidad Neta", _fmt_money(v["net_income"]), v["net_income_yoy"])
 
     # Caja / Deuda / Caja neta
-    if cash is not None:
-        _add("Caja", _fmt_money(cash))
-    if debt is not None:
-        _add("Deuda", _fmt_money(debt))
-    if net_cash is not None:
-        _add("Caja Neta", _fmt_money(net_cash))
+    if v["cash"] is not None:
+        _add("Caja", _fmt_money(v["cash"]))
+    if v["debt"] is not None:
+        _add("Deuda", _fmt_money(v["debt"]))
+    if v["net_cash"] is not None:
+        _add("Caja Neta", _fmt_money(v["net_cash"]))
 
     # Ratios
-    if de_ratio is not None:
-        _add("Deuda/Equity", _fmt_percent(de_ratio))
-    if curr_ratio is not None:
-        _add("Liquidez Corriente", f"{curr_ratio:.2f}×")
+    if v["debt_to_equity"] is not None:
+        _add("Deuda/Equity", _fmt_percent(v["debt_to_equity"]))
+    if v["current_ratio"] is not None:
+        _add("Liquidez Corriente", f"{v['current_ratio']:.2f}×")
 
     # Márgenes TTM
-    if gross_ttm is not None and rev_ttm not in (None, 0):
-        _add("Gross Margin (TTM)", _fmt_percent((gross_ttm / rev_ttm) * 100.0))
-    if op_margin_ttm is not None:
-        _add("Operating Margin (TTM)", _fmt_percent(op_margin_ttm * 100.0))
-    if net_margin_ttm is not None:
-        _add("Net Margin (TTM)", _fmt_percent(net_margin_ttm * 100.0))
+    if v["gross_margin_ttm"] is not None:
+        _add("Gross Margin (TTM)", _fmt_percent(v["gross_margin_ttm"]))
+    if v["operating_margin_ttm"] is not None:
+        _add("Operating Margin (TTM)", _fmt_percent(v["operating_margin_ttm"]))
+    if v["net_margin_ttm"] is not None:
+        _add("Net Margin (TTM)", _fmt_percent(v["net_margin_ttm"]))
 
     # Extras overview
-    mc = _safe_float(ov.get("MarketCapitalization"))
-    if mc is not None: _add("Market Cap", _fmt_money(mc))
-    eps = _safe_float(ov.get("EPS"))
-    if eps is not None: _add("EPS (ttm)", f"{eps:.2f}")
-    pe = _safe_float(ov.get("PERatio"))
-    if pe is not None: _add("PE Ratio", f"{pe:.2f}")
-    dy = _safe_float(ov.get("DividendYield"))
-    if dy is not None: _add("Dividend Yield", _fmt_percent(dy * 100.0))
+    if v["market_cap"] is not None: _add("Market Cap", _fmt_money(v["market_cap"]))
+    if v["eps"] is not None: _add("EPS (ttm)", f"{v['eps']:.2f}")
+    if v["pe_ratio"] is not None: _add("PE Ratio", f"{v['pe_ratio']:.2f}")
+    if v["dividend_yield"] is not None: _add("Dividend Yield", _fmt_percent(v["dividend_yield"]))
 
     return {"symbol": sym, "items": items}
 
+def _build_items(sym: str) -> Dict[str, Any]:
+    with build_seconds.time("kpis"):
+        ov = _find_overview(sym)
+        values = kpi_values(ov, _find_income_last_two(sym), _find_balance_latest(sym))
+        return _items_from_values(sym, values)
+
 # -------- SWR + kpi_cache --------
-def _cache_key(sym: str) -> str:
+def cache_key(sym: str) -> str:
     return f"kpis_ultra:{sym}"
 
 def _persist_get(sym: str) -> Optional[Dict[str, Any]]:
@@ -174,37 +205,166 @@ def _persist_get(sym: str) -> Optional[Dict[str, Any]]:
 def _persist_set(sym: str, data: Dict[str, Any]) -> None:
     db["kpi_cache"].update_one({"_id": sym}, {"$set": {"data": data, "ts": time()}}, upsert=True)
 
-def _revalidate(sym: str, ttl: int):
-    
+def revalidate(sym: str, ttl: int = KPI_TTL) -> None:
     try:
-        data = _build_items(sym)
-        swr_cache.set(_cache_key(sym), data, ttl=ttl)
-        _persist_set(sym, data)
+        with revalidate_seconds.time("kpis"):
+            data = _build_items(sym)
+            tiered_cache.set(cache_key(sym), data, ttl=ttl)
+            _persist_set(sym, data)
     except Exception:
-        pass
+        record_failure("kpis_revalidate")
+
+def _schedule_revalidate(sym: str, ttl: int) -> None:
+    # Single-flight: una ráfaga de hits stale del mismo símbolo encola una sola revalidación
+    revalidator.submit(cache_key(sym), revalidate, sym, ttl)
 
-def compute_shortcuts_ultra(symbol: str, allow_stale: bool = True, ttl: int = 900) -> Tuple[Dict[str, Any], bool]:
+def _cold_build(sym: str, ttl: int) -> Dict[str, Any]:
+    cold_builds.inc("kpis")
+    data = _build_items(sym)
+    tiered_cache.set(cache_key(sym), data, ttl=ttl)
+    _persist_set(sym, data)
+    return data
+
+async def _cold_build_async(sym: str, ttl: int) -> Dict[str, Any]:
+    cold_builds.inc("kpis")
+    # overview + income + balance en paralelo
+    ov, income_doc, balance_doc = await repository.find_kpi_docs(sym)
+    data = _items_from_values(sym, kpi_values(ov, income_last_two(income_doc), balance_latest(balance_doc)))
+    await tiered_cache.aset(cache_key(sym), data, ttl=ttl)
+    await repository.save_kpi_cache(sym, data)
+    return data
+
+def compute_shortcuts_ultra(symbol: str, allow_stale: bool = True, ttl: int = KPI_TTL) -> Tuple[Dict[str, Any], bool]:
     sym = (symbol or "").upper()
-    key = _cache_key(sym)
+    key = cache_key(sym)
 
     # memoria
-    val, fresh = swr_cache.get(key)
+    val, fresh = tiered_cache.get(key)
     if val is not None:
         if not fresh and allow_stale:
-            threading.Thread(target=_revalidate, args=(sym, ttl), daemon=True).start()
+            _schedule_revalidate(sym, ttl)
         return val, fresh
 
     # persistente
     persisted = _persist_get(sym)
     if persisted is not None:
-        swr_cache.set(key, persisted, ttl=ttl)
+        cache_requests.inc("kpis_ultra", "mongo", "stale")
+        tiered_cache.set(key, persisted, ttl=ttl)
         if allow_stale:
-            threading.Thread(target=_revalidate, args=(sym, ttl), daemon=True).start()
+            _schedule_revalidate(sym, ttl)
         return persisted, False
 
-    data = _build_items(sym)
-    swr_cache.set(key, data, ttl=ttl)
-    _persist_set(sym, data)
-    return data, True
+    # cold miss: los llamadores concurrentes esperan el mismo build
+    return single_flight.do(key, lambda: _cold_build(sym, ttl)), True
+
+async def compute_shortcuts_async(symbol: str, allow_stale: bool = True, ttl: int = KPI_TTL) -> Tuple[Dict[str, Any], bool]:
+    sym = (symbol or "").upper()
+    key = cache_key(sym)
+
+    val, fresh = await tiered_cache.aget(key)
+    if val is not None:
+        if not fresh and allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return val, fresh
+
+    persisted = await repository.find_kpi_cache(sym)
+    if persisted is not None:
+        cache_requests.inc("kpis_ultra", "mongo", "stale")
+        await tiered_cache.aset(key, persisted, ttl=ttl)
+        if allow_stale:
+            _schedule_revalidate(sym, ttl)
+        return persisted, False
+
+    return await async_single_flight.do(key, lambda: _cold_build_async(sym, ttl)), True
+
+# -------- Batch (watchlist / recientes) --------
+def _build_items_many(symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    # Una consulta $in por colección para todos los símbolos
+    overview_proj = {
+        "_id": 0, "symbol": 1,
+        "RevenueTTM": 1, "GrossProfitTTM": 1,
+        "OperatingMarginTTM": 1, "ProfitMargin": 1,
+        "EPS": 1, "PERatio": 1, "DividendYield": 1,
+        "MarketCapitalization": 1,
+    }
+    overviews = {d["symbol"]: d for d in db["overview"].find({"symbol": {"$in": symbols}}, overview_proj)}
+    incomes = {
+        d["symbol"]: d
+        for d in db["income_statements"].find({"symbol": {"$in": symbols}}, {"_id": 0, "symbol": 1, "annualReports": 1})
+    }
+    balances = {
+        d["symbol"]: d
+        for d in db["balance_sheets"].find({"symbol": {"$in": symbols}}, {"_id": 0, "symbol": 1, "annualReports": 1})
+    }
+    return {
+        sym: _items_from_values(sym, kpi_values(
+            overviews.get(sym) or {}, income_last_two(incomes.get(sym)), balance_latest(balances.get(sym))
+        ))
+        for sym in symbols
+    }
+
+def _store_many(built: Dict[str, Dict[str, Any]], ttl: int) -> None:
+    for sym, data in built.items():
+        tiered_cache.set(cache_key(sym), data, ttl=ttl)
+    if built:
+        db["kpi_cache"].bulk_write(
+            [UpdateOne({"_id": sym}, {"$set": {"data": data, "ts": time()}}, upsert=True) for sym, data in built.items()],
+            ordered=False,
+        )
+
+def revalidate_many(symbols: List[str], ttl: int = KPI_TTL) -> None:
+    try:
+        with revalidate_seconds.time("kpis_batch"):
+            _store_many(_build_items_many(symbols), ttl)
+    except Exception:
+        record_failure("kpis_revalidate")
+
+def compute_shortcuts_batch(symbols: List[str], allow_stale: bool = True, ttl: int = KPI_TTL) -> Dict[str, Any]:
+    # {"shortcuts": {sym: data}, "fresh": {sym: bool}}: fresh=False si se sirvió stale y se está revalidando
+    syms = list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+    out: Dict[str, Dict[str, Any]] = {}
+    stale: List[str] = []
+
+    # memoria / L2
+    pending = []
+    for sym in syms:
+        val, fresh = tiered_cache.get(cache_key(sym))
+        if val is None:
+            pending.append(sym)
+            continue
+        out[sym] = val
+        if not fresh:
+            stale.append(sym)
+
+    # kpi_cache: un solo $in
+    if pending:
+        for doc in db["kpi_cache"].find({"_id": {"$in": pending}}, {"data": 1}):
+            if doc.get("data") is None:
+                continue
+            out[doc["_id"]] = doc["data"]
+            tiered_cache.set(cache_key(doc["_id"]), doc["data"], ttl=ttl)
+            stale.append(doc["_id"])
+        pending = [sym for sym in pending if sym not in out]
+
+    # misses: un $in por colección fuente
+    if pending:
+        cold_builds.inc("kpis_batch")
+        with build_seconds.time("kpis_batch"):
+            built = _build_items_many(pending)
+        _store_many(built, ttl)
+        out.update(built)
+
+    if stale and allow_stale:
+        revalidator.submit_many({cache_key(sym): sym for sym in stale}, revalidate_many, ttl)
+
+    stale_set = set(stale)
+    return {
+        "shortcuts": {sym: out[sym] for sym in syms if sym in out},
+        "fresh": {sym: sym not in stale_set for sym in syms if sym in out},
+    }
 
-__all__ = ["compute_shortcuts_ultra"]
+__all__ = [
+    "compute_shortcuts_ultra", "compute_shortcuts_async", "compute_shortcuts_batch", "KPI_TTL",
+    "revalidate", "revalidate_many", "cache_key",
+    "income_last_two", "balance_latest", "kpi_values",
+]
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from services.fast_cache import SWR_STALE_GRACE, SWRCache, swr_cache
+from services.metrics import CounterFunc, Gauge, cache_namespace, cache_requests, register, stats_collector
+
+# L2 compartido entre los workers de uvicorn del mismo host: SQLite en modo WAL
+# (lectores concurrentes, un escritor a la vez). Se ubica entre swr_cache (L1, por
+# proceso) y las colecciones kpi_cache / dashboard_cache de Mongo.
+L2_CACHE_ENABLED = os.getenv("L2_CACHE_ENABLED", "1") == "1"
+L2_CACHE_PATH = os.getenv("L2_CACHE_PATH", "/tmp/finalytics_l2.sqlite3")
+L2_CACHE_MAX_ENTRIES = int(os.getenv("L2_CACHE_MAX_ENTRIES", "50000"))
+L2_CACHE_SWEEP_EVERY = int(os.getenv("L2_CACHE_SWEEP_EVERY", "500"))   # sets entre barridos
+L2_BUSY_TIMEOUT_MS = int(os.getenv("L2_BUSY_TIMEOUT_MS", "2000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key   TEXT PRIMARY KEY,
+    ts      REAL NOT NULL,
+    ttl     INTEGER NOT NULL,
+    value   BLOB NOT NULL,
+    version INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kv_ts ON kv (ts);
+"""
+
+
+class SQLiteL2Cache:
+    def __init__(self, path: str = L2_CACHE_PATH, max_entries: int = L2_CACHE_MAX_ENTRIES,
+                 stale_grace: int = SWR_STALE_GRACE):
+        self.path = path
+        self.max_entries = max_entries
+        self.stale_grace = stale_grace
+        self._local = threading.local()
+        self._sets = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.errors = 0
+
+    # Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=L2_BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={L2_BUSY_TIMEOUT_MS}")
+            conn.executescript(_SCHEMA)
+            try:
+                # Archivos creados antes de la columna version
+                conn.execute("ALTER TABLE kv ADD COLUMN version INTEGER")
+            except sqlite3.OperationalError:
+                pass
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Tuple[Optional[Any], bool, float]:
+        """(valor, fresco, segundos de TTL restantes)."""
+        try:
+            row = self._conn().execute("SELECT ts, ttl, value FROM kv WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            self.errors += 1
+            return None, False, 0.0
+        if row is None:
+            self.misses += 1
+            return None, False, 0.0
+        ts, ttl, blob = row
+        age = time.time() - ts
+        if age >= ttl + self.stale_grace:
+            self.misses += 1
+            self.delete(key)
+            return None, False, 0.0
+        self.hits += 1
+        return json.loads(blob), age < ttl, max(0.0, ttl - age)
+
+    def set(self, key: str, value: Any, ttl: int, version: Optional[int] = None) -> None:
+        # Con version, una escritura más vieja que la guardada no la reemplaza
+        # (un lector lento no puede pisar el write-through de un escritor)
+        try:
+            blob = json.dumps(value, default=str, separators=(",", ":"))
+            self._conn().execute(
+                "INSERT INTO kv (key, ts, ttl, value, version) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET ts = excluded.ts, ttl = excluded.ttl, "
+                "value = excluded.value, version = excluded.version "
+                "WHERE excluded.version IS NULL OR kv.version IS NULL OR excluded.version >= kv.version",
+                (key, time.time(), int(ttl), blob, version),
+            )
+        except (sqlite3.Error, TypeError, ValueError):
+            self.errors += 1
+            return
+        with self._lock:
+            self._sets += 1
+            sweep = self._sets % L2_CACHE_SWEEP_EVERY == 0
+        if sweep:
+            self.sweep()
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+        except sqlite3.Error:
+            self.errors += 1
+
+    def sweep(self) -> None:
+        # Expiración perezosa + tope de entradas (se van las más viejas)
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM kv WHERE ts + ttl + ? < ?", (self.stale_grace, time.time()))
+            conn.execute(
+                "DELETE FROM kv WHERE key IN (SELECT key FROM kv ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        except sqlite3.Error:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class TieredCache:
+    """L1 en memoria (SWRCache) + L2 compartido; misma API get/set/get_if_exists que SWRCache.
+
+    El L2 es I/O bloqueante (SQLite, hasta L2_BUSY_TIMEOUT_MS con el lock ocupado):
+    desde coroutines usar aget/aset, que lo llevan a un hilo.
+    """
+
+    def __init__(self, l1: SWRCache, l2: Optional[SQLiteL2Cache]):
+        self.l1 = l1
+        self.l2 = l2
+
+    def _from_l1(self, ns: str, val: Optional[Any], fresh: bool) -> bool:
+        # True si el L1 resuelve la lectura sin tocar el L2
+        if val is not None and (fresh or self.l2 is None):
+            cache_requests.inc(ns, "l1", "hit" if fresh else "stale")
+            return True
+        if self.l2 is None:
+            cache_requests.inc(ns, "l1", "miss")
+            return True
+        return False
+
+    def get(self, key: str) -> Tuple[Optional[Any], bool]:
+        ns = cache_namespace(key)
+        val, fresh = self.l1.get(key)
+        if self._from_l1(ns, val, fresh):
+            return val, fresh
+        return self._from_l2(ns, key, val, self.l2.get(key))
+
+    async def aget(self, key: str) -> Tuple[Optional[Any], bool]:
+        ns = cache_namespace(key)
+        val, fresh = self.l1.get(key)
+        if self._from_l1(ns, val, fresh):
+            return val, fresh
+        return self._from_l2(ns, key, val, await asyncio.to_thread(self.l2.get, key))
+
+    def _from_l2(self, ns: str, key: str, l1_val: Optional[Any], l2_result) -> Tuple[Optional[Any], bool]:
+        # L1 stale o ausente: otro worker (o el pre-warmer) pudo haber refrescado el L2
+        val, fresh, remaining = l2_result
+        if val is None or (l1_val is not None and not fresh):
+            if l1_val is not None:
+                cache_requests.inc(ns, "l1", "stale")
+                return l1_val, False
+            cache_requests.inc(ns, "l2", "miss")
+            return val, fresh
+        cache_requests.inc(ns, "l2", "hit" if fresh else "stale")
+        # Se promueve con el TTL restante para no extender la frescura
+        self.l1.set(key, val, ttl=int(remaining))
+        return val, fresh
+
+    def get_if_exists(self, key: str) -> Optional[Any]:
+        val, _ = self.get(key)
+        return val
+
+    def set(self, key: str, value: Any, ttl: int = 900) -> None:
+        self.l1.set(key, value, ttl=ttl)
+        if self.l2 is not None:
+            self.l2.set(key, value, ttl)
+
+    async def aset(self, key: str, value: Any, ttl: int = 900) -> None:
+        self.l1.set(key, value, ttl=ttl)
+        if self.l2 is not None:
+            await asyncio.to_thread(self.l2.set, key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.l1.delete(key)
+        if self.l2 is not None:
+            self.l2.delete(key)
+
+
+l2_cache = SQLiteL2Cache() if L2_CACHE_ENABLED else None
+tiered_cache = TieredCache(swr_cache, l2_cache)
+
+register(Gauge(
+    "finalytics_swr_cache", "Estado del SWRCache en memoria (entries, bytes).", ("stat",),
+    stats_collector(swr_cache.stats, ("entries", "bytes")),
+))
+register(CounterFunc(
+    "finalytics_swr_cache_events_total", "Eventos del SWRCache (hits, misses, evictions, expired, rejected).", ("event",),
+    stats_collector(swr_cache.stats, ("hits", "misses", "evictions", "expired", "rejected")),
+))
+register(CounterFunc(
+    "finalytics_l2_cache_events_total", "Eventos del L2 SQLite de este proceso (hits, misses, errors).", ("event",),
+    stats_collector(lambda: l2_cache.stats() if l2_cache else {}, ("hits", "misses", "errors")),
+))
+
+__all__ = ["tiered_cache", "l2_cache", "TieredCache", "SQLiteL2Cache"]
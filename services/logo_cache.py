@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from time import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from .db import db
+
+COLLECTION = "companyLogos"
+
+LOGO_TTL = int(os.getenv("LOGO_TTL", str(30 * 24 * 3600)))          # logo encontrado
+LOGO_MISS_TTL = int(os.getenv("LOGO_MISS_TTL", str(24 * 3600)))     # caché negativo
+LOGO_HTTP_TIMEOUT = float(os.getenv("LOGO_HTTP_TIMEOUT", "3"))
+
+# Mensajes que CompanyData ya devolvía en "logo"
+NOT_AVAILABLE = "Logo not available"
+NOT_FOUND = "Logo not found"
+INVALID_URL = "Invalid URL"
+
+
+def _is_valid_url(url: str) -> bool:
+    return url.startswith("http://") or url.startswith("https://")
+
+
+def logo_candidate(official_site: str) -> str:
+    domain = urlparse(official_site).netloc.replace("www.", "")
+    return f"https://logo.clearbit.com/{domain}"
+
+
+def _is_expired(doc: Dict[str, Any]) -> bool:
+    ttl = LOGO_MISS_TTL if doc.get("status") == "miss" else LOGO_TTL
+    return (time() - float(doc.get("ts") or 0)) >= ttl
+
+
+# -------- Resolver en segundo plano --------
+class LogoResolver:
+    def __init__(self):
+        self._queue: "queue.Queue[tuple[str, str]]" = queue.Queue()
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, symbol: str, official_site: str) -> None:
+        with self._lock:
+            if symbol in self._pending:
+                return
+            self._pending.add(symbol)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="logo-resolver", daemon=True)
+                self._thread.start()
+        self._queue.put((symbol, official_site))
+
+    def _run(self) -> None:
+        while True:
+            symbol, official_site = self._queue.get()
+            try:
+                self.resolve(symbol, official_site)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._pending.discard(symbol)
+
+    @staticmethod
+    def resolve(symbol: str, official_site: str) -> Dict[str, Any]:
+        logo_url = logo_candidate(official_site)
+        try:
+            response = requests.get(logo_url, timeout=LOGO_HTTP_TIMEOUT)
+            status = "ok" if response.status_code == 200 else "miss"
+        except requests.exceptions.RequestException:
+            status = "miss"
+
+        entry = {
+            "symbol": symbol,
+            "Symbol": symbol,
+            "OfficialSite": official_site,
+            "LogoUrl": logo_url if status == "ok" else None,
+            "status": status,
+            "ts": time(),
+        }
+        db[COLLECTION].update_one({"symbol": symbol}, {"$set": entry}, upsert=True)
+        return entry
+
+
+resolver = LogoResolver()
+
+
+# -------- Lectura (nunca bloquea en HTTP) --------
+def find_cached(symbol: str) -> Optional[Dict[str, Any]]:
+    return db[COLLECTION].find_one({"symbol": symbol}, {"_id": 0})
+
+
+def get_logo(symbol: str, official_site: Optional[str], cached: Optional[Dict[str, Any]] = None) -> str:
+    if not official_site:
+        return NOT_AVAILABLE
+    if not _is_valid_url(official_site):
+        return INVALID_URL
+
+    if cached is None or cached.get("OfficialSite") not in (None, official_site) or _is_expired(cached):
+        resolver.submit(symbol, official_site)
+
+    if not cached:
+        return NOT_AVAILABLE
+    if cached.get("status") == "miss":
+        return NOT_FOUND
+    return cached.get("LogoUrl") or NOT_AVAILABLE
+
+
+__all__ = ["get_logo", "find_cached", "resolver", "LOGO_TTL", "LOGO_MISS_TTL"]
@@ -1,23 +1,48 @@
 import sys
 import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from services.db import db
-from services.dashboard_data_builder import DashboardData
 from services.db import docs_col, emb_col
 from services.user_prefs import (
-    get_prefs, get_display_name, set_display_name,
-    get_theme, set_theme,
+    set_display_name, set_theme,
     get_watchlist, get_recents, remove_recent,
-    get_watchlist, add_to_watchlist, remove_from_watchlist, touch_recent
+    add_to_watchlist, remove_from_watchlist, touch_recent
 )
-from services.kpi_services import compute_shortcuts_ultra
-from fastapi.encoders import jsonable_encoder
-from bson import ObjectId
-
-app = FastAPI()
+from services.kpi_services import KPI_TTL, compute_shortcuts_async, compute_shortcuts_batch
+from services.dashboard_cache import DASHBOARD_TTL, compute_dashboard_async, compute_dashboards_batch
+from services import repository
+from services.presentation import present_dashboard
+from services.screener import screen
+from services import peer_index
+from services.migrations import bootstrap
+from services import metrics
+from services import prewarmer
+from services.http_cache import ORJSONResponse, conditional_json, json_response
+from services import bulk_export
+from services import embeddings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MONGO_BOOTSTRAP=1: create_index no destructivo; la migración (backfill, dedupe) va por CLI
+    bootstrap()
+    peer_index.start()
+    prewarmer.start()
+    yield
+    prewarmer.stop()
+
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "2048"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# Solo si el cliente manda Accept-Encoding: gzip y el cuerpo supera el umbral
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
 
 class DocumentData(BaseModel):
     id: str = Field(..., alias="_id")
@@ -28,23 +53,93 @@ class DocumentData(BaseModel):
     class Config:
         allow_population_by_field_name = True
 
+class VectorBatch(BaseModel):
+    model: str
+    hashes: List[str]
+    dim: int = Field(..., ge=1)
+    vectors: str = Field(..., description="float32 [len(hashes), dim] little-endian, en base64")
+
+class SummaryRecord(BaseModel):
+    summary: str
+    doc_hash: str
+    prompt_version: str
+    model: str
+
+class ScreenFilter(BaseModel):
+    metric: str
+    op: Literal[">", ">=", "<", "<=", "==", "!="]
+    value: float
+    year: int = Field(0, ge=0, description="0 = último año fiscal, 1 = el anterior, ...")
+
+class ScreenRequest(BaseModel):
+    filters: List[ScreenFilter] = []
+    sector: Optional[str] = None
+    industry: Optional[str] = None
+    sort_by: Optional[str] = None
+    sort_year: int = Field(0, ge=0)
+    descending: bool = True
+    offset: int = Field(0, ge=0)
+    limit: int = Field(50, ge=1, le=500)
+    fields: Optional[List[str]] = None
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics_api():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/dashboard")
+def get_dashboards(
+    symbols: str = Query(..., description="Símbolos separados por coma, p.ej. AAPL,MSFT"),
+    format: Literal["formatted", "raw"] = "formatted",
+):
+    result = compute_dashboards_batch(symbols.split(","), allow_stale=True, ttl=DASHBOARD_TTL)
+    if format != "raw":
+        result["dashboards"] = {sym: present_dashboard(raw) for sym, raw in result["dashboards"].items()}
+    return json_response(result)
+
 @app.get("/api/dashboard/{symbol}")
-def get_dashboard(symbol: str):
-    company = DashboardData(symbol)
-    return company.get_full_data()
+async def get_dashboard(request: Request, symbol: str, format: Literal["formatted", "raw"] = "formatted"):
+    # raw: tablas columnares {years: [int], series: {métrica: [float|int|null]}} sin re-parseo en el cliente
+    try:
+        data, _ = await compute_dashboard_async(symbol, allow_stale=True, ttl=DASHBOARD_TTL)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Solo símbolos que resolvieron: un 404 no entra al ranking del pre-warmer
+    prewarmer.record_access(symbol)
+    return conditional_json(request, data if format == "raw" else present_dashboard(data))
+
+@app.post("/api/screen")
+def screen_api(req: ScreenRequest):
+    try:
+        return screen(
+            [f.model_dump() for f in req.filters],
+            sector=req.sector, industry=req.industry,
+            sort_by=req.sort_by, sort_year=req.sort_year, descending=req.descending,
+            offset=req.offset, limit=req.limit, fields=req.fields,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/peers/{symbol}")
+def get_peers(symbol: str):
+    ready = peer_index.is_ready()
+    result = peer_index.get_peer_percentiles(symbol)
+    if result is None and not ready:
+        raise HTTPException(status_code=503, detail="Peer index is still building", headers={"Retry-After": "5"})
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Symbol '{symbol.upper()}' not found in peer index")
+    return result
 
 @app.get("/document/{symbol}")
-def get_document(symbol: str):
-    doc = docs_col.find_one({"_id": symbol.upper()})
+async def get_document(symbol: str):
+    doc = await repository.find_document(symbol.upper())
     if not doc:
         return {"exists": False, "message": "Document not found"}
 
-    doc["_id"] = str(doc["_id"])
-    return {"exists": True, "document": doc}
+    return json_response({"exists": True, "document": doc})
 
 @app.post("/document/")
 def save_document(doc_data: DocumentData):
@@ -61,38 +156,102 @@ def save_document(doc_data: DocumentData):
         "_id": symbol_upper,
         "trend_summary": doc_data.trend_summary,
         "table_summary": doc_data.table_summary,
-        "sec_text_full_clean": doc_data.sec_text_full_clean
+        "sec_text_full_clean": doc_data.sec_text_full_clean,
+        "doc_hash": repository.doc_hash(doc_data.sec_text_full_clean),
     }
 
-    print("=== DEBUG: data_to_save ===")
-    for key, value in data_to_save.items():
-        print(f"{key}: {type(value)} -> {value[:100] + '...' if isinstance(value, str) and len(value) > 100 else value}")
-
     result = docs_col.insert_one(data_to_save)
     return {"success": True, "inserted_id": str(result.inserted_id)}
 
+def _export(col, key: str, after: Optional[str], limit: Optional[int], fields: Optional[str], format: str):
+    # json: una página + next_after; ndjson: una fila por línea, escrita desde el cursor de Mongo
+    try:
+        projection = bulk_export.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        rows = bulk_export.iter_ndjson(
+            col, after=after, limit=bulk_export.clamp_limit(limit, streaming=True), projection=projection,
+        )
+        return StreamingResponse(rows, media_type=bulk_export.NDJSON_MEDIA_TYPE)
+    rows, next_after = bulk_export.read_page(
+        col, after=after, limit=bulk_export.clamp_limit(limit), projection=projection,
+    )
+    return json_response({key: rows, "next_after": next_after})
+
 @app.get("/all-docs")
-def get_all_docs():
-    docs = list(docs_col.find({}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
-    return {"documents": docs}
+def get_all_docs(
+    after: Optional[str] = Query(None, description="Último _id recibido (next_after de la página anterior)"),
+    limit: Optional[int] = Query(None, ge=0, description="Tamaño de página; en ndjson 0 = todo"),
+    fields: Optional[str] = Query(None, description="all | ids | no_text | campo1,campo2 | -campo"),
+    format: Literal["json", "ndjson"] = "json",
+):
+    return _export(docs_col, "documents", after, limit, fields, format)
 
 @app.get("/all-embeddings")
-def get_all_embeddings():
-    embeddings = list(emb_col.find({}))
-    for e in embeddings:
-        e["_id"] = str(e["_id"])
-    return {"embeddings": embeddings}
+def get_all_embeddings(
+    after: Optional[str] = Query(None, description="Último _id recibido (next_after de la página anterior)"),
+    limit: Optional[int] = Query(None, ge=0, description="Tamaño de página; en ndjson 0 = todo"),
+    fields: Optional[str] = Query(None, description="all | ids | no_text | campo1,campo2 | -campo"),
+    format: Literal["json", "ndjson"] = "json",
+):
+    return _export(emb_col, "embeddings", after, limit, fields, format)
+
+@app.get("/embeddings.npy")
+def get_embeddings_npy(
+    symbol: Optional[str] = None,
+    model: Optional[str] = None,
+    after: Optional[str] = Query(None, description="X-Next-After de la página anterior"),
+    limit: int = Query(embeddings.EMB_NPY_DEFAULT_LIMIT, ge=1, le=embeddings.EMB_NPY_MAX_LIMIT),
+    ids: Literal["_id", "chunk_hash"] = "_id",
+):
+    # float32 [n, dim] contiguo; fila i <-> X-Embedding-Ids[i]
+    try:
+        body, ids, next_after = embeddings.npy_page(
+            symbol=symbol, model=model, after=after, limit=limit, id_field=ids,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {"X-Embedding-Ids": embeddings.ids_header(ids)}
+    if next_after:
+        headers["X-Next-After"] = next_after
+    return Response(content=body, media_type=embeddings.NPY_MEDIA_TYPE, headers=headers)
+
+@app.post("/embeddings/{symbol}")
+def save_embeddings(symbol: str, batch: VectorBatch):
+    try:
+        matrix = embeddings.decode_matrix(batch.vectors, len(batch.hashes), batch.dim)
+        inserted = embeddings.save_vectors(symbol, batch.model, batch.hashes, matrix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "inserted": inserted}
 
 @app.get("/analysis/{symbol}/summary")
-def get_summary(symbol: str):
-    rec = db["analysis"].find_one({"symbol": symbol.upper()}) or {}
-    return {"summary": rec.get("summary", "")}
+async def get_summary(symbol: str, prompt_version: Optional[str] = None, model: Optional[str] = None):
+    # fresh: el summary guardado corresponde al documento actual (y al prompt/modelo pedidos)
+    sym = symbol.upper()
+    rec, current = await asyncio.gather(repository.find_analysis(sym), repository.current_doc_hash(sym))
+    expected = {"doc_hash": current, "prompt_version": prompt_version, "model": model}
+    fresh = bool(rec.get("summary")) and current is not None and all(
+        v is None or rec.get(k) == v for k, v in expected.items()
+    )
+    return {
+        "summary": rec.get("summary", ""),
+        "fresh": fresh,
+        "doc_hash": rec.get("doc_hash"),
+        "prompt_version": rec.get("prompt_version"),
+        "model": rec.get("model"),
+        "generated_at": rec.get("generated_at"),
+    }
+
+@app.put("/analysis/{symbol}/summary")
+async def put_summary(symbol: str, record: SummaryRecord):
+    await repository.save_analysis(symbol.upper(), record.model_dump())
+    return {"success": True}
 
 @app.get("/docs/{symbol}/preview")
-def get_preview(symbol: str):
-    doc = db["docs"].find_one({"_id": symbol.upper()}) or {}
+async def get_preview(symbol: str):
+    doc = await repository.find_preview_doc(symbol.upper())
     preview_txt = (
         (doc.get("trend_summary") or "") + "\n\n" + (doc.get("table_summary") or "")
     ).strip()
@@ -101,26 +260,14 @@ def get_preview(symbol: str):
 ### FROTEND OPTIONS ###
 
 @app.get("/user/{user_id}/prefs")
-def get_user_prefs(user_id: str):
-
-    def to_json_safe(data):
-        """Convierte ObjectId y otros tipos no serializables en tipos válidos de JSON."""
-        if isinstance(data, list):
-            return [to_json_safe(v) for v in data]
-        elif isinstance(data, dict):
-            return {k: to_json_safe(v) for k, v in data.items()}
-        elif isinstance(data, ObjectId):
-            return str(data)
-        else:
-            return data
-
-    prefs = get_prefs(user_id)
-    safe_prefs = to_json_safe(prefs)
-    return jsonable_encoder(safe_prefs)
+async def get_user_prefs(request: Request, user_id: str):
+    # ObjectId/datetime los resuelve serialize() (orjson)
+    prefs = await repository.get_prefs(user_id)
+    return conditional_json(request, prefs)
 
 @app.get("/user/{user_id}/display-name")
-def get_display_name_api(user_id: str):
-    name = get_display_name(user_id)
+async def get_display_name_api(user_id: str):
+    name = await repository.get_display_name(user_id)
     return {"display_name": name}
 
 @app.post("/user/{user}/display-name/{name}")
@@ -129,8 +276,8 @@ def set_display_name_api(user: str, name: str):
     return {"status": "ok"}
 
 @app.get("/user/{user_id}/theme")
-def get_theme_api(user_id: str):
-    theme = get_theme(user_id)
+async def get_theme_api(user_id: str):
+    theme = await repository.get_theme(user_id)
     return {"theme": theme}   
 
 @app.post("/user/{user}/theme/{theme}")
@@ -139,8 +286,8 @@ def set_theme_api(user: str, theme: str):
     return {"status": "ok"}
 
 @app.get("/user/{user_id}/watchlist")
-def get_watchlist_api(user_id: str):
-    return {"watchlist": get_watchlist(user_id)}
+async def get_watchlist_api(user_id: str):
+    return {"watchlist": await repository.get_watchlist(user_id)}
 
 @app.post("/user/{user_id}/watchlist/{symbol}")
 def add_to_watchlist_api(user_id: str, symbol: str):
@@ -151,8 +298,8 @@ def remove_from_watchlist_api(user_id: str, symbol: str):
     return {"watchlist": remove_from_watchlist(symbol, user_id)}
 
 @app.get("/user/{user_id}/recents")
-def get_recents_api(user_id: str):
-    return {"recents": get_recents(user_id)}
+async def get_recents_api(user_id: str):
+    return {"recents": await repository.get_recents(user_id)}
 
 @app.delete("/user/{user_id}/recents/{symbol}")
 def remove_recent_api(user_id: str, symbol: str):
@@ -160,8 +307,17 @@ def remove_recent_api(user_id: str, symbol: str):
     return {"status": "ok", "recents": get_recents(user_id)}
 
 @app.get("/user/{symbol}/shortcuts")
-def get_shortcuts_api(symbol: str):
-    return compute_shortcuts_ultra(symbol, allow_stale=True, ttl=900)
+async def get_shortcuts_api(request: Request, symbol: str):
+    prewarmer.record_access(symbol)
+    # El ETag cubre solo los KPIs; si vienen stale lo indica X-Cache-Fresh (también en el 304)
+    data, fresh = await compute_shortcuts_async(symbol, allow_stale=True, ttl=KPI_TTL)
+    return conditional_json(request, data, headers={"X-Cache-Fresh": "1" if fresh else "0"})
+
+@app.get("/user/{user_id}/shortcuts/batch")
+def get_shortcuts_batch_api(user_id: str):
+    # Recientes primero (mismo orden que el dropdown de home), luego watchlist
+    symbols = list(dict.fromkeys(get_recents(user_id) + get_watchlist(user_id)))
+    return {"symbols": symbols, **compute_shortcuts_batch(symbols, allow_stale=True, ttl=KPI_TTL)}
 
 @app.post("/user/{user_id}/recents/{symbol}")
 def touch_recent_api(user_id: str, symbol: str):
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+# Métricas en formato de texto de Prometheus, por proceso (cada worker de uvicorn expone las suyas).
+# Sin dependencias: contadores/histogramas con un lock por métrica; observe() es O(log buckets).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _fmt_labels(names: Sequence[str], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in items]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [conteos por bucket (+Inf al final), suma]
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *label_values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in items:
+            acc = 0
+            for bound, c in zip(self.buckets, counts):
+                acc += c
+                le = 'le="%s"' % bound
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            acc += counts[-1]
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {acc}")
+        return out
+
+
+class Gauge:
+    """Se evalúa al momento del scrape."""
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], collect: Callable[[], Dict[LabelKey, float]]):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        try:
+            values = self._collect()
+        except Exception:
+            return out
+        out += [f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}" for k, v in sorted(values.items())]
+        return out
+
+
+class CounterFunc(Gauge):
+    """Contador monótono que ya lleva otro objeto (p.ej. stats() de un cache), leído al momento del scrape."""
+
+    TYPE = "counter"
+
+
+def stats_collector(stats: Callable[[], Dict[str, float]], keys: Sequence[str]) -> Callable[[], Dict[LabelKey, float]]:
+    # Subconjunto de un dict stats() como series con una etiqueta
+    return lambda: {(k,): v for k, v in stats().items() if k in keys}
+
+
+# -------- Registro --------
+_registry: List[object] = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+cache_requests = register(Counter(
+    "finalytics_cache_requests_total", "Lecturas de cache por espacio de llaves, nivel y resultado.",
+    ("namespace", "tier", "result"),
+))
+cold_builds = register(Counter(
+    "finalytics_cold_builds_total", "Builds síncronos por cold miss.", ("kind",),
+))
+build_seconds = register(Histogram(
+    "finalytics_build_seconds", "Duración de builds (_build_items, DashboardData, ...).", ("kind",),
+))
+revalidate_seconds = register(Histogram(
+    "finalytics_revalidate_seconds", "Duración de revalidaciones SWR en segundo plano.", ("kind",),
+))
+mongo_seconds = register(Histogram(
+    "finalytics_mongo_command_seconds", "Duración de comandos Mongo por colección.", ("collection", "command"),
+))
+mongo_failures = register(Counter(
+    "finalytics_mongo_command_failures_total", "Comandos Mongo fallidos por colección.", ("collection", "command"),
+))
+background_failures = register(Counter(
+    "finalytics_background_failures_total", "Revalidaciones, builds y pre-warms que terminaron en excepción.", ("kind",),
+))
+
+log = logging.getLogger("finalytics")
+
+
+def record_failure(kind: str) -> None:
+    # Llamar desde un bloque except: cuenta el fallo y deja el traceback en el log
+    background_failures.inc(kind)
+    log.exception("falló %s", kind)
+
+
+def cache_namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+# -------- Mongo: CommandListener --------
+class MongoCommandMetrics(monitoring.CommandListener):
+    # Comandos de sesión/handshake que no pertenecen a una colección
+    _SKIP = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue",
+             "buildInfo", "getMore", "killCursors"}
+
+    def __init__(self):
+        self._pending: Dict[Tuple[object, int], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in self._SKIP or not METRICS_ENABLED:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, failed: bool) -> None:
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        mongo_seconds.observe(event.duration_micros / 1e6, collection, event.command_name)
+        if failed:
+            mongo_failures.inc(collection, event.command_name)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, True)
+
+
+mongo_listener = MongoCommandMetrics()
+
+__all__ = [
+    "render", "register", "CONTENT_TYPE", "Counter", "Histogram", "Gauge", "CounterFunc", "stats_collector",
+    "cache_requests", "cold_builds", "build_seconds", "revalidate_seconds",
+    "mongo_seconds", "mongo_failures", "mongo_listener", "cache_namespace",
+    "background_failures", "record_failure",
+]
@@ -0,0 +1,236 @@
+"""Llave canónica `symbol` + índices.
+
+Uso:
+    python -m services.migrations migrate   # backfill de `symbol` y `doc_hash`, fusión balance_sheet -> balance_sheets, dedupe + índices
+    python -m services.migrations indexes   # crea los índices; deduplica y reconstruye los únicos si hace falta
+    python -m services.migrations vectors   # emb_col: listas de floats -> Binary float32
+    python -m services.migrations explain   # verifica que las lecturas calientes no hagan COLLSCAN
+
+Con MONGO_BOOTSTRAP=1, main_api corre bootstrap() al iniciar: solo create_index, sin borrar ni reescribir
+documentos; si un índice falla se registra y el worker arranca igual. Backfills, dedupe y reconstrucción de
+índices únicos solo por CLI (una vez, no por cada worker).
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Set, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from services.db import EMB_COLLECTION, db, docs_col
+from services import embeddings, logo_cache
+from services.repository import doc_hash
+
+# Colecciones de fundamentales: todas se leen por la llave canónica `symbol` (mayúsculas)
+FUNDAMENTALS = (
+    "overview", "income_statements", "balance_sheets", "cash_flows",
+    "prices_daily", "company_profiles", logo_cache.COLLECTION,
+)
+LEGACY_BALANCE = "balance_sheet"
+
+# colección -> campos de índice
+INDEXES: Dict[str, List[Tuple[str, int]]] = {
+    **{c: [("symbol", ASCENDING)] for c in FUNDAMENTALS},
+    "user_prefs": [("user", ASCENDING)],
+    "analysis": [("symbol", ASCENDING)],
+    EMB_COLLECTION: [("symbol", ASCENDING), ("model", ASCENDING), ("chunk_hash", ASCENDING)],
+}
+# Índices únicos: un vector por (symbol, model, chunk_hash) (save_vectors hace upsert sobre esa llave)
+# y un documento de prefs por usuario (get_prefs inserta el default si falta)
+UNIQUE: Set[str] = {EMB_COLLECTION, "user_prefs"}
+
+# Lecturas puntuales de los endpoints calientes (dashboard, shortcuts, prefs, summary)
+HOT_QUERIES: List[Tuple[str, Dict[str, Any]]] = [
+    *[(c, {"symbol": "AAPL"}) for c in FUNDAMENTALS],
+    ("user_prefs", {"user": "default"}),
+    ("analysis", {"symbol": "AAPL"}),
+]
+
+MONGO_BOOTSTRAP = os.getenv("MONGO_BOOTSTRAP", "0") == "1"
+
+log = logging.getLogger(__name__)
+
+
+# -------- Migración --------
+def _canonical_symbol_expr() -> Dict[str, Any]:
+    # symbol <- Symbol <- Ticket, en mayúsculas y sin espacios
+    return {"$toUpper": {"$trim": {"input": {"$ifNull": ["$symbol", {"$ifNull": ["$Symbol", "$Ticket"]}]}}}}
+
+
+def backfill_symbol(collection: str) -> int:
+    res = db[collection].update_many(
+        {"symbol": {"$exists": False}, "$or": [{"Symbol": {"$exists": True}}, {"Ticket": {"$exists": True}}]},
+        [{"$set": {"symbol": _canonical_symbol_expr()}}],
+    )
+    return res.modified_count
+
+
+def merge_legacy_balance() -> int:
+    # CompanyData leía `balance_sheet`; kpi/screener/seed usan `balance_sheets`. Gana lo que ya esté en balance_sheets.
+    if LEGACY_BALANCE not in db.list_collection_names():
+        return 0
+    merged = 0
+    for doc in db[LEGACY_BALANCE].find({}, {"_id": 0}):
+        sym = (doc.get("symbol") or doc.get("Symbol") or "").strip().upper()
+        if not sym:
+            continue
+        res = db["balance_sheets"].update_one(
+            {"symbol": sym}, {"$setOnInsert": {**doc, "symbol": sym}}, upsert=True
+        )
+        merged += 1 if res.upserted_id is not None else 0
+    return merged
+
+
+def backfill_doc_hash() -> int:
+    # Documentos guardados antes de que save_document calculara doc_hash (llave del summary cacheado)
+    updated = 0
+    for doc in docs_col.find({"doc_hash": {"$exists": False}}, {"sec_text_full_clean": 1}):
+        h = doc_hash(doc.get("sec_text_full_clean", ""))
+        updated += docs_col.update_one({"_id": doc["_id"]}, {"$set": {"doc_hash": h}}).modified_count
+    return updated
+
+
+def _key_filter(keys: List[Tuple[str, int]]) -> Dict[str, Any]:
+    # Filtro parcial de los índices únicos: documentos sin la llave completa (p.ej. vectores legacy) quedan fuera
+    return {f: {"$exists": True} for f, _ in keys}
+
+
+def dedupe(collection: str, keys: List[Tuple[str, int]]) -> int:
+    # Antes de un índice único: deja el primer _id de cada llave repetida.
+    # Solo documentos con todos los campos de la llave: sin el $match, los que no la tienen caen en un grupo {}
+    pipeline = [
+        {"$match": {f: {"$exists": True, "$ne": None} for f, _ in keys}},
+        {"$group": {"_id": {f: f"${f}" for f, _ in keys}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    removed = 0
+    for group in db[collection].aggregate(pipeline, allowDiskUse=True):
+        removed += db[collection].delete_many({"_id": {"$in": sorted(group["ids"])[1:]}}).deleted_count
+    return removed
+
+
+def migrate() -> Dict[str, int]:
+    report = {
+        "balance_sheet_merged": merge_legacy_balance(),
+        "vectors_packed": embeddings.pack_legacy_vectors(),
+        "doc_hash_backfilled": backfill_doc_hash(),
+    }
+    for collection in UNIQUE:
+        report[f"{collection}_deduped"] = dedupe(collection, INDEXES[collection])
+    for collection in FUNDAMENTALS:
+        report[collection] = backfill_symbol(collection)
+    return report
+
+
+# -------- Índices --------
+def _index_name(keys: List[Tuple[str, int]]) -> str:
+    return "_".join(f"{f}_{d}" for f, d in keys)
+
+
+def _index_options(collection: str, keys: List[Tuple[str, int]]) -> Dict[str, Any]:
+    if collection not in UNIQUE:
+        return {"name": _index_name(keys)}
+    return {"name": _index_name(keys), "unique": True, "partialFilterExpression": _key_filter(keys)}
+
+
+def _rebuild_index(collection: str, keys: List[Tuple[str, int]], error: OperationFailure) -> None:
+    # 85/86: existe con el mismo nombre y otras opciones (p.ej. antes no era único)
+    # 11000: el índice único no existe y ya hay llaves repetidas
+    if error.code not in (85, 86, 11000):
+        raise error
+    if collection in UNIQUE:
+        dedupe(collection, keys)
+    if error.code in (85, 86):
+        db[collection].drop_index(_index_name(keys))
+    db[collection].create_index(keys, **_index_options(collection, keys))
+
+
+def ensure_indexes(rebuild: bool = False) -> List[str]:
+    # create_index es idempotente: si el índice existe no hace nada.
+    # Sin rebuild (arranque de un worker) nunca borra: registra el índice fallido y sigue.
+    failed: List[str] = []
+    for collection, keys in INDEXES.items():
+        name = _index_name(keys)
+        try:
+            db[collection].create_index(keys, **_index_options(collection, keys))
+        except OperationFailure as e:
+            if rebuild:
+                _rebuild_index(collection, keys, e)
+                continue
+            log.warning("índice %s.%s no creado: %s (correr `python -m services.migrations indexes`)",
+                        collection, name, e)
+            failed.append(f"{collection}.{name}")
+    return failed
+
+
+def bootstrap() -> None:
+    # Solo índices: nada de backfills ni dedupe, que recorren colecciones y correrían en cada worker
+    if not MONGO_BOOTSTRAP:
+        return
+    try:
+        ensure_indexes()
+    except PyMongoError as e:
+        log.warning("bootstrap de índices omitido: %s", e)
+
+
+# -------- explain() --------
+def _stages(plan: Any) -> List[str]:
+    # Recorre winningPlan (clásico o SBE: queryPlan/inputStage/inputStages) y junta los stages
+    if isinstance(plan, dict):
+        out = [plan["stage"]] if "stage" in plan else []
+        for v in plan.values():
+            out.extend(_stages(v))
+        return out
+    if isinstance(plan, list):
+        return [s for p in plan for s in _stages(p)]
+    return []
+
+
+def explain_hot_queries() -> List[Dict[str, Any]]:
+    results = []
+    for collection, query in HOT_QUERIES:
+        plan = db[collection].find(query).limit(1).explain()
+        stages = _stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+        results.append({
+            "collection": collection,
+            "query": query,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return results
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cmd", choices=["migrate", "indexes", "vectors", "explain"])
+    args = parser.parse_args(argv)
+
+    if args.cmd == "migrate":
+        for name, n in migrate().items():
+            print(f"{name:<22} {n}")
+        ensure_indexes(rebuild=True)
+        return 0
+    if args.cmd == "indexes":
+        ensure_indexes(rebuild=True)
+        return 0
+    if args.cmd == "vectors":
+        print(f"{'vectors_packed':<22} {embeddings.pack_legacy_vectors()}")
+        return 0
+
+    failed = 0
+    for r in explain_hot_queries():
+        flag = "COLLSCAN" if r["collscan"] else "ok"
+        failed += r["collscan"]
+        print(f"{flag:<9} {r['collection']:<18} {r['query']}  {' > '.join(r['stages'])}")
+    return 1 if failed else 0
+
+
+__all__ = ["migrate", "ensure_indexes", "bootstrap", "explain_hot_queries", "FUNDAMENTALS", "INDEXES", "UNIQUE", "dedupe"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
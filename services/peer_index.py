@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import os
+import threading
+from time import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from services.db import db
+from services.metrics import record_failure
+from services.kpi_services import balance_latest, income_last_two, kpi_values
+
+PEER_INDEX_TTL = int(os.getenv("PEER_INDEX_TTL", str(6 * 3600)))
+
+# Métricas de los shortcuts (kpi_services.kpi_values) que se comparan contra pares
+PEER_METRICS = (
+    "revenue_ttm", "revenue_yoy", "net_income", "net_income_yoy",
+    "cash", "debt", "net_cash", "debt_to_equity", "current_ratio",
+    "gross_margin_ttm", "operating_margin_ttm", "net_margin_ttm",
+    "market_cap", "eps", "pe_ratio", "dividend_yield",
+)
+LEVELS = ("Sector", "Industry")
+
+GroupKey = Tuple[str, str]  # (nivel, nombre)
+
+
+class PeerIndex:
+    """Arreglos ordenados por (Sector|Industry, métrica): el percentil sale de una búsqueda binaria."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._groups: Dict[GroupKey, Dict[str, np.ndarray]] = {}
+        self._members: Dict[str, Dict[str, Any]] = {}
+        self.built_at = 0.0
+
+    # -------- construcción --------
+    def build(self) -> None:
+        overview_proj = {"_id": 0, "symbol": 1, "Sector": 1, "Industry": 1,
+                         "RevenueTTM": 1, "GrossProfitTTM": 1, "OperatingMarginTTM": 1, "ProfitMargin": 1,
+                         "EPS": 1, "PERatio": 1, "DividendYield": 1, "MarketCapitalization": 1}
+        overviews = {d["symbol"]: d for d in db["overview"].find({}, overview_proj) if d.get("symbol")}
+        # annualReports completos: income_last_two/balance_latest ordenan por fiscalDateEnding,
+        # un $slice asumiría que el arreglo guardado ya viene del más nuevo al más viejo
+        incomes = {
+            d.get("symbol"): d
+            for d in db["income_statements"].find({}, {"_id": 0, "symbol": 1, "annualReports": 1})
+        }
+        balances = {
+            d.get("symbol"): d
+            for d in db["balance_sheets"].find({}, {"_id": 0, "symbol": 1, "annualReports": 1})
+        }
+
+        members = {
+            sym: self._member(ov, incomes.get(sym), balances.get(sym))
+            for sym, ov in overviews.items()
+        }
+
+        buckets: Dict[GroupKey, Dict[str, list]] = {}
+        for m in members.values():
+            for key in self._keys(m):
+                group = buckets.setdefault(key, {metric: [] for metric in PEER_METRICS})
+                for metric, v in m["values"].items():
+                    if v is not None:
+                        group[metric].append(v)
+
+        groups = {
+            key: {metric: np.sort(np.asarray(vals, dtype=np.float64)) for metric, vals in by_metric.items()}
+            for key, by_metric in buckets.items()
+        }
+
+        with self._lock:
+            self._members = members
+            self._groups = groups
+            self.built_at = time()
+
+    @staticmethod
+    def _member(ov: dict, income_doc: Optional[dict], balance_doc: Optional[dict]) -> Dict[str, Any]:
+        values = kpi_values(ov, income_last_two(income_doc), balance_latest(balance_doc))
+        return {
+            "Sector": ov.get("Sector") or "",
+            "Industry": ov.get("Industry") or "",
+            "values": {
+                metric: (float(values[metric]) if values.get(metric) is not None and np.isfinite(values[metric]) else None)
+                for metric in PEER_METRICS
+            },
+        }
+
+    @staticmethod
+    def _keys(member: Dict[str, Any]):
+        return [(level, member[level]) for level in LEVELS if member[level]]
+
+    # -------- actualización incremental --------
+    def _remove_locked(self, sym: str) -> None:
+        old = self._members.pop(sym, None)
+        if not old:
+            return
+        for key in self._keys(old):
+            group = self._groups.get(key)
+            if group is None:
+                continue
+            for metric, v in old["values"].items():
+                if v is None:
+                    continue
+                arr = group[metric]
+                pos = int(np.searchsorted(arr, v, side="left"))
+                if pos < len(arr) and arr[pos] == v:
+                    group[metric] = np.delete(arr, pos)
+
+    def _insert_locked(self, sym: str, member: Dict[str, Any]) -> None:
+        self._members[sym] = member
+        for key in self._keys(member):
+            group = self._groups.setdefault(
+                key, {metric: np.empty(0, dtype=np.float64) for metric in PEER_METRICS}
+            )
+            for metric, v in member["values"].items():
+                if v is None:
+                    continue
+                arr = group[metric]
+                group[metric] = np.insert(arr, int(np.searchsorted(arr, v)), v)
+
+    def upsert(self, sym: str, ov: dict, income_doc: Optional[dict], balance_doc: Optional[dict]) -> None:
+        member = self._member(ov, income_doc, balance_doc)
+        with self._lock:
+            self._remove_locked(sym)
+            self._insert_locked(sym, member)
+
+    def remove(self, sym: str) -> None:
+        with self._lock:
+            self._remove_locked(sym)
+
+    # -------- consulta --------
+    @staticmethod
+    def _rank(arr: np.ndarray, v: float) -> Dict[str, Any]:
+        n = len(arr)
+        below = int(np.searchsorted(arr, v, side="left"))
+        upto = int(np.searchsorted(arr, v, side="right"))
+        return {
+            "percentile": round((below + 0.5 * (upto - below)) / n * 100.0, 2) if n else None,
+            "rank": n - upto + 1,  # 1 = valor más alto del grupo
+            "count": n,
+        }
+
+    def percentiles(self, sym: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            member = self._members.get(sym)
+            if member is None:
+                return None
+            metrics = {}
+            for metric, v in member["values"].items():
+                entry: Dict[str, Any] = {"value": v}
+                for level, name in self._keys(member):
+                    arr = self._groups[(level, name)][metric]
+                    entry[level.lower()] = None if v is None else self._rank(arr, v)
+                metrics[metric] = entry
+            return {
+                "symbol": sym,
+                "sector": member["Sector"],
+                "industry": member["Industry"],
+                "built_at": self.built_at,
+                "metrics": metrics,
+            }
+
+
+peer_index = PeerIndex()
+_build_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _rebuild():
+    try:
+        peer_index.build()
+    except Exception:
+        record_failure("peer_index_build")
+    finally:
+        _rebuilding.clear()
+
+
+def _start_build() -> None:
+    # Un solo build a la vez y siempre en segundo plano: ningún request espera el recorrido del universo
+    with _build_lock:
+        if _rebuilding.is_set():
+            return
+        _rebuilding.set()
+    threading.Thread(target=_rebuild, name="peer-index-build", daemon=True).start()
+
+
+def start() -> None:
+    # Al iniciar el controller, para que el índice esté listo antes del primer /api/peers
+    if peer_index.built_at == 0:
+        _start_build()
+
+
+def is_ready() -> bool:
+    return peer_index.built_at > 0
+
+
+def get_peer_percentiles(symbol: str) -> Optional[Dict[str, Any]]:
+    # None mientras no haya un primer build (el llamador responde 503 con is_ready())
+    if not is_ready() or time() - peer_index.built_at >= PEER_INDEX_TTL:
+        _start_build()
+    return peer_index.percentiles((symbol or "").upper())
+
+
+def refresh_symbol(symbol: str) -> None:
+    # Llamado cuando cambian los estados de una sola compañía
+    if peer_index.built_at == 0:
+        return
+    sym = (symbol or "").upper()
+    ov = db["overview"].find_one({"symbol": sym}, {"_id": 0})
+    if not ov:
+        peer_index.remove(sym)
+        return
+    income_doc = db["income_statements"].find_one({"symbol": sym}, {"_id": 0, "annualReports": 1})
+    balance_doc = db["balance_sheets"].find_one({"symbol": sym}, {"_id": 0, "annualReports": 1})
+    peer_index.upsert(sym, ov, income_doc, balance_doc)
+
+
+__all__ = ["get_peer_percentiles", "refresh_symbol", "start", "is_ready", "peer_index", "PEER_METRICS"]
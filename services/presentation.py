@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Optional
+
+# Capa de presentación: recibe las tablas numéricas de DashboardData.get_raw_data()
+# y produce los strings que consumen las vistas ("$1,234", "12.34 %").
+
+CASH_FLOW_COLUMNS = ["Periodo", "Operating CF", "Capex", "Free Cash Flow", "FCF Growth (%)"]
+_PLAIN_RATIOS = {"Current Ratio", "Acid Test", "Assets to Liabilities"}
+
+
+def format_money(value):
+    return f"${value:,.0f}"
+
+
+def format_percent(value):
+    return f"{value:.2f} %"
+
+
+def _money(v: Optional[float]) -> str:
+    return format_money(v if v is not None else 0)
+
+
+def _pct(v: Optional[float]) -> str:
+    return format_percent(v if v is not None else 0)
+
+
+def statement_formatter(name: str) -> Callable[[Optional[float]], Any]:
+    return _pct if name.endswith("(%)") else _money
+
+
+def ratio_formatter(name: str) -> Callable[[Optional[float]], Any]:
+    if name in _PLAIN_RATIOS:
+        return lambda v: None if v is None else round(v, 2)
+    return lambda v: None if v is None else format_percent(v)
+
+
+def year_table(table: Optional[Dict[str, Any]], formatter=statement_formatter) -> Dict[int, Dict[str, Any]]:
+    if not table or not table.get("years"):
+        return {}
+    series = table["series"]
+    fmts = {name: formatter(name) for name in series}
+    return {
+        year: {name: fmts[name](col[i]) for name, col in series.items()}
+        for i, year in enumerate(table["years"])
+    }
+
+
+def cash_flow_rows(table: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not table or not table.get("years"):
+        return {}
+    s = table["series"]
+    rows = [
+        [str(y), _money(s["Operating CF"][i]), _money(s["Capex"][i]),
+         _money(s["Free Cash Flow"][i]), _pct(s["FCF Growth (%)"][i])]
+        for i, y in enumerate(table["years"])
+    ]
+    return {"columns": list(CASH_FLOW_COLUMNS), "rows": rows}
+
+
+def structure_kpis(kpis: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    kpis = kpis or {}
+
+    def fmt(key, fn):
+        v = kpis.get(key)
+        return "—" if v is None else fn(v)
+
+    return {
+        "cash": fmt("cash", format_money),
+        "debt": fmt("debt", format_money),
+        "net_cash": fmt("net_cash", format_money),
+        "fcf": fmt("fcf", format_money),
+        "debt_to_equity": fmt("debt_to_equity", format_percent),
+        "current_ratio": fmt("current_ratio", lambda v: f"{v:.2f}x"),
+    }
+
+
+def present_dashboard(raw: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "overview": raw.get("overview") or {},
+        "income": year_table(raw.get("income")),
+        "margins": year_table(raw.get("margins")),
+        "balance": year_table(raw.get("balance")),
+        "ratios": year_table(raw.get("ratios"), ratio_formatter),
+        "cash_flow": cash_flow_rows(raw.get("cash_flow")),
+        "structure_kpis": structure_kpis(raw.get("structure_kpis")),
+    }
+
+
+__all__ = ["present_dashboard", "year_table", "ratio_formatter", "cash_flow_rows", "structure_kpis", "format_money", "format_percent"]
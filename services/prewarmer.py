@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from services.db import db
+from services import dashboard_cache, kpi_services
+from services.revalidation import revalidator
+from services.metrics import Counter as MetricCounter, record_failure, register
+
+# Refresca kpi_cache / dashboard_cache de los símbolos más usados antes de que venza su TTL
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_INTERVAL = int(os.getenv("PREWARM_INTERVAL", "60"))            # segundos entre ciclos
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+PREWARM_BUDGET_PER_MIN = int(os.getenv("PREWARM_BUDGET_PER_MIN", "60"))  # refrescos (símbolo × tipo) por minuto
+PREWARM_TOP = int(os.getenv("PREWARM_TOP", "200"))
+PREWARM_LEAD = float(os.getenv("PREWARM_LEAD", "0.2"))                  # fracción del TTL antes del vencimiento
+PREWARM_CHUNK = int(os.getenv("PREWARM_CHUNK", "10"))
+PREWARM_ACCESS_MAX = int(os.getenv("PREWARM_ACCESS_MAX", "5000"))      # símbolos distintos por worker entre flushes
+
+KPI_TTL = kpi_services.KPI_TTL
+DASHBOARD_TTL = dashboard_cache.DASHBOARD_TTL
+
+# Peso de cada fuente en el ranking
+WATCHLIST_WEIGHT = 3.0
+RECENT_WEIGHT = 2.0
+ACCESS_WEIGHT = 1.0
+
+LEASE_COLLECTION = "scheduler_leases"
+ACCESS_COLLECTION = "symbol_access"
+ACCESS_DECAY = float(os.getenv("PREWARM_ACCESS_DECAY", "0.9"))         # por ciclo
+
+prewarm_refreshes = register(MetricCounter(
+    "finalytics_prewarm_refreshes_total", "Refrescos hechos por el pre-warmer.", ("kind",),
+))
+
+# -------- Accesos observados en este proceso --------
+_access = Counter()
+_access_lock = threading.Lock()
+
+
+def record_access(symbol: str) -> None:
+    # Sin pre-warmer nadie drena el contador; con él, el tope evita que rutas basura lo hagan crecer
+    if not PREWARM_ENABLED:
+        return
+    sym = (symbol or "").strip().upper()
+    if sym:
+        with _access_lock:
+            if sym in _access or len(_access) < PREWARM_ACCESS_MAX:
+                _access[sym] += 1
+
+
+def _drain_access() -> Counter:
+    global _access
+    with _access_lock:
+        snapshot, _access = _access, Counter()
+    # Solo los más pedidos llegan a symbol_access: el ranking no mira más allá de PREWARM_TOP
+    return Counter(dict(snapshot.most_common(PREWARM_TOP)))
+
+
+def flush_access() -> None:
+    # Cada worker vuelca sus conteos; el ranking los lee de Mongo (visibles para todos los procesos)
+    snapshot = _drain_access()
+    if snapshot:
+        db[ACCESS_COLLECTION].bulk_write(
+            [UpdateOne({"_id": sym}, {"$inc": {"hits": n}}, upsert=True) for sym, n in snapshot.items()],
+            ordered=False,
+        )
+
+
+def _load_access(top: int) -> Dict[str, float]:
+    return {
+        d["_id"]: float(d.get("hits") or 0)
+        for d in db[ACCESS_COLLECTION].find({}, {"hits": 1}).sort("hits", -1).limit(top)
+    }
+
+
+def _decay_access() -> None:
+    db[ACCESS_COLLECTION].update_many({}, {"$mul": {"hits": ACCESS_DECAY}})
+    db[ACCESS_COLLECTION].delete_many({"hits": {"$lt": 0.5}})
+
+
+# -------- Ranking --------
+def rank_symbols(access: Optional[Dict[str, float]] = None, top: int = PREWARM_TOP) -> List[str]:
+    scores: Dict[str, float] = {}
+    for doc in db["user_prefs"].find({}, {"_id": 0, "watchlist": 1, "recents": 1}):
+        for sym in doc.get("watchlist") or []:
+            sym = (sym or "").strip().upper()
+            if sym:
+                scores[sym] = scores.get(sym, 0.0) + WATCHLIST_WEIGHT
+        recents = doc.get("recents") or []
+        for pos, sym in enumerate(recents):
+            sym = (sym or "").strip().upper()
+            if sym:
+                # El más reciente pesa más
+                scores[sym] = scores.get(sym, 0.0) + RECENT_WEIGHT * (len(recents) - pos) / len(recents)
+    for sym, hits in (access or {}).items():
+        scores[sym] = scores.get(sym, 0.0) + ACCESS_WEIGHT * hits
+    return [sym for sym, _ in sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:top]]
+
+
+def _due(collection: str, symbols: List[str], ttl: int, now: float) -> List[str]:
+    # Vencen dentro de la ventana PREWARM_LEAD (o ya vencieron / no existen)
+    ts = {d["_id"]: float(d.get("ts") or 0) for d in db[collection].find({"_id": {"$in": symbols}}, {"ts": 1})}
+    horizon = ttl * (1.0 - PREWARM_LEAD)
+    return [sym for sym in symbols if now - ts.get(sym, 0.0) >= horizon]
+
+
+# -------- Lease: un solo worker de uvicorn corre el scheduler --------
+def _acquire_lease(owner: str, ttl: float) -> bool:
+    now = time()
+    try:
+        db[LEASE_COLLECTION].find_one_and_update(
+            {"_id": "prewarmer", "$or": [{"owner": owner}, {"expires": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires": now + ttl}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Otro proceso tiene el lease vigente: el filtro no coincide y el upsert choca con _id
+        return False
+    return True
+
+
+class Prewarmer:
+    def __init__(self, interval: int = PREWARM_INTERVAL, concurrency: int = PREWARM_CONCURRENCY,
+                 budget_per_min: int = PREWARM_BUDGET_PER_MIN):
+        self.interval = max(1, interval)
+        self.concurrency = max(1, concurrency)
+        self.budget_per_min = max(0, budget_per_min)
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Se crea en start(): con PREWARM_ENABLED=0 no hay hilos del pool
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="prewarm")
+            self._thread = threading.Thread(target=self._run, name="prewarmer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # Los refrescos pendientes se descartan; el que esté corriendo termina por su cuenta
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                flush_access()
+                if _acquire_lease(self._owner, self.interval * 3):
+                    self.tick()
+                    _decay_access()
+            except Exception:
+                # Un ciclo cortado por stop() (pool cerrado) no es un fallo
+                if not self._stop.is_set():
+                    record_failure("prewarm")
+
+    def _plan(self, now: float) -> List[tuple]:
+        ranked = rank_symbols(_load_access(PREWARM_TOP))
+        if not ranked:
+            return []
+        # Descarta símbolos que no existen (recientes mal escritos) para no gastar presupuesto
+        known = set(db["overview"].distinct("symbol", {"symbol": {"$in": ranked}}))
+        ranked = [sym for sym in ranked if sym in known]
+        kpis_due = set(_due("kpi_cache", ranked, KPI_TTL, now))
+        dash_due = set(_due(dashboard_cache.COLLECTION, ranked, DASHBOARD_TTL, now))
+
+        # Intercalado por ranking: los símbolos más usados consumen el presupuesto primero
+        plan = []
+        for sym in ranked:
+            if sym in kpis_due and not revalidator.inflight(kpi_services.cache_key(sym)):
+                plan.append(("kpis", sym))
+            if sym in dash_due and not revalidator.inflight(dashboard_cache.cache_key(sym)):
+                plan.append(("dashboard", sym))
+        budget = int(self.budget_per_min * self.interval / 60.0)
+        return plan[:budget]
+
+    def tick(self) -> Dict[str, int]:
+        pool = self._pool
+        if pool is None:
+            return {"kpis": 0, "dashboard": 0}
+        plan = self._plan(time())
+        by_kind: Dict[str, List[str]] = {"kpis": [], "dashboard": []}
+        for kind, sym in plan:
+            by_kind[kind].append(sym)
+
+        jobs = []
+        for kind, syms in by_kind.items():
+            for i in range(0, len(syms), PREWARM_CHUNK):
+                chunk = syms[i:i + PREWARM_CHUNK]
+                if kind == "kpis":
+                    jobs.append(pool.submit(kpi_services.revalidate_many, chunk, KPI_TTL))
+                else:
+                    jobs.append(pool.submit(dashboard_cache.revalidate_many, chunk, DASHBOARD_TTL))
+        for job in jobs:
+            job.result()
+
+        for kind, syms in by_kind.items():
+            if syms:
+                prewarm_refreshes.inc(kind, amount=len(syms))
+        return {kind: len(syms) for kind, syms in by_kind.items()}
+
+
+prewarmer = Prewarmer()
+
+
+def start() -> None:
+    if PREWARM_ENABLED:
+        prewarmer.start()
+
+
+def stop() -> None:
+    prewarmer.stop()
+
+
+__all__ = ["prewarmer", "start", "stop", "record_access", "rank_symbols", "Prewarmer"]
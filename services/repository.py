@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from time import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from services.async_db import adb, adocs_col
+from services.company_data import CompanyData, profile_pipeline
+from services.user_prefs import _norm, cache_prefs, cached_prefs, default_doc
+
+# Acceso async a Mongo para los handlers de main_api. Las funciones devuelven
+# los mismos documentos/dicts que sus equivalentes sync.
+
+
+# -------- Dashboard --------
+async def load_profile(sym: str, years_back: int) -> Dict[str, Any]:
+    docs = await adb["overview"].aggregate(profile_pipeline(sym, years_back)).to_list(1)
+    if not docs:
+        raise ValueError(f"No se pudo cargar el perfil para {sym}: Symbol '{sym}' not found in database.")
+    return CompanyData(sym)._profile_from_docs(docs[0], years_back)
+
+
+async def find_dashboard(sym: str) -> Optional[Dict[str, Any]]:
+    return await adb["dashboard_cache"].find_one({"_id": sym}, {"_id": 0, "data": 1, "hash": 1, "ts": 1})
+
+
+async def save_dashboard(sym: str, data: Dict[str, Any], content_hash: str) -> None:
+    await adb["dashboard_cache"].update_one(
+        {"_id": sym}, {"$set": {"data": data, "hash": content_hash, "ts": time()}}, upsert=True
+    )
+
+
+# -------- KPI shortcuts --------
+async def find_kpi_docs(sym: str) -> Tuple[dict, Optional[dict], Optional[dict]]:
+    # Tres consultas independientes en paralelo sobre el pool async
+    ov, income, balance = await asyncio.gather(
+        adb["overview"].find_one(
+            {"symbol": sym},
+            {
+                "_id": 0,
+                "RevenueTTM": 1, "GrossProfitTTM": 1,
+                "OperatingMarginTTM": 1, "ProfitMargin": 1,
+                "EPS": 1, "PERatio": 1, "DividendYield": 1,
+                "MarketCapitalization": 1,
+            },
+        ),
+        adb["income_statements"].find_one(
+            {"symbol": sym}, {"_id": 0, "annualReports": 1}
+        ),
+        adb["balance_sheets"].find_one(
+            {"symbol": sym}, {"_id": 0, "annualReports": 1}
+        ),
+    )
+    return ov or {}, income, balance
+
+
+async def find_kpi_cache(sym: str) -> Optional[Dict[str, Any]]:
+    doc = await adb["kpi_cache"].find_one({"_id": sym}, {"_id": 0, "data": 1})
+    return None if not doc else doc.get("data")
+
+
+async def save_kpi_cache(sym: str, data: Dict[str, Any]) -> None:
+    await adb["kpi_cache"].update_one({"_id": sym}, {"$set": {"data": data, "ts": time()}}, upsert=True)
+
+
+# -------- User prefs --------
+async def get_prefs(user: str) -> Dict[str, Any]:
+    # L2 (SQLite) fuera del event loop
+    doc = await asyncio.to_thread(cached_prefs, user)
+    if doc is not None:
+        return doc
+    # Lectura; solo se escribe el documento por defecto (mismo que user_prefs._ensure_doc) si no existe
+    doc = await adb["user_prefs"].find_one({"user": user})
+    if doc is None:
+        doc = default_doc(user)
+        try:
+            await adb["user_prefs"].insert_one(doc)
+        except DuplicateKeyError:
+            # Índice único en `user`: otro request concurrente lo creó primero
+            doc = await adb["user_prefs"].find_one({"user": user})
+    await asyncio.to_thread(cache_prefs, user, doc)
+    return doc
+
+
+async def get_display_name(user: str) -> str:
+    return (await get_prefs(user)).get("display_name", "") or ""
+
+
+async def get_theme(user: str) -> str:
+    return (await get_prefs(user)).get("theme", "dark")
+
+
+async def get_watchlist(user: str) -> List[str]:
+    wl = (await get_prefs(user)).get("watchlist", [])
+    return sorted(list({_norm(s) for s in wl}))
+
+
+async def get_recents(user: str) -> List[str]:
+    return [_norm(s) for s in (await get_prefs(user)).get("recents", [])]
+
+
+# -------- Documentos / análisis --------
+async def find_document(sym: str) -> Optional[Dict[str, Any]]:
+    return await adocs_col.find_one({"_id": sym})
+
+
+async def find_analysis(sym: str) -> Dict[str, Any]:
+    return await adb["analysis"].find_one({"symbol": sym}) or {}
+
+
+def doc_hash(text: str) -> str:
+    # Mismo cálculo que rag/chunking.doc_hash: llave del summary cacheado
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:32]
+
+
+async def current_doc_hash(sym: str) -> Optional[str]:
+    # Solo lectura: save_document guarda doc_hash y `migrations migrate` lo agrega a los documentos viejos
+    doc = await adocs_col.find_one({"_id": sym}, {"doc_hash": 1})
+    if doc is None:
+        return None
+    if doc.get("doc_hash"):
+        return doc["doc_hash"]
+    full = await adocs_col.find_one({"_id": sym}, {"sec_text_full_clean": 1}) or {}
+    return await asyncio.to_thread(doc_hash, full.get("sec_text_full_clean", ""))
+
+
+async def save_analysis(sym: str, record: Dict[str, Any]) -> None:
+    await adb["analysis"].update_one(
+        {"symbol": sym}, {"$set": {**record, "symbol": sym, "generated_at": time()}}, upsert=True
+    )
+
+
+async def find_preview_doc(sym: str) -> Dict[str, Any]:
+    return await adb["docs"].find_one({"_id": sym}, {"trend_summary": 1, "table_summary": 1}) or {}
+
+
+__all__ = [
+    "load_profile", "find_dashboard", "save_dashboard",
+    "find_kpi_docs", "find_kpi_cache", "save_kpi_cache",
+    "get_prefs", "get_display_name", "get_theme", "get_watchlist", "get_recents",
+    "find_document", "find_analysis", "find_preview_doc",
+    "doc_hash", "current_doc_hash", "save_analysis",
+]
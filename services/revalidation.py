@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from services.metrics import CounterFunc, Gauge, register, stats_collector
+
+REVALIDATE_WORKERS = int(os.getenv("REVALIDATE_WORKERS", "4"))
+REVALIDATE_QUEUE = int(os.getenv("REVALIDATE_QUEUE", "256"))
+
+_Job = Tuple[Tuple[str, ...], Callable[..., Any], tuple]
+
+
+class Revalidator:
+    """Pool acotado para revalidaciones SWR en segundo plano.
+
+    Single-flight por llave: mientras una llave está en cola o corriendo, los
+    submit() siguientes se ignoran. Con la cola llena se descarta el trabajo más viejo.
+    """
+
+    def __init__(self, workers: int = REVALIDATE_WORKERS, max_queue: int = REVALIDATE_QUEUE):
+        self._workers = max(1, workers)
+        self._max_queue = max(1, max_queue)
+        self._queue: Deque[_Job] = deque()
+        self._inflight: set[str] = set()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self.dropped = 0
+        self.skipped = 0
+
+    def _ensure_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self._workers:
+            t = threading.Thread(target=self._run, name=f"revalidate-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _enqueue_locked(self, keys: Tuple[str, ...], fn: Callable[..., Any], args: tuple) -> None:
+        if len(self._queue) >= self._max_queue:
+            old_keys, _, _ = self._queue.popleft()
+            self._inflight.difference_update(old_keys)
+            self.dropped += 1
+        self._inflight.update(keys)
+        self._queue.append((keys, fn, args))
+        self._ensure_workers()
+        self._cond.notify()
+
+    def submit(self, key: str, fn: Callable[..., Any], *args) -> bool:
+        with self._cond:
+            if key in self._inflight:
+                self.skipped += 1
+                return False
+            self._enqueue_locked((key,), fn, args)
+            return True
+
+    def submit_many(self, items: Dict[str, Any], fn: Callable[..., Any], *args) -> List[Any]:
+        # items: llave -> valor; fn recibe la lista de valores cuyas llaves no estaban en vuelo
+        with self._cond:
+            claimed = {k: v for k, v in items.items() if k not in self._inflight}
+            self.skipped += len(items) - len(claimed)
+            if claimed:
+                self._enqueue_locked(tuple(claimed), fn, (list(claimed.values()), *args))
+            return list(claimed.values())
+
+    def inflight(self, key: str) -> bool:
+        with self._cond:
+            return key in self._inflight
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                keys, fn, args = self._queue.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    self._inflight.difference_update(keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "inflight": len(self._inflight),
+                "dropped": self.dropped,
+                "skipped": self.skipped,
+            }
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce de cold misses entre hilos: los llamadores concurrentes esperan un solo build."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """Igual que SingleFlight para handlers async (un event loop por worker)."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            # Tarea propia, no la del primer request: si ese cliente se desconecta, el build sigue para los demás
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marca la excepción como recuperada si nadie más la esperaba
+        if not task.cancelled():
+            task.exception()
+
+
+revalidator = Revalidator()
+register(Gauge(
+    "finalytics_revalidator", "Cola de revalidación SWR (queued, inflight).", ("stat",),
+    stats_collector(revalidator.stats, ("queued", "inflight")),
+))
+register(CounterFunc(
+    "finalytics_revalidator_events_total", "Revalidaciones descartadas (dropped) u omitidas (skipped).", ("event",),
+    stats_collector(revalidator.stats, ("dropped", "skipped")),
+))
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+__all__ = ["revalidator", "single_flight", "async_single_flight", "Revalidator", "SingleFlight", "AsyncSingleFlight"]
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import operator
+import os
+import threading
+from time import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.db import db
+from services.metrics import record_failure
+from services.statements import coerce_year_key, growth_pct, ratio, to_float
+
+PANEL_YEARS = int(os.getenv("SCREENER_YEARS", "5"))
+PANEL_TTL = int(os.getenv("SCREENER_TTL", "900"))
+
+# métrica -> campo en annualReports
+_INCOME_FIELDS = {
+    "revenue": "totalRevenue",
+    "gross_profit": "grossProfit",
+    "operating_income": "operatingIncome",
+    "net_income": "netIncome",
+}
+_BALANCE_FIELDS = {
+    "cash": "cashAndCashEquivalentsAtCarryingValue",
+    "total_debt": "shortLongTermDebtTotal",
+    "current_assets": "totalCurrentAssets",
+    "current_liabilities": "totalCurrentLiabilities",
+    "total_assets": "totalAssets",
+    "total_liabilities": "totalLiabilities",
+    "equity": "totalShareholderEquity",
+}
+# métrica -> (campo en overview, escala); se replican en todos los años
+_OVERVIEW_FIELDS = {
+    "market_cap": ("MarketCapitalization", 1.0),
+    "pe_ratio": ("PERatio", 1.0),
+    "eps": ("EPS", 1.0),
+    "dividend_yield": ("DividendYield", 100.0),
+}
+_DERIVED = [
+    "gross_margin", "operating_margin", "net_margin",
+    "debt_to_equity", "current_ratio", "net_cash", "roe", "roa",
+    "revenue_growth", "net_income_growth",
+]
+
+METRICS: List[str] = [*_INCOME_FIELDS, *_BALANCE_FIELDS, *_OVERVIEW_FIELDS, *_DERIVED]
+METRIC_INDEX = {m: i for i, m in enumerate(METRICS)}
+
+_OPS = {
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+
+class ScreenerPanel:
+    """Panel denso símbolos × métricas × años (0 = último año fiscal), NaN = faltante."""
+
+    def __init__(self, symbols: List[str], names: List[str], sectors: List[str], industries: List[str],
+                 values: np.ndarray):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.sectors = np.asarray(sectors, dtype=object)
+        self.industries = np.asarray(industries, dtype=object)
+        self._sector_key = np.char.lower(np.asarray(sectors, dtype=str))
+        self._industry_key = np.char.lower(np.asarray(industries, dtype=str))
+        self.values = values
+        self.built_at = time()
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def metric(self, name: str, year: int = 0) -> np.ndarray:
+        if name not in METRIC_INDEX:
+            raise ValueError(f"Métrica desconocida: {name}")
+        if not 0 <= year < self.values.shape[2]:
+            raise ValueError(f"year debe estar entre 0 y {self.values.shape[2] - 1}")
+        return self.values[:, METRIC_INDEX[name], year]
+
+
+def _fill_reports(values: np.ndarray, row: int, reports: list, fields: Dict[str, str], base_year: Optional[int]):
+    for r in reports:
+        year = coerce_year_key(r.get("fiscalDateEnding"))
+        if not isinstance(year, int):
+            continue
+        pos = 0 if base_year is None else base_year - year
+        if not 0 <= pos < values.shape[2]:
+            continue
+        for metric, field in fields.items():
+            values[row, METRIC_INDEX[metric], pos] = to_float(r.get(field))
+
+
+def _latest_year(reports: list) -> Optional[int]:
+    years = [coerce_year_key(r.get("fiscalDateEnding")) for r in reports]
+    years = [y for y in years if isinstance(y, int)]
+    return max(years) if years else None
+
+
+def build_panel(years: int = PANEL_YEARS) -> ScreenerPanel:
+    overview_proj = {"_id": 0, "symbol": 1, "Name": 1, "Sector": 1, "Industry": 1,
+                     **{field: 1 for field, _ in _OVERVIEW_FIELDS.values()}}
+    overviews = [d for d in db["overview"].find({}, overview_proj) if d.get("symbol")]
+    row_of = {d["symbol"]: i for i, d in enumerate(overviews)}
+
+    values = np.full((len(overviews), len(METRICS), years), np.nan, dtype=np.float64)
+
+    for i, d in enumerate(overviews):
+        for metric, (field, scale) in _OVERVIEW_FIELDS.items():
+            values[i, METRIC_INDEX[metric], :] = to_float(d.get(field)) * scale
+
+    # Los años se alinean por año fiscal contra el último año del estado de resultados
+    base_years: Dict[str, Optional[int]] = {}
+    for doc in db["income_statements"].find({}, {"_id": 0, "symbol": 1, "annualReports": {"$slice": years}}):
+        row = row_of.get(doc.get("symbol"))
+        if row is None:
+            continue
+        reports = doc.get("annualReports") or []
+        base_years[doc["symbol"]] = _latest_year(reports)
+        _fill_reports(values, row, reports, _INCOME_FIELDS, base_years[doc["symbol"]])
+
+    for doc in db["balance_sheets"].find({}, {"_id": 0, "symbol": 1, "annualReports": {"$slice": years}}):
+        row = row_of.get(doc.get("symbol"))
+        if row is None:
+            continue
+        reports = doc.get("annualReports") or []
+        base = base_years.get(doc["symbol"]) or _latest_year(reports)
+        _fill_reports(values, row, reports, _BALANCE_FIELDS, base)
+
+    _derive(values)
+
+    return ScreenerPanel(
+        [d["symbol"] for d in overviews],
+        [d.get("Name") or "" for d in overviews],
+        [d.get("Sector") or "" for d in overviews],
+        [d.get("Industry") or "" for d in overviews],
+        values,
+    )
+
+
+def _derive(values: np.ndarray) -> None:
+    # Todas las métricas derivadas se calculan sobre el panel completo (símbolos × años)
+    m = lambda name: values[:, METRIC_INDEX[name], :]
+
+    def put(name, arr):
+        values[:, METRIC_INDEX[name], :] = arr
+
+    revenue, net = m("revenue"), m("net_income")
+    equity, debt = m("equity"), m("total_debt")
+
+    put("gross_margin", ratio(m("gross_profit"), revenue, 100.0))
+    put("operating_margin", ratio(m("operating_income"), revenue, 100.0))
+    put("net_margin", ratio(net, revenue, 100.0))
+    put("debt_to_equity", ratio(debt, equity, 100.0))
+    put("current_ratio", ratio(m("current_assets"), m("current_liabilities")))
+    put("net_cash", m("cash") - debt)
+    put("roe", ratio(net, equity, 100.0))
+    put("roa", ratio(net, m("total_assets"), 100.0))
+
+    for src, dst in (("revenue", "revenue_growth"), ("net_income", "net_income_growth")):
+        col = m(src)
+        growth = np.full_like(col, np.nan)
+        growth[:, :-1] = growth_pct(col[:, :-1], col[:, 1:])
+        put(dst, growth)
+
+
+# -------- Panel en memoria (SWR) --------
+_panel: Optional[ScreenerPanel] = None
+_panel_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _rebuild():
+    global _panel
+    try:
+        _panel = build_panel()
+    except Exception:
+        record_failure("screener_build")
+    finally:
+        _rebuilding.clear()
+
+
+def get_panel() -> ScreenerPanel:
+    global _panel
+    if _panel is None:
+        with _panel_lock:
+            if _panel is None:
+                _panel = build_panel()
+        return _panel
+
+    if time() - _panel.built_at >= PANEL_TTL and not _rebuilding.is_set():
+        _rebuilding.set()
+        threading.Thread(target=_rebuild, daemon=True).start()
+    return _panel
+
+
+# -------- Screening --------
+def screen(
+    filters: List[Dict[str, Any]],
+    sector: Optional[str] = None,
+    industry: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_year: int = 0,
+    descending: bool = True,
+    offset: int = 0,
+    limit: int = 50,
+    fields: Optional[List[str]] = None,
+    panel: Optional[ScreenerPanel] = None,
+) -> Dict[str, Any]:
+    panel = panel if panel is not None else get_panel()
+    mask = np.ones(len(panel), dtype=bool)
+
+    for f in filters:
+        op = _OPS.get(f.get("op"))
+        if op is None:
+            raise ValueError(f"Operador inválido: {f.get('op')}")
+        col = panel.metric(f["metric"], int(f.get("year", 0)))
+        with np.errstate(invalid="ignore"):
+            mask &= np.isfinite(col) & op(col, float(f["value"]))
+
+    if sector:
+        mask &= panel._sector_key == sector.strip().lower()
+    if industry:
+        mask &= panel._industry_key == industry.strip().lower()
+
+    idx = np.flatnonzero(mask)
+
+    if sort_by:
+        keys = panel.metric(sort_by, sort_year)[idx]
+        # NaN siempre al final, en ambos sentidos
+        order = np.argsort(-keys if descending else keys, kind="stable")
+        idx = idx[order]
+
+    page = idx[offset:offset + limit]
+
+    # Cada métrica se devuelve en el año con que se filtró / ordenó (no siempre el último)
+    used = list(dict.fromkeys(
+        [(f["metric"], int(f.get("year", 0))) for f in filters] + ([(sort_by, sort_year)] if sort_by else [])
+    ))
+    if fields is None:
+        columns = used
+    else:
+        year_of: Dict[str, int] = {}
+        for name, y in used:
+            year_of.setdefault(name, y)
+        default_year = sort_year if sort_by else 0
+        columns = [(name, year_of.get(name, default_year)) for name in dict.fromkeys(fields)]
+    for name, _ in columns:
+        if name not in METRIC_INDEX:
+            raise ValueError(f"Métrica desconocida: {name}")
+    # La llave es el nombre; `nombre@año` solo si la misma métrica aparece en más de un año
+    repeated = {name for name, _ in columns if sum(n == name for n, _ in columns) > 1}
+    keys = [f"{name}@{y}" if name in repeated else name for name, y in columns]
+
+    cols = np.array([METRIC_INDEX[name] for name, _ in columns], dtype=np.intp)
+    years = np.array([y for _, y in columns], dtype=np.intp)
+    block = panel.values[page[:, None], cols[None, :], years[None, :]] if len(cols) else np.empty((len(page), 0))
+
+    results = [
+        {
+            "symbol": panel.symbols[i],
+            "name": panel.names[i],
+            "sector": panel.sectors[i],
+            "industry": panel.industries[i],
+            "metrics": {key: (float(v) if np.isfinite(v) else None) for key, v in zip(keys, row)},
+        }
+        for i, row in zip(page, block)
+    ]
+
+    return {
+        "total": int(len(idx)),
+        "offset": offset,
+        "limit": limit,
+        "universe": len(panel),
+        "built_at": panel.built_at,
+        "fields": [{"key": k, "metric": name, "year": y} for k, (name, y) in zip(keys, columns)],
+        "results": results,
+    }
+
+
+__all__ = ["screen", "get_panel", "build_panel", "METRICS", "ScreenerPanel"]
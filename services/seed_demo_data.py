@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from time import time
 import random
 from .db import db
 
@@ -12,6 +13,7 @@ def seed_symbol(symbol: str = "MSFT"):
     current_year = now.year
 
     overview_doc = {
+        "symbol": symbol,
         "Symbol": symbol,
         "Ticket": symbol,
         "Name": "Microsoft Corporation (DEMO)",
@@ -30,8 +32,9 @@ def seed_symbol(symbol: str = "MSFT"):
         "PERatio": "35.2",
         "DividendYield": "0.008",      # 0.8%
         "MarketCapitalization": _fmt(2_800_000_000_000),
+        "updated_at": now,
     }
-    db["overview"].update_one({"Symbol": symbol}, {"$set": overview_doc}, upsert=True)
+    db["overview"].update_one({"symbol": symbol}, {"$set": overview_doc}, upsert=True)
 
     # --- income_statements ---
     income_reports = []
@@ -47,7 +50,7 @@ def seed_symbol(symbol: str = "MSFT"):
             "grossProfit":   _fmt(base_gross + i * 4_000_000_000),
         })
     db["income_statements"].update_one(
-        {"symbol": symbol}, {"$set": {"annualReports": income_reports}}, upsert=True
+        {"symbol": symbol}, {"$set": {"annualReports": income_reports, "updated_at": now}}, upsert=True
     )
 
     # --- balance_sheets ---
@@ -65,7 +68,7 @@ def seed_symbol(symbol: str = "MSFT"):
             "totalShareholderEquity":                 _fmt(260_000_000_000 + i * 4_000_000_000),
         })
     db["balance_sheets"].update_one(
-        {"symbol": symbol}, {"$set": {"annualReports": balance_reports}}, upsert=True
+        {"symbol": symbol}, {"$set": {"annualReports": balance_reports, "updated_at": now}}, upsert=True
     )
 
     # --- cash_flows ---
@@ -82,7 +85,7 @@ def seed_symbol(symbol: str = "MSFT"):
             "freeCashFlow": _fmt(fcf),
         })
     db["cash_flows"].update_one(
-        {"symbol": symbol}, {"$set": {"annualReports": cash_flows}}, upsert=True
+        {"symbol": symbol}, {"$set": {"annualReports": cash_flows, "updated_at": now}}, upsert=True
     )
 
     # --- precios diarios (60 días) ---
@@ -97,8 +100,8 @@ def seed_symbol(symbol: str = "MSFT"):
     # --- logo ---
     logo_url = "https://logo.clearbit.com/microsoft.com"
     db["companyLogos"].update_one(
-        {"Symbol": symbol},
-        {"$set": {"LogoUrl": logo_url}},
+        {"symbol": symbol},
+        {"$set": {"Symbol": symbol, "LogoUrl": logo_url, "ts": time()}},
         upsert=True,
     )
 
@@ -26,7 +26,7 @@ wait_for_main_api() {
 # --- Start Main Process ---
 
 echo "Starting Uvicorn..."
-exec uvicorn services.main_api:app --host 0.0.0.0 --port 8100 &
+exec uvicorn services.main_api:app --host 0.0.0.0 --port 8100 --workers "${UVICORN_WORKERS:-1}" &
 UVICORN_PID=$!
 
 # Wait until main API responds and model is fully loaded
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_MISSING = {"", "none", "nan", "n/a", "-"}
+
+
+def to_float(value) -> float:
+    # Un solo parseo por campo: "$1,234", "12.5%", None -> float (NaN si falta)
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    s = str(value).replace("$", "").replace(",", "").replace("%", "").strip()
+    if s.lower() in _MISSING:
+        return np.nan
+    try:
+        return float(s)
+    except ValueError:
+        return np.nan
+
+
+def coerce_year_key(y):
+
+    try:
+        return int(str(y)[:4])
+    except Exception:
+        return y
+
+
+class StatementPanel:
+    """Estados financieros de un símbolo: años (desc) × métricas en un arreglo float64, NaN = faltante."""
+
+    __slots__ = ("years", "metrics", "index", "values")
+
+    def __init__(self, years: Iterable[int], metrics: List[str], values: np.ndarray):
+        self.years = np.asarray(list(years), dtype=np.int64)
+        self.metrics = list(metrics)
+        self.index = {m: i for i, m in enumerate(self.metrics)}
+        self.values = values
+
+    @classmethod
+    def empty(cls, metrics: List[str]) -> "StatementPanel":
+        return cls([], metrics, np.empty((0, len(metrics)), dtype=np.float64))
+
+    @classmethod
+    def from_year_dict(cls, by_year: Optional[Dict[Any, dict]], metrics: List[str]) -> "StatementPanel":
+        if not isinstance(by_year, dict) or not by_year:
+            return cls.empty(metrics)
+
+        rows = {}
+        for y, row in by_year.items():
+            year = coerce_year_key(y)
+            if isinstance(year, int) and year not in rows:
+                rows[year] = row if isinstance(row, dict) else {}
+
+        years = sorted(rows, reverse=True)
+        values = np.array(
+            [[to_float(rows[y].get(m)) for m in metrics] for y in years],
+            dtype=np.float64,
+        ).reshape(len(years), len(metrics))
+        return cls(years, metrics, values)
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def __getitem__(self, metric: str) -> np.ndarray:
+        return self.values[:, self.index[metric]]
+
+    def take(self, mask: np.ndarray) -> "StatementPanel":
+        return StatementPanel(self.years[mask], self.metrics, self.values[mask])
+
+    def align(self, years: np.ndarray) -> "StatementPanel":
+        # Reindexa a `years`; los años ausentes quedan en NaN
+        pos = {int(y): i for i, y in enumerate(self.years)}
+        values = np.full((len(years), len(self.metrics)), np.nan)
+        for i, y in enumerate(years):
+            j = pos.get(int(y))
+            if j is not None:
+                values[i] = self.values[j]
+        return StatementPanel(years, self.metrics, values)
+
+
+# -------- Operaciones vectorizadas --------
+def ratio(num: np.ndarray, den: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = num / den * scale
+    out[~np.isfinite(out) | (den == 0)] = np.nan
+    return out
+
+
+def growth_pct(curr: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    return ratio(curr - prev, np.abs(prev), 100.0)
+
+
+def shift_prev(values: np.ndarray) -> np.ndarray:
+    # Con años en orden descendente, el año previo es la fila siguiente
+    out = np.full_like(values, np.nan)
+    if len(values) > 1:
+        out[:-1] = values[1:]
+    return out
+
+
+def to_table(years: np.ndarray, series: Dict[str, np.ndarray], ints: Iterable[str] = ()) -> Dict[str, Any]:
+    # Tabla columnar serializable (JSON/BSON): NaN -> None
+    ints = set(ints)
+
+    def _cell(v, as_int):
+        if not np.isfinite(v):
+            return None
+        return int(v) if as_int else float(v)
+
+    return {
+        "years": [int(y) for y in years],
+        "series": {name: [_cell(v, name in ints) for v in col] for name, col in series.items()},
+    }
+
+
+__all__ = ["StatementPanel", "to_float", "coerce_year_key", "ratio", "growth_pct", "shift_prev", "to_table"]
@@ -1,54 +1,111 @@
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from .db import db
+from .l2_cache import l2_cache
 
 COLLECTION = "user_prefs"
+# Las prefs solo se cachean en el L2 compartido. Cada escritura sube `rev` en Mongo y
+# reescribe el L2 (write-through); el L2 no acepta un `rev` menor al guardado, así un
+# lector que leyó antes de la escritura no puede volver a instalar el documento viejo.
+PREFS_TTL = int(os.getenv("PREFS_TTL", "300"))
 
 
 def _norm(s: str) -> str:
     return (s or "").strip().upper()
 
 
+def default_doc(user: str) -> Dict:
+    return {
+        "user": user,
+        "display_name": "",
+        "watchlist": [],
+        "quick_symbols": ["MSFT", "AAPL", "GOOGL"],
+        "recents": [],
+        "theme": "dark",
+        "rev": 0,
+    }
+
+
 def _ensure_doc(user: str) -> Dict:
     doc = db[COLLECTION].find_one({"user": user})
     if not doc:
-        doc = {
-            "user": user,
-            "display_name": "",
-            "watchlist": [],
-            "quick_symbols": ["MSFT", "AAPL", "GOOGL"],
-            "recents": [],
-            "theme": "dark",
-        }
-        db[COLLECTION].insert_one(doc)
+        doc = default_doc(user)
+        try:
+            db[COLLECTION].insert_one(doc)
+        except DuplicateKeyError:
+            # Índice único en `user`: otro request lo creó primero
+            doc = db[COLLECTION].find_one({"user": user})
     return doc
 
 
+# ---- Cache (L2) ----
+def _prefs_key(user: str) -> str:
+    return f"prefs:{user}"
+
+
+def cached_prefs(user: str) -> Optional[Dict]:
+    if l2_cache is None:
+        return None
+    doc, fresh, _ = l2_cache.get(_prefs_key(user))
+    return doc if fresh else None
+
+
+def cache_prefs(user: str, doc: Dict) -> None:
+    if l2_cache is not None:
+        l2_cache.set(_prefs_key(user), doc, PREFS_TTL, version=int(doc.get("rev") or 0))
+
+
+def invalidate_prefs(user: str) -> None:
+    if l2_cache is not None:
+        l2_cache.delete(_prefs_key(user))
+
+
+def _read_doc(user: str) -> Dict:
+    doc = cached_prefs(user)
+    if doc is None:
+        doc = _ensure_doc(user)
+        cache_prefs(user, doc)
+    return doc
+
+
+def _update(user: str, update: Dict, upsert: bool = False) -> None:
+    doc = db[COLLECTION].find_one_and_update(
+        {"user": user}, {**update, "$inc": {"rev": 1}}, upsert=upsert, return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        invalidate_prefs(user)
+    else:
+        cache_prefs(user, doc)
+
+
 def get_prefs(user: str) -> Dict:
-    return _ensure_doc(user)
+    return _read_doc(user)
 
 
 # ---- Display name ----
 def get_display_name(user: str) -> str:
-    return _ensure_doc(user).get("display_name", "") or ""
+    return _read_doc(user).get("display_name", "") or ""
 
 
 def set_display_name(name: str, user: str):
-    db[COLLECTION].update_one({"user": user}, {"$set": {"display_name": name}})
+    _update(user, {"$set": {"display_name": name}})
 
 
 # ---- Theme ----
 def get_theme(user: str) -> str:
-    return _ensure_doc(user).get("theme", "dark")
+    return _read_doc(user).get("theme", "dark")
 
 
 def set_theme(theme: str, user: str):
     theme = "light" if (theme or "").lower().startswith("l") else "dark"
-    db[COLLECTION].update_one({"user": user}, {"$set": {"theme": theme}})
+    _update(user, {"$set": {"theme": theme}})
 
 
 # ---- Watchlist ----
 def get_watchlist(user: str) -> List[str]:
-    wl = _ensure_doc(user).get("watchlist", [])
+    wl = _read_doc(user).get("watchlist", [])
     return sorted(list({_norm(s) for s in wl}))
 
 
@@ -56,38 +113,38 @@ def add_to_watchlist(symbol: str, user: str):
     sym = _norm(symbol)
     if not sym:
         return get_watchlist(user)
-    db[COLLECTION].update_one({"user": user}, {"$addToSet": {"watchlist": sym}}, upsert=True)
+    _update(user, {"$addToSet": {"watchlist": sym}}, upsert=True)
     return get_watchlist(user)
 
 
 def remove_from_watchlist(symbol: str, user: str):
     sym = _norm(symbol)
-    db[COLLECTION].update_one({"user": user}, {"$pull": {"watchlist": sym}}, upsert=True)
+    _update(user, {"$pull": {"watchlist": sym}}, upsert=True)
     return get_watchlist(user)
 
 
 # ---- Quick symbols  ----
 def get_quick_symbols(user: str) -> List[str]:
-    return [_norm(s) for s in _ensure_doc(user).get("quick_symbols", [])]
+    return [_norm(s) for s in _read_doc(user).get("quick_symbols", [])]
 
 
 def add_quick_symbol(symbol: str, user: str):
     sym = _norm(symbol)
     if not sym:
         return get_quick_symbols(user)
-    db[COLLECTION].update_one({"user": user}, {"$addToSet": {"quick_symbols": sym}}, upsert=True)
+    _update(user, {"$addToSet": {"quick_symbols": sym}}, upsert=True)
     return get_quick_symbols(user)
 
 
 def remove_quick_symbol(symbol: str, user: str):
     sym = _norm(symbol)
-    db[COLLECTION].update_one({"user": user}, {"$pull": {"quick_symbols": sym}}, upsert=True)
+    _update(user, {"$pull": {"quick_symbols": sym}}, upsert=True)
     return get_quick_symbols(user)
 
 
 # ---- Recientes ----
 def get_recents(user: str) -> List[str]:
-    return [_norm(s) for s in _ensure_doc(user).get("recents", [])]
+    return [_norm(s) for s in _read_doc(user).get("recents", [])]
 
 
 def touch_recent(symbol: str, user: str, max_len: int = 8):
@@ -96,11 +153,11 @@ def touch_recent(symbol: str, user: str, max_len: int = 8):
     arr = [s for s in doc.get("recents", []) if _norm(s) != sym]
     arr.insert(0, sym)
     arr = arr[:max_len]
-    db[COLLECTION].update_one({"user": user}, {"$set": {"recents": arr}}, upsert=True)
+    _update(user, {"$set": {"recents": arr}}, upsert=True)
 
 
 def remove_recent(symbol: str, user: str):
     sym = _norm(symbol)
     doc = _ensure_doc(user)
     arr = [s for s in doc.get("recents", []) if _norm(s) != sym]
-    db[COLLECTION].update_one({"user": user}, {"$set": {"recents": arr}}, upsert=True)
\ No newline at end of file
+    _update(user, {"$set": {"recents": arr}}, upsert=True)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import threading
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import requests
+
+# Cliente HTTP de las vistas: conexión keep-alive + validadores ETag por URL.
+# Si el controller responde 304 se reutiliza el cuerpo guardado.
+
+
+class ApiClient:
+    def __init__(self, base_url: str, timeout: float = 30.0, max_entries: int = 256):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._session = requests.Session()
+        self._validators: Dict[Tuple[str, tuple], Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path: str, params: Optional[dict]) -> Tuple[str, tuple]:
+        return path, tuple(sorted((params or {}).items()))
+
+    def get_json(self, path: str, params: Optional[dict] = None) -> Tuple[int, Any]:
+        status, data, _ = self.fetch(path, params)
+        return status, data
+
+    def fetch(self, path: str, params: Optional[dict] = None) -> Tuple[int, Any, Mapping[str, str]]:
+        # Igual que get_json, más los headers de la respuesta (200 o 304)
+        key = self._key(path, params)
+        with self._lock:
+            cached = self._validators.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+
+        resp = self._session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304 and cached:
+            return 200, cached[1], resp.headers
+        if resp.status_code != 200:
+            return resp.status_code, None, resp.headers
+
+        data = resp.json()
+        etag = resp.headers.get("ETag")
+        if etag:
+            with self._lock:
+                if len(self._validators) >= self.max_entries and key not in self._validators:
+                    self._validators.pop(next(iter(self._validators)))
+                self._validators[key] = (etag, data)
+        return 200, data, resp.headers
+
+    def session(self) -> requests.Session:
+        return self._session
+
+
+api = ApiClient("http://controller:8100")
+
+__all__ = ["api", "ApiClient"]
@@ -11,6 +11,8 @@ import asyncio
 import flet as ft
 
 from .theme import apply_theme, Card, SectionTitle, Chip, KpiCard
+from .api_client import api
+from services.presentation import present_dashboard
 
 APP_USER = os.getenv("APP_USER", "default")
 queries = "http://controller:8100"
@@ -140,15 +142,20 @@ def _transpose_year_dict_to_table(year_dict: dict | None) -> dict:
 
     return {"columns": columns, "rows": rows}
 
-def _extract_latest_margins(margins_by_year: dict | None) -> dict:
-    if not isinstance(margins_by_year, dict) or not margins_by_year:
+def _extract_latest_margins(margins_table: dict | None) -> dict:
+    # margins en formato raw; years viene ordenado del más reciente al más antiguo
+    if not isinstance(margins_table, dict) or not margins_table.get("years"):
         return {}
-    years = sorted(list(margins_by_year.keys()), reverse=True)
-    latest = margins_by_year[years[0]] or {}
+    series = margins_table.get("series") or {}
+
+    def latest(name):
+        col = series.get(name) or []
+        return col[0] if col else None
+
     return {
-        "gross": _to_float(latest.get("Gross Margin (%)")),
-        "oper":  _to_float(latest.get("Operating Margin (%)")),
-        "net":   _to_float(latest.get("Net Margin (%)")),
+        "gross": latest("Gross Margin (%)"),
+        "oper":  latest("Operating Margin (%)"),
+        "net":   latest("Net Margin (%)"),
     }
 
 # ----------------- Logo -----------------
@@ -203,17 +210,6 @@ def _make_logo_square(overview: dict, sym: str, size: int = 64) -> ft.Control:
         ),
     )
 
-def _num_money(v):
-    if v is None:
-        return None
-    s = str(v).replace("$", "").replace(",", "").strip()
-    if s == "":
-        return None
-    try:
-        return float(s)
-    except Exception:
-        return None
-
 def _pane_height(page: ft.Page) -> int:
     try:
         h = int(page.height or 0)
@@ -223,22 +219,25 @@ def _pane_height(page: ft.Page) -> int:
 
 
 
-def _build_charts_panel(income_by_year: dict | None, page: ft.Page) -> ft.Control:
+def _build_charts_panel(income_table: dict | None, page: ft.Page) -> ft.Control:
     
-    #Charts
+    #Charts (income en formato raw: {"years": [...], "series": {...}})
     # - Revenue (billions)
     #- Net Income (billions)
-    if not isinstance(income_by_year, dict) or not income_by_year:
+    if not isinstance(income_table, dict) or not income_table.get("years"):
         return Card(SectionTitle("Charts"), ft.Text("No data available for charting."))
 
-    years = sorted(income_by_year.keys())
+    series = income_table.get("series") or {}
+    points = sorted(zip(
+        income_table["years"],
+        series.get("Annual Revenue") or [None] * len(income_table["years"]),
+        series.get("Net Income") or [None] * len(income_table["years"]),
+    ))
+    years = [y for y, _, _ in points]
     rev_vals, net_vals = [], []
     rev_pts, net_pts = [], []
 
-    for y in years:
-        row = income_by_year.get(y, {}) or {}
-        rv = _num_money(row.get("Annual Revenue"))
-        nv = _num_money(row.get("Net Income"))
+    for y, rv, nv in points:
         if rv is not None:
             rv_b = rv / 1e9
             rev_vals.append(rv_b)
@@ -461,7 +460,7 @@ def _overview_header(ov: dict, symbol: str, page: ft.Page):
     return header
 
 
-def _kpis(overview: dict, margins_by_year: dict):
+def _kpis(overview: dict, margins_table: dict):
     cards = []
     mc  = _to_float(overview.get("MarketCapitalization"))
     eps = _to_float(overview.get("EPS"))
@@ -474,7 +473,7 @@ def _kpis(overview: dict, margins_by_year: dict):
             ft.Container(KpiCard("PE Ratio", "—" if pe is None else f"{pe:.2f}"), expand=True),
             ft.Container(KpiCard("Dividend Yield", "—" if dy is None else _fmt_pct(dy*100)), expand=True),
         ]
-    latest = _extract_latest_margins(margins_by_year)
+    latest = _extract_latest_margins(margins_table)
     if latest:
         cards += [
             ft.Container(KpiCard("Gross Margin", _fmt_pct(latest.get("gross"))), expand=True),
@@ -541,13 +540,14 @@ def _analysis_block(symbol: str, page: ft.Page):
     body = ft.Text("Cargando análisis (RAG)...", selectable=True)
     btn = ft.ElevatedButton("Generate analysis", icon=ft.Icons.PLAY_CIRCLE)
 
-    async def fetch_rag_and_update():
+    async def fetch_rag_and_update(refresh: bool = False):
         nonlocal body, btn
         try:
             
             async with httpx.AsyncClient(timeout=60.0) as client:
-                
-                resp = await client.get(f"{queries_RAG}/company_rag", params={"ticker": sym})
+                # Sin refresh el RAG devuelve el summary guardado si el documento no cambió
+                params = {"ticker": sym, "refresh": "true"} if refresh else {"ticker": sym}
+                resp = await client.get(f"{queries_RAG}/company_rag", params=params)
                 
                 resp.raise_for_status()
                 data = resp.json()
@@ -570,7 +570,7 @@ def _analysis_block(symbol: str, page: ft.Page):
         btn.text = "Generating..."
         page.update()
         
-        page.run_task(fetch_rag_and_update)
+        page.run_task(fetch_rag_and_update, True)
 
     btn.on_click = on_click_generate
 
@@ -640,6 +640,7 @@ def _analysis_and_charts_tabs(
     margins_by_year: dict | None,
     balance: dict | None,
     ratios_by_year: dict | None,
+    income_raw: dict | None = None,
 ) -> ft.Control:
 
     fundamentals_panel = _fundamentals_tabs(
@@ -654,7 +655,7 @@ def _analysis_and_charts_tabs(
     charts_panel = ft.Container(
         padding=10,
         bgcolor=page.bgcolor,
-        content=_build_charts_panel(income, page),
+        content=_build_charts_panel(income_raw, page),
         expand=True
     )
 
@@ -709,8 +710,10 @@ def build_dashboard_view(symbol: str, page: ft.Page) -> ft.View:
     apply_theme(page)
 
     try:
-        resp = requests.get(f"{queries}/api/dashboard/{symbol}")
-        data = resp.json() if resp.status_code == 200 else {}
+        # Con ETag: repetir la visita cuesta un 304 sin cuerpo
+        status, raw = api.get_json(f"/api/dashboard/{symbol}", params={"format": "raw"})
+        raw = raw if status == 200 and raw else {}
+        data = present_dashboard(raw) if raw else {}
     except Exception as e:
         controls = [
             _toolbar(symbol, page),
@@ -744,7 +747,7 @@ def build_dashboard_view(symbol: str, page: ft.Page) -> ft.View:
         ))
     else:
         if (ov := _overview_header(overview, symbol, page)): controls.append(ov)
-        if (k := _kpis(overview or {}, margins_by_year or {})): controls.append(k)
+        if (k := _kpis(overview or {}, raw.get("margins") or {})): controls.append(k)
 
         # ---------- Header tabs (FA | Charts) ----------
         if have_any_table:
@@ -756,6 +759,7 @@ def build_dashboard_view(symbol: str, page: ft.Page) -> ft.View:
                     margins_by_year=margins_by_year,
                     balance=balance,
                     ratios_by_year=ratios_by_year,
+                    income_raw=raw.get("income"),
                 )
             )
 
@@ -5,6 +5,7 @@ import requests
 
 from .dashboard_view import build_dashboard_view
 from .theme import apply_theme, Card, SectionTitle, KpiCard
+from .api_client import api
 
 APP_NAME = "Finalytics"
 APP_USER = os.getenv("APP_USER", "default")
@@ -15,7 +16,7 @@ def main(page: ft.Page):
 
     queries = "http://controller:8100"
 
-    prefs = requests.get(f"{queries}/user/{APP_USER}/prefs")
+    _, prefs = api.get_json(f"/user/{APP_USER}/prefs")
     theme = requests.get(f"{queries}/user/{APP_USER}/theme").text
     USER = requests.get(f"{queries}/user/{APP_USER}/display-name").json()
 
@@ -209,6 +210,15 @@ def main(page: ft.Page):
 
         kpi_container = ft.Container()
 
+        # KPIs de watchlist + recientes en una sola llamada (se vuelve a pedir en cada render_home,
+        # p.ej. al quitar un reciente o volver del dashboard); el resto se pide por símbolo
+        try:
+            _, batch = api.get_json(f"/user/{APP_USER}/shortcuts/batch")
+            kpi_batch = (batch or {}).get("shortcuts", {})
+            kpi_fresh = (batch or {}).get("fresh", {})
+        except Exception:
+            kpi_batch, kpi_fresh = {}, {}
+
         def draw_kpis(data: dict):
             items = []
 
@@ -239,12 +249,16 @@ def main(page: ft.Page):
             )
             page.update()
 
-            try:
+            def _fetch():
+                # Cuerpo = KPIs; X-Cache-Fresh: 0 si el controller sirvió stale y está revalidando
+                _, payload, headers = api.fetch(f"/user/{sym}/shortcuts")
+                return payload, headers.get("X-Cache-Fresh", "1") != "0"
 
-                response = requests.get(f"{queries}/user/{sym}/shortcuts")
-                data = response.json()
-                if isinstance(data, list) and data and isinstance(data[0], dict):
-                    data = data[0] 
+            try:
+                if sym in kpi_batch:
+                    data, fresh = kpi_batch[sym], kpi_fresh.get(sym, True)
+                else:
+                    data, fresh = _fetch()
                 draw_kpis(data)
                 page.update()
             except Exception as ex:
@@ -256,14 +270,17 @@ def main(page: ft.Page):
                 page.update()
                 return
 
+            if fresh:
+                return
+
+            # Se sirvió stale: un segundo GET condicional recoge la revalidación (304 si no cambió)
             async def _refresh():
                 try:
-
-                    response2 = requests.get(f"{queries}/user/{sym}/shortcuts")
-                    data2 = response2.json()
-                    if isinstance(data, list) and data and isinstance(data[0], dict):
-                        data2 = data2[0]
-                    if data2 and data2 != data:
+                    await asyncio.sleep(1.0)
+                    data2, fresh2 = await asyncio.to_thread(_fetch)
+                    if data2 and sym in kpi_batch:
+                        kpi_batch[sym], kpi_fresh[sym] = data2, fresh2
+                    if data2 and data2 != data and dd.value == sym:
                         draw_kpis(data2)
                         page.update()
                 except Exception: